@@ -1,3 +1,29 @@
-from . import prompt_lint
+import importlib
 
-__all__ = ["prompt_lint"]
+from ._version import __version__
+
+# Loaded on first use, so that each command imports only what it needs; the
+# lint client in particular must start without importing the linter
+_SUBMODULES = frozenset(
+    {
+        "bench",
+        "instrument",
+        "json_stream",
+        "lint_cache",
+        "lint_client",
+        "lint_daemon",
+        "lsp",
+        "paren_batch",
+        "payload",
+        "prompt_lint",
+        "watch",
+    }
+)
+
+__all__ = ["__version__", *sorted(_SUBMODULES)]
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,17 @@
+"""
+_version.py
+
+The nc-prompt-tools version.
+
+It is kept here as a constant, rather than read from the installed
+package's metadata, because importing `importlib.metadata` costs more than
+a whole lint and the lint client checks the version on every run.
+"""
+
+# Must match the version in pyproject.toml
+__version__ = "0.1.0"
+
+
+def tool_version() -> str:
+    """Return the nc-prompt-tools version."""
+    return __version__
@@ -0,0 +1,22 @@
+"""
+Benchmarks for the prompt lint engines.
+
+`corpus` generates seeded synthetic prompt bundles, `suites` times the lint
+functions over them, `scaling` checks that the lint phases grow linearly
+with their input, and `cli` provides the ``prompt_lint-bench`` command.
+
+Submodules are imported on first use, so that running ``python -m
+nc_prompt_tools.bench.cli`` does not import `cli` twice.
+"""
+
+import importlib
+
+_SUBMODULES = frozenset({"cli", "corpus", "scaling", "suites"})
+
+__all__ = sorted(_SUBMODULES)
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,428 @@
+"""
+cli.py
+
+The ``prompt_lint-bench`` command.
+
+``prompt_lint-bench run`` generates a seeded corpus, times the benchmark
+suite over it, prints a summary and optionally saves the results as JSON.
+
+``prompt_lint-bench compare BASELINE`` re-runs the suite on the baseline's
+corpus and exits with status 1 if any benchmark in the baseline has
+regressed by more than a threshold.
+
+``prompt_lint-bench scaling`` times each lint phase on inputs that grow
+geometrically and exits with status 1 if any grows faster than linearly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import typing
+from pathlib import Path
+
+from .corpus import PROFILES, CorpusSpec
+from .scaling import (
+    DEFAULT_MAX_SLOPE,
+    PHASES,
+    SHAPES,
+    ScalingResult,
+    geometric_sizes,
+    measure_scaling,
+    parse_size,
+)
+from .suites import (
+    BENCHMARK_NAMES,
+    BenchmarkResult,
+    BenchmarkRun,
+    Comparison,
+    compare_runs,
+    run_suite,
+)
+
+
+def _positive(value: str) -> int:
+    if (number := int(value)) < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return number
+
+
+def _growth_factor(value: str) -> int:
+    if (number := int(value)) < 2:
+        raise argparse.ArgumentTypeError(f"must be at least 2: {value}")
+    return number
+
+
+def _non_negative(value: str) -> int:
+    if (number := int(value)) < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+
+def add_corpus_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options that describe a `CorpusSpec`."""
+    defaults = CorpusSpec()
+    group = parser.add_argument_group("corpus")
+    group.add_argument(
+        "--seed",
+        type=int,
+        default=defaults.seed,
+        help="Seed for the corpus generator (default: %(default)s).",
+    )
+    group.add_argument(
+        "--bundles",
+        type=_positive,
+        default=defaults.bundles,
+        metavar="N",
+        help="Number of prompt bundles (default: %(default)s).",
+    )
+    group.add_argument(
+        "--dependencies",
+        type=_non_negative,
+        default=defaults.dependencies,
+        metavar="N",
+        help="Dependencies per bundle (default: %(default)s).",
+    )
+    group.add_argument(
+        "--messages",
+        type=_positive,
+        default=defaults.messages,
+        metavar="N",
+        help="Messages per prompt (default: %(default)s).",
+    )
+    group.add_argument(
+        "--profile",
+        dest="profiles",
+        action="append",
+        choices=list(PROFILES),
+        help="Message profile to generate; may be repeated (default: all).",
+    )
+
+
+def spec_from_args(args: argparse.Namespace) -> CorpusSpec:
+    """Build the `CorpusSpec` described by parsed arguments."""
+    return CorpusSpec(
+        seed=args.seed,
+        bundles=args.bundles,
+        dependencies=args.dependencies,
+        messages=args.messages,
+        profiles=tuple(args.profiles or PROFILES),
+    )
+
+
+def format_result(result: BenchmarkResult) -> str:
+    """Format one result as a row of the summary table."""
+    return (
+        f"{result.name:<28}{result.median * 1e3:>11.2f}{result.best * 1e3:>11.2f}"
+        f"{result.throughput:>10.1f}{result.items:>9}"
+    )
+
+
+_HEADER = f"{'benchmark':<28}{'median ms':>11}{'best ms':>11}{'MB/s':>10}{'items':>9}"
+
+
+def _confidence(value: str) -> float:
+    if not 0 < (number := float(value)) < 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1: {value}")
+    return number
+
+
+def run_main(args: argparse.Namespace) -> int:
+    """Run ``prompt_lint-bench run``."""
+    spec = spec_from_args(args)
+    print(_HEADER)
+    run = run_suite(
+        spec,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        only=args.only,
+        progress=lambda result: print(format_result(result), flush=True),
+    )
+    if args.output is not None:
+        run.save(args.output)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+def format_comparison(
+    comparison: Comparison, threshold: float, confidence: float
+) -> str:
+    """Format one comparison as a row of the comparison table."""
+    low, high = comparison.current.confidence_interval(confidence)
+    if comparison.regressed(threshold, confidence):
+        verdict = "REGRESSED"
+    elif comparison.change > threshold:
+        verdict = "slower (within noise)"
+    elif comparison.change < -threshold:
+        verdict = "faster"
+    else:
+        verdict = "ok"
+    return (
+        f"{comparison.name:<28}{comparison.baseline.median * 1e3:>11.2f}"
+        f"{comparison.current.median * 1e3:>11.2f}"
+        f"{f'{low * 1e3:.2f}-{high * 1e3:.2f}':>17}"
+        f"{comparison.change:>+9.1%}  {verdict}"
+    )
+
+
+_COMPARISON_HEADER = (
+    f"{'benchmark':<28}{'base ms':>11}{'now ms':>11}{'now CI ms':>17}{'change':>9}"
+)
+
+# Metadata that should match for timings to be comparable.
+_COMPARABLE_METADATA = (
+    "tool_version",
+    "python",
+    "implementation",
+    "machine",
+    "numpy",
+)
+
+
+def compare_main(args: argparse.Namespace) -> int:
+    """Run ``prompt_lint-bench compare``."""
+    try:
+        baseline = BenchmarkRun.load(args.baseline)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Cannot load baseline {args.baseline}: {e}")
+        return 2
+
+    tracked = [result.name for result in baseline.results]
+    if args.only:
+        tracked = [name for name in tracked if name in args.only]
+    if not tracked:
+        print("The baseline has none of the requested benchmarks")
+        return 2
+
+    run = run_suite(baseline.corpus, args.repeat, args.warmup, tracked)
+    for key in _COMPARABLE_METADATA:
+        if (before := baseline.metadata.get(key)) != (now := run.metadata.get(key)):
+            print(f"Note: {key} differs from the baseline ({before} -> {now})")
+    if args.output is not None:
+        run.save(args.output)
+
+    threshold = args.threshold / 100
+    comparisons = compare_runs(baseline, run)
+    print(_COMPARISON_HEADER)
+    for comparison in comparisons:
+        print(format_comparison(comparison, threshold, args.confidence))
+
+    regressed = [
+        comparison.name
+        for comparison in comparisons
+        if comparison.regressed(threshold, args.confidence)
+    ]
+    if regressed:
+        print(
+            f"{len(regressed)} of {len(comparisons)} benchmarks regressed by more "
+            f"than {args.threshold:g}%: {', '.join(regressed)}"
+        )
+        return 1
+    print(f"No benchmark regressed by more than {args.threshold:g}%")
+    return 0
+
+
+def _size(value: str) -> int:
+    try:
+        size = parse_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    if size < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive size: {value}")
+    return size
+
+
+def format_scaling(result: ScalingResult, max_slope: float) -> str:
+    """Format one scaling result as a row of the scaling table."""
+    verdict = "SUPER-LINEAR" if result.slope > max_slope else "ok"
+    per_kib = result.times[-1] / result.sizes[-1] * 1024 * 1e6
+    return (
+        f"{result.phase:<32}{result.shape:<9}{result.times[0] * 1e3:>11.3f}"
+        f"{result.times[-1] * 1e3:>11.1f}{per_kib:>9.1f}{result.slope:>7.2f}"
+        f"  {verdict}"
+    )
+
+
+_SCALING_HEADER = (
+    f"{'phase':<32}{'shape':<9}{'first ms':>11}{'last ms':>11}"
+    f"{'us/KiB':>9}{'slope':>7}"
+)
+
+
+def scaling_main(args: argparse.Namespace) -> int:
+    """Run ``prompt_lint-bench scaling``."""
+    sizes = geometric_sizes(args.min_size, args.max_size, args.factor)
+    if len(sizes) < 2:
+        print("At least two sizes are needed; increase --max-size")
+        return 2
+    print(f"Sizes from {sizes[0]} to {sizes[-1]} characters")
+    print(_SCALING_HEADER)
+    steep = []
+    for phase in args.phases or PHASES:
+        for shape in args.shapes or SHAPES:
+            result = measure_scaling(phase, shape, sizes, args.repeat)
+            print(format_scaling(result, args.max_slope), flush=True)
+            if result.slope > args.max_slope:
+                steep.append(f"{phase} ({shape})")
+    if steep:
+        print(
+            f"{len(steep)} phases grew faster than size^{args.max_slope:g}: "
+            f"{', '.join(steep)}"
+        )
+        return 1
+    print(f"Every phase grew no faster than size^{args.max_slope:g}")
+    return 0
+
+
+def add_timing_arguments(
+    parser: argparse.ArgumentParser, repeat: int, warmup: int
+) -> None:
+    """Add the options that control how benchmarks are timed."""
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=_positive,
+        default=repeat,
+        metavar="N",
+        help="Timed rounds per benchmark (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=_non_negative,
+        default=warmup,
+        metavar="N",
+        help="Untimed rounds before the timed ones (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=BENCHMARK_NAMES,
+        metavar="NAME",
+        help=(
+            "Run only this benchmark; may be repeated. One of: "
+            f"{', '.join(BENCHMARK_NAMES)}."
+        ),
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        metavar="FILE",
+        help="Save the results as JSON.",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the argument parser for ``prompt_lint-bench``."""
+    parser = argparse.ArgumentParser(
+        prog="prompt_lint-bench",
+        description="Benchmark the prompt lint engines on a synthetic corpus.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser(
+        "run", help="Time the benchmark suite and optionally save the results."
+    )
+    add_corpus_arguments(run)
+    add_timing_arguments(run, repeat=5, warmup=1)
+    run.set_defaults(handler=run_main)
+
+    compare = commands.add_parser(
+        "compare",
+        help="Re-run the suite and fail if it is slower than a baseline.",
+        description=(
+            "Re-run the benchmarks in BASELINE on the same corpus and exit "
+            "with status 1 if the confidence interval of any median is "
+            "entirely slower than the baseline median by more than the "
+            "threshold."
+        ),
+    )
+    compare.add_argument(
+        "baseline", type=Path, help="Results saved by 'prompt_lint-bench run'."
+    )
+    add_timing_arguments(compare, repeat=15, warmup=2)
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        metavar="PERCENT",
+        help="Largest tolerated slowdown of a median (default: %(default)s).",
+    )
+    compare.add_argument(
+        "--confidence",
+        type=_confidence,
+        default=0.95,
+        help="Confidence level of the medians' intervals (default: %(default)s).",
+    )
+    compare.set_defaults(handler=compare_main)
+
+    scaling = commands.add_parser(
+        "scaling",
+        help="Fail if a lint phase grows faster than linearly with its input.",
+        description=(
+            "Time each lint phase on inputs that grow geometrically, fit the "
+            "growth on log-log axes, and exit with status 1 if any slope is "
+            "steeper than --max-slope (1 is linear, 2 quadratic)."
+        ),
+    )
+    scaling.add_argument(
+        "--min-size",
+        type=_size,
+        default="1K",
+        metavar="SIZE",
+        help="Smallest input, such as 512, 4K or 2M (default: 1K).",
+    )
+    scaling.add_argument(
+        "--max-size",
+        type=_size,
+        default="64M",
+        metavar="SIZE",
+        help="Largest input (default: 64M).",
+    )
+    scaling.add_argument(
+        "--factor",
+        type=_growth_factor,
+        default=4,
+        help="Growth factor between sizes (default: %(default)s).",
+    )
+    scaling.add_argument(
+        "--phase",
+        dest="phases",
+        action="append",
+        choices=list(PHASES),
+        metavar="NAME",
+        help=f"Phase to time; may be repeated. One of: {', '.join(PHASES)}.",
+    )
+    scaling.add_argument(
+        "--shape",
+        dest="shapes",
+        action="append",
+        choices=list(SHAPES),
+        help="Input shape to generate; may be repeated (default: all).",
+    )
+    scaling.add_argument(
+        "-r",
+        "--repeat",
+        type=_positive,
+        default=3,
+        metavar="N",
+        help="Measurements per size; the fastest is kept (default: %(default)s).",
+    )
+    scaling.add_argument(
+        "--max-slope",
+        type=float,
+        default=DEFAULT_MAX_SLOPE,
+        help="Steepest accepted log-log slope (default: %(default)s).",
+    )
+    scaling.set_defaults(handler=scaling_main)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> typing.NoReturn:
+    """Entry point for ``prompt_lint-bench``."""
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    exit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
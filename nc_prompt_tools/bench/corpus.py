@@ -0,0 +1,256 @@
+"""
+corpus.py
+
+A seeded generator of synthetic Novelcrafter prompt bundles.
+
+The generated prompts imitate the shapes that stress the linter: long
+stretches of prose, messages dense with ``{...}`` expressions and nested
+function calls, deeply nested ``{#if}`` blocks, and bundles with long
+dependency lists. The same seed always produces the same corpus, so that
+benchmark runs on different machines and revisions time identical input.
+
+A small share of expressions can be given a missing ``)`` so that the
+fixer has work to do; the braces and control flow are always valid.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import random
+import typing
+from pathlib import Path
+
+_WORDS = (
+    "the a she he they it was had said looked towards across window light "
+    "storm quiet voice again never before after ship city river night door "
+    "letter memory shadow captain archive garden silver tide promise road "
+    "slowly carefully against between through under over answer question"
+).split()
+
+_VARIABLES = (
+    "pov",
+    "scene.summary",
+    "scene.fullText",
+    "chapter.title",
+    "codex.context",
+    "storySoFar",
+    "genre",
+    "tense",
+    "instructions",
+    "words",
+)
+
+_FUNCTIONS = (
+    "textBefore",
+    "textAfter",
+    "isEmpty",
+    "isNotEmpty",
+    "lower",
+    "upper",
+    "input",
+    "wordsBefore",
+    "ifNotEmpty",
+    "join",
+)
+
+_ROLES = ("system", "user", "assistant")
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class MessageProfile:
+    """
+    The shape of one kind of generated message.
+
+    Attributes
+    ----------
+    name : str
+        The profile's name, as used on the command line.
+    paragraphs : int
+        Paragraphs of prose per message.
+    words : int
+        Words per paragraph.
+    expressions : int
+        Braced expressions per paragraph.
+    call_depth : int
+        Maximum nesting of function calls inside an expression.
+    if_depth : int
+        Maximum nesting of {#if} blocks; each paragraph may be wrapped in
+        up to this many.
+    """
+
+    name: str
+    paragraphs: int
+    words: int
+    expressions: int
+    call_depth: int
+    if_depth: int
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        MessageProfile(
+            "prose", paragraphs=12, words=120, expressions=1, call_depth=1, if_depth=1
+        ),
+        MessageProfile(
+            "dense", paragraphs=6, words=20, expressions=25, call_depth=4, if_depth=1
+        ),
+        MessageProfile(
+            "nested", paragraphs=10, words=30, expressions=3, call_depth=2, if_depth=12
+        ),
+        MessageProfile(
+            "mixed", paragraphs=8, words=60, expressions=6, call_depth=3, if_depth=4
+        ),
+    )
+}
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class CorpusSpec:
+    """
+    The parameters of a generated corpus.
+
+    Attributes
+    ----------
+    seed : int
+        Seed for the random generator.
+    bundles : int
+        Number of prompt bundles.
+    dependencies : int
+        Dependency prompts in each bundle, after the prompt itself.
+    messages : int
+        Messages per prompt.
+    profiles : tuple of str
+        Names of the `PROFILES` that messages cycle through.
+    broken : float
+        Share of expressions generated with a missing ')'.
+    """
+
+    seed: int = 0
+    bundles: int = 4
+    dependencies: int = 8
+    messages: int = 6
+    profiles: tuple[str, ...] = tuple(PROFILES)
+    broken: float = 0.02
+
+
+class _Generator:
+    def __init__(self, spec: CorpusSpec) -> None:
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+
+    def words(self, count: int) -> str:
+        return " ".join(self.rng.choices(_WORDS, k=count))
+
+    def call(self, depth: int) -> str:
+        rng = self.rng
+        if depth <= 0 or rng.random() < 0.3:
+            return rng.choice(_VARIABLES)
+        arguments = [self.call(depth - 1) for _ in range(rng.randint(1, 2))]
+        if rng.random() < 0.3:
+            arguments.append(f'"{self.words(rng.randint(1, 4))}"')
+        return f"{rng.choice(_FUNCTIONS)}({', '.join(arguments)})"
+
+    def expression(self, profile: MessageProfile) -> str:
+        body = self.call(profile.call_depth)
+        if body.endswith(")") and self.rng.random() < self.spec.broken:
+            body = body[:-1]
+        return f"{{{body}}}"
+
+    def paragraph(self, profile: MessageProfile) -> str:
+        rng = self.rng
+        pieces = self.words(profile.words).split(" ")
+        for _ in range(profile.expressions):
+            pieces.insert(rng.randrange(len(pieces) + 1), self.expression(profile))
+        text = " ".join(pieces)
+
+        depth = rng.randint(0, profile.if_depth)
+        for level in range(depth, 0, -1):
+            indent = "  " * (level - 1)
+            condition = self.call(min(profile.call_depth, 2))
+            if rng.random() < 0.3:
+                alternative = f"\n{indent}{{#else}}\n{indent}  {self.words(8)}"
+            else:
+                alternative = ""
+            text = (
+                f"{indent}{{#if {condition}}}\n{indent}  {text}{alternative}"
+                f"\n{indent}{{#endif}}"
+            )
+        return text
+
+    def message(self, profile: MessageProfile) -> dict[str, str]:
+        paragraphs = [self.paragraph(profile) for _ in range(profile.paragraphs)]
+        return {"role": self.rng.choice(_ROLES), "text": "\n\n".join(paragraphs)}
+
+    def prompt(self, name: str) -> dict[str, typing.Any]:
+        profiles = [PROFILES[profile] for profile in self.spec.profiles]
+        return {
+            "name": name,
+            "messages": [
+                self.message(profiles[i % len(profiles)])
+                for i in range(self.spec.messages)
+            ],
+        }
+
+
+def generate_corpus(spec: CorpusSpec) -> list[list[dict[str, typing.Any]]]:
+    """
+    Generate the prompt bundles described by ``spec``.
+
+    Parameters
+    ----------
+    spec : CorpusSpec
+        The corpus parameters.
+
+    Returns
+    -------
+    list of list of dict
+        Each bundle as Novelcrafter exports it: the prompt followed by its
+        dependencies, each of the form ``{"name": ..., "messages": [...]}``.
+    """
+    generator = _Generator(spec)
+    return [
+        [
+            generator.prompt(f"prompt-{bundle}" if i == 0 else f"dep-{bundle}-{i}")
+            for i in range(spec.dependencies + 1)
+        ]
+        for bundle in range(spec.bundles)
+    ]
+
+
+def iter_message_texts(
+    corpus: list[list[dict[str, typing.Any]]],
+) -> typing.Iterator[str]:
+    """Yield the text of every message in a corpus."""
+    for bundle in corpus:
+        for prompt in bundle:
+            for message in prompt["messages"]:
+                yield message["text"]
+
+
+def write_corpus(
+    corpus: list[list[dict[str, typing.Any]]], directory: Path
+) -> list[Path]:
+    """
+    Write each bundle of a corpus to its own JSON file.
+
+    Parameters
+    ----------
+    corpus : list of list of dict
+        The corpus, as from `generate_corpus`.
+    directory : Path
+        Where to write the files; created if missing.
+
+    Returns
+    -------
+    list of Path
+        The files written, in bundle order.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index, bundle in enumerate(corpus):
+        path = directory / f"bundle-{index:03}.json"
+        path.write_text(json.dumps(bundle, indent=2), encoding="utf-8")
+        paths.append(path)
+    return paths
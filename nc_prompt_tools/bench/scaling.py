@@ -0,0 +1,237 @@
+"""
+scaling.py
+
+Checks that the lint engines scale linearly with the size of their input.
+
+Each lint phase is timed on inputs that grow geometrically, and a straight
+line is fitted to the timings on log-log axes. Its slope is the exponent of
+the growth: about 1 for linear work and 2 for quadratic, as produced by
+repeated string concatenation or a backtracking regular expression.
+
+Two input shapes are generated:
+
+``tiled``
+    Realistic prose with expressions and nested {#if} blocks, made by
+    repeating paragraphs from the benchmark corpus.
+``long-if``
+    A single {#if} whose condition grows with the input, to catch
+    behaviour that is super-linear in the length of one expression.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import itertools
+import math
+import re
+import time
+import typing
+
+from .. import prompt_lint
+from .corpus import CorpusSpec, generate_corpus, iter_message_texts
+
+# Environment variable giving the largest input size used by the test suite.
+MAX_SIZE_VARIABLE = "PROMPT_LINT_SCALING_MAX"
+
+# The largest slope accepted as near-linear.
+DEFAULT_MAX_SLOPE = 1.25
+
+PHASES: dict[str, typing.Callable[[str], object]] = {
+    "parse_braced_expressions": prompt_lint.parse_braced_expressions,
+    "parse_control_flow_tokens": prompt_lint.parse_control_flow_tokens,
+    "check_if_else_endif_structure": prompt_lint.check_if_else_endif_structure,
+    "fix_message_content": prompt_lint.fix_message_content,
+}
+
+_SIZE = re.compile(r"(\d+)([KMG]?)B?", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_size(text: str) -> int:
+    """
+    Parse a size such as ``"512"``, ``"64K"`` or ``"64MB"`` into bytes.
+
+    Raises
+    ------
+    ValueError
+        If the text is not a size.
+    """
+    if not (found := _SIZE.fullmatch(text.strip())):
+        raise ValueError(f"Not a size: {text!r}")
+    return int(found.group(1)) * _SIZE_UNITS[found.group(2).upper()]
+
+
+def geometric_sizes(smallest: int, largest: int, factor: int = 2) -> list[int]:
+    """
+    Return ``smallest`` multiplied by ``factor`` up to ``largest``.
+
+    Raises
+    ------
+    ValueError
+        If ``smallest`` is not positive or ``factor`` is less than 2, so the
+        sizes would never reach ``largest``.
+    """
+    if smallest < 1:
+        raise ValueError(f"The smallest size must be positive: {smallest}")
+    if factor < 2:
+        raise ValueError(f"The growth factor must be at least 2: {factor}")
+    sizes = []
+    size = smallest
+    while size <= largest:
+        sizes.append(size)
+        size *= factor
+    return sizes
+
+
+def _tiled_message(size: int) -> str:
+    # Whole paragraphs keep braces and {#if} blocks valid
+    spec = CorpusSpec(bundles=1, dependencies=0, messages=8, broken=0.05)
+    messages = [
+        text.split("\n\n") for text in iter_message_texts(generate_corpus(spec))
+    ]
+    # Interleave the messages' paragraphs, so that every profile is mixed in
+    # even at the smallest sizes and the cost per character stays level
+    paragraphs = [
+        paragraph
+        for row in itertools.zip_longest(*messages)
+        for paragraph in row
+        if paragraph is not None
+    ]
+    pieces = []
+    length = 0
+    for paragraph in itertools.cycle(paragraphs):
+        if length >= size:
+            break
+        pieces.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(pieces)
+
+
+def _long_if_message(size: int) -> str:
+    clause = "(isEmpty(scene.summary) or not (pov and tense)) and "
+    clauses = clause * math.ceil(size / len(clause))
+    return f"{{#if ({clauses}words)}}\nbody {{pov}}\n{{#endif}}"
+
+
+SHAPES: dict[str, typing.Callable[[int], str]] = {
+    "tiled": _tiled_message,
+    "long-if": _long_if_message,
+}
+
+
+def _time_loop(
+    function: typing.Callable[[str], object], text: str, number: int
+) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        function(text)
+    return time.perf_counter() - start
+
+
+def time_call(
+    function: typing.Callable[[str], object],
+    text: str,
+    repeat: int = 3,
+    min_time: float = 0.02,
+) -> float:
+    """
+    Return the best time for one call, in seconds.
+
+    Fast calls are looped until a measurement takes at least ``min_time``
+    seconds, so that timer resolution and loop overhead do not dominate.
+
+    Parameters
+    ----------
+    function : callable
+        The phase to time.
+    text : str
+        Its input.
+    repeat : int, optional
+        Measurements to take; the fastest is kept.
+    min_time : float, optional
+        The shortest acceptable measurement, in seconds.
+    """
+    number = 1
+    while (elapsed := _time_loop(function, text, number)) < min_time:
+        number = max(number * 2, math.ceil(number * min_time / max(elapsed, 1e-9)))
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, _time_loop(function, text, number) / number)
+    return best
+
+
+def fit_slope(sizes: typing.Sequence[int], times: typing.Sequence[float]) -> float:
+    """
+    Fit ``time = c * size ** slope`` by least squares on log-log axes.
+
+    Returns
+    -------
+    float
+        The fitted slope.
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(duration) for duration in times]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class ScalingResult:
+    """
+    The timings of one phase on one input shape at growing sizes.
+
+    Attributes
+    ----------
+    phase : str
+        The name of the phase, a key of `PHASES`.
+    shape : str
+        The name of the input shape, a key of `SHAPES`.
+    sizes : tuple of int
+        The input sizes, in characters.
+    times : tuple of float
+        The best time per call at each size, in seconds.
+    """
+
+    phase: str
+    shape: str
+    sizes: tuple[int, ...]
+    times: tuple[float, ...]
+
+    @property
+    def slope(self) -> float:
+        """The exponent of the growth in time with size."""
+        return fit_slope(self.sizes, self.times)
+
+
+def measure_scaling(
+    phase: str, shape: str, sizes: typing.Iterable[int], repeat: int = 3
+) -> ScalingResult:
+    """
+    Time a phase on inputs of each size.
+
+    Parameters
+    ----------
+    phase : str
+        A key of `PHASES`.
+    shape : str
+        A key of `SHAPES`.
+    sizes : iterable of int
+        Approximate input sizes, in characters; at least two.
+    repeat : int, optional
+        Measurements per size, as for `time_call`.
+
+    Returns
+    -------
+    ScalingResult
+        The timings, at the actual sizes of the generated inputs.
+    """
+    function = PHASES[phase]
+    measured_sizes = []
+    times = []
+    for size in sizes:
+        text = SHAPES[shape](size)
+        measured_sizes.append(len(text))
+        times.append(time_call(function, text, repeat))
+    return ScalingResult(phase, shape, tuple(measured_sizes), tuple(times))
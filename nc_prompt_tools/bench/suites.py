@@ -0,0 +1,428 @@
+"""
+suites.py
+
+Timed benchmark suites for the lint engines.
+
+Each benchmark times one public entry point over every message (or
+expression) of a generated corpus, so a round processes the same input
+on every run. Results record the time of each round together with the
+amount of input, and are saved as JSON so that runs can be compared.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import datetime
+import io
+import json
+import math
+import platform
+import statistics
+import tempfile
+import time
+import typing
+from pathlib import Path
+
+from .. import paren_batch, prompt_lint
+from .._version import tool_version
+from .corpus import CorpusSpec, generate_corpus, iter_message_texts, write_corpus
+
+# Version of the results file format.
+RESULTS_FORMAT = 1
+
+# The benchmarks built by `build_suite`, in order.
+BENCHMARK_NAMES = (
+    "parse_braced_expressions",
+    "check_parentheses_balance",
+    "check_parentheses_balance_batch",
+    "parse_control_flow_tokens",
+    "check_file_balance",
+    "fix_message_content",
+    "main",
+)
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class Benchmark:
+    """
+    A timed operation over a fixed input.
+
+    Attributes
+    ----------
+    name : str
+        The name of the function being timed.
+    run : callable
+        Performs one round over the whole input.
+    items : int
+        Messages, expressions or files processed per round.
+    size : int
+        Bytes of input processed per round.
+    """
+
+    name: str
+    run: typing.Callable[[], object]
+    items: int
+    size: int
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class BenchmarkResult:
+    """
+    The timings of one benchmark.
+
+    Attributes
+    ----------
+    name : str
+        The benchmark's name.
+    times : tuple of float
+        Seconds taken by each timed round.
+    items : int
+        Items processed per round.
+    size : int
+        Bytes of input processed per round.
+    """
+
+    name: str
+    times: tuple[float, ...]
+    items: int
+    size: int
+
+    @property
+    def median(self) -> float:
+        """The median round time, in seconds."""
+        return statistics.median(self.times)
+
+    @property
+    def best(self) -> float:
+        """The fastest round time, in seconds."""
+        return min(self.times)
+
+    @property
+    def throughput(self) -> float:
+        """Megabytes of input processed per second, at the median."""
+        return self.size / 1e6 / self.median if self.median else float("inf")
+
+    def confidence_interval(self, confidence: float = 0.95) -> tuple[float, float]:
+        """
+        Return a distribution-free confidence interval for the median time.
+
+        The bounds are order statistics of the round times, chosen from the
+        binomial distribution so that the interval covers the true median
+        with at least the requested probability. With too few rounds for
+        that, the interval spans every round.
+
+        Parameters
+        ----------
+        confidence : float, optional
+            The coverage probability, between 0 and 1.
+
+        Returns
+        -------
+        tuple of (float, float)
+            The lower and upper bounds, in seconds.
+        """
+        times = sorted(self.times)
+        n = len(times)
+        # Widen from the middle while P(fewer than k rounds fall below the
+        # median) stays within the tail allowance
+        tail = (1 - confidence) / 2
+        k = 0
+        cumulative = 0.0
+        while k < n // 2:
+            cumulative += math.comb(n, k) / 2**n
+            if cumulative > tail:
+                break
+            k += 1
+        if k == 0:
+            return times[0], times[-1]
+        return times[k - 1], times[n - k]
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class BenchmarkRun:
+    """
+    The results of a benchmark run and the conditions it ran under.
+
+    Attributes
+    ----------
+    corpus : CorpusSpec
+        The corpus the benchmarks ran over.
+    results : tuple of BenchmarkResult
+        One result per benchmark, in suite order.
+    metadata : dict
+        The tool and Python versions, platform and time of the run.
+    """
+
+    corpus: CorpusSpec
+    results: tuple[BenchmarkResult, ...]
+    metadata: dict[str, str]
+
+    def to_json(self) -> dict[str, typing.Any]:
+        """Return the run as a JSON-compatible dict."""
+        return {
+            "format": RESULTS_FORMAT,
+            "metadata": self.metadata,
+            "corpus": dataclasses.asdict(self.corpus),
+            "results": [dataclasses.asdict(result) for result in self.results],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, typing.Any]) -> BenchmarkRun:
+        """
+        Rebuild a run from `to_json` output.
+
+        Raises
+        ------
+        ValueError
+            If the data is not a results file of a supported format.
+        """
+        if not isinstance(data, dict) or data.get("format") != RESULTS_FORMAT:
+            raise ValueError("Not a benchmark results file of a supported format")
+        corpus = data["corpus"]
+        return cls(
+            CorpusSpec(**{**corpus, "profiles": tuple(corpus["profiles"])}),
+            tuple(
+                BenchmarkResult(
+                    result["name"],
+                    tuple(result["times"]),
+                    result["items"],
+                    result["size"],
+                )
+                for result in data["results"]
+            ),
+            data["metadata"],
+        )
+
+    def save(self, path: Path) -> None:
+        """Write the run to ``path`` as JSON."""
+        text = json.dumps(self.to_json(), indent=2) + "\n"
+        path.write_text(text, encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> BenchmarkRun:
+        """Read a run written by `save`."""
+        return cls.from_json(json.loads(path.read_text(encoding="utf-8")))
+
+
+def _run_main(paths: list[Path]) -> None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            prompt_lint.main([str(path) for path in paths])
+        except SystemExit:
+            pass
+
+
+def build_suite(
+    corpus: list[list[dict[str, typing.Any]]], directory: Path
+) -> list[Benchmark]:
+    """
+    Build the benchmarks for a corpus.
+
+    Parameters
+    ----------
+    corpus : list of list of dict
+        The corpus, as from `generate_corpus`.
+    directory : Path
+        Where to write the corpus files for the end-to-end benchmark.
+
+    Returns
+    -------
+    list of Benchmark
+        The benchmarks, from the lowest-level function to ``main()``.
+    """
+    texts = list(iter_message_texts(corpus))
+    bodies = [
+        body
+        for text in texts
+        for _, _, body in prompt_lint.parse_braced_expressions(text)
+    ]
+    text_size = sum(len(text.encode("utf-8")) for text in texts)
+    body_size = sum(len(body.encode("utf-8")) for body in bodies)
+    paths = write_corpus(corpus, directory)
+    file_size = sum(path.stat().st_size for path in paths)
+
+    def over_texts(function: typing.Callable[[str], object]) -> Benchmark:
+        def run() -> None:
+            for text in texts:
+                function(text)
+
+        return Benchmark(function.__name__, run, len(texts), text_size)
+
+    def check_bodies() -> None:
+        for body in bodies:
+            prompt_lint.check_parentheses_balance(body)
+
+    return [
+        over_texts(prompt_lint.parse_braced_expressions),
+        Benchmark("check_parentheses_balance", check_bodies, len(bodies), body_size),
+        Benchmark(
+            "check_parentheses_balance_batch",
+            lambda: paren_batch.check_parentheses_balance_batch(bodies),
+            len(bodies),
+            body_size,
+        ),
+        over_texts(prompt_lint.parse_control_flow_tokens),
+        over_texts(prompt_lint.check_file_balance),
+        over_texts(prompt_lint.fix_message_content),
+        Benchmark("main", lambda: _run_main(paths), len(paths), file_size),
+    ]
+
+
+def time_benchmark(
+    benchmark: Benchmark, repeat: int, warmup: int = 0
+) -> BenchmarkResult:
+    """
+    Time ``repeat`` rounds of a benchmark.
+
+    Parameters
+    ----------
+    benchmark : Benchmark
+        The benchmark to time.
+    repeat : int
+        The number of timed rounds.
+    warmup : int, optional
+        Untimed rounds to run first, to warm caches and lazy imports.
+
+    Returns
+    -------
+    BenchmarkResult
+        The time of each timed round.
+    """
+    for _ in range(warmup):
+        benchmark.run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark.run()
+        times.append(time.perf_counter() - start)
+    return BenchmarkResult(
+        benchmark.name, tuple(times), benchmark.items, benchmark.size
+    )
+
+
+def run_metadata() -> dict[str, str]:
+    """Describe the conditions of a run, for its results file."""
+    return {
+        "tool_version": tool_version(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        # The batch engine falls back to the pure-Python one without NumPy
+        "numpy": paren_batch.np.__version__ if paren_batch.HAVE_NUMPY else "none",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def run_suite(
+    spec: CorpusSpec,
+    repeat: int = 5,
+    warmup: int = 0,
+    only: typing.Collection[str] | None = None,
+    progress: typing.Callable[[BenchmarkResult], None] | None = None,
+) -> BenchmarkRun:
+    """
+    Generate a corpus and time the benchmark suite over it.
+
+    Parameters
+    ----------
+    spec : CorpusSpec
+        The corpus to generate.
+    repeat : int, optional
+        The number of timed rounds per benchmark.
+    warmup : int, optional
+        Untimed rounds to run first, as for `time_benchmark`.
+    only : collection of str, optional
+        Names of the benchmarks to run; all of them by default.
+    progress : callable, optional
+        Called with each result as soon as it is available.
+
+    Returns
+    -------
+    BenchmarkRun
+        The results, with the run's metadata.
+    """
+    corpus = generate_corpus(spec)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="prompt-lint-bench-") as directory:
+        for benchmark in build_suite(corpus, Path(directory)):
+            if only is not None and benchmark.name not in only:
+                continue
+            result = time_benchmark(benchmark, repeat, warmup)
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return BenchmarkRun(spec, tuple(results), run_metadata())
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class Comparison:
+    """
+    A benchmark's current timings against its baseline.
+
+    Attributes
+    ----------
+    baseline, current : BenchmarkResult
+        The timings being compared.
+    """
+
+    baseline: BenchmarkResult
+    current: BenchmarkResult
+
+    @property
+    def name(self) -> str:
+        """The benchmark's name."""
+        return self.current.name
+
+    @property
+    def change(self) -> float:
+        """The relative change in median time; positive is slower."""
+        return self.current.median / self.baseline.median - 1
+
+    def regressed(self, threshold: float, confidence: float = 0.95) -> bool:
+        """
+        Decide whether the benchmark got slower than the baseline allows.
+
+        Parameters
+        ----------
+        threshold : float
+            The largest tolerated slowdown of the median, as a fraction.
+        confidence : float, optional
+            The confidence level of the current median's interval.
+
+        Returns
+        -------
+        bool
+            True if the whole confidence interval of the current median is
+            slower than the baseline median by more than ``threshold``, so
+            the slowdown is not explained by noise in the current rounds.
+            The baseline is taken at its median rather than its interval,
+            which a single slow round widens to every round when the
+            baseline has few of them.
+        """
+        current_low, _ = self.current.confidence_interval(confidence)
+        return current_low > self.baseline.median * (1 + threshold)
+
+
+def compare_runs(baseline: BenchmarkRun, current: BenchmarkRun) -> list[Comparison]:
+    """
+    Pair the results of two runs by benchmark name.
+
+    Parameters
+    ----------
+    baseline, current : BenchmarkRun
+        The runs to compare.
+
+    Returns
+    -------
+    list of Comparison
+        One comparison per benchmark present in both runs, in the order of
+        the current run.
+    """
+    baseline_results = {result.name: result for result in baseline.results}
+    return [
+        Comparison(baseline_results[result.name], result)
+        for result in current.results
+        if result.name in baseline_results
+    ]
@@ -0,0 +1,390 @@
+"""
+instrument.py
+
+Low-overhead timing and counting of the phases of a lint run.
+
+A `Recorder` accumulates the time spent in named phases, measured with the
+monotonic ``perf_counter_ns`` clock, and named counters such as messages
+and bytes linted. The lint functions take a recorder argument that
+defaults to `NULL_RECORDER`, whose spans and counters do nothing, so
+instrumentation costs only a method call per phase unless ``--stats`` is
+given. Recorders are plain data, so those of worker processes can be
+returned with their reports and merged.
+
+A `TraceRecorder` also keeps every span as a `TraceEvent`, tagged with the
+process and thread that recorded it, and `write_trace` saves them in the
+Chrome trace-event format read by ``chrome://tracing`` and Perfetto.
+``perf_counter_ns`` is a system-wide clock on Linux, macOS and Windows, so
+the spans of worker processes line up on a single timeline.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import json
+import os
+import threading
+import time
+import typing
+from pathlib import Path
+
+# Phases in the order they happen to a file, for display. Phases not
+# listed here are shown after them, in the order first recorded.
+PHASE_ORDER = (
+    "read",
+    "json.load",
+    "check",
+    "diagnose",
+    "fix",
+    "render",
+    "dump",
+)
+
+# The category of spans that are summed into phase timings. Spans of other
+# categories, such as files and messages, are only kept in traces.
+PHASE = "phase"
+
+# Counters in display order.
+COUNTER_ORDER = ("files", "bytes", "messages", "expressions", "tokens", "fixes")
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    """Adds the time spent in a ``with`` block to a recorder's phase."""
+
+    __slots__ = ("_recorder", "_name", "_start")
+
+    def __init__(self, recorder: Recorder, name: str) -> None:
+        self._recorder = recorder
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._recorder.add_time(self._name, time.perf_counter_ns() - self._start)
+
+
+@dataclasses.dataclass(slots=True)
+class Recorder:
+    """
+    Accumulated phase timings and counters.
+
+    Attributes
+    ----------
+    nanoseconds : dict of str to int
+        Total time spent in each phase.
+    calls : dict of str to int
+        Number of times each phase was entered.
+    counters : dict of str to int
+        The value of each counter.
+    """
+
+    nanoseconds: dict[str, int] = dataclasses.field(default_factory=dict)
+    calls: dict[str, int] = dataclasses.field(default_factory=dict)
+    counters: dict[str, int] = dataclasses.field(default_factory=dict)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether anything is recorded; False only for `NULL_RECORDER`."""
+        return True
+
+    def span(
+        self,
+        name: str,
+        category: str = PHASE,
+        args: dict[str, typing.Any] | None = None,
+        index: int | None = None,
+    ) -> typing.ContextManager[None]:
+        """
+        Return a context manager that times its block.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase or, for other categories, of the span.
+        category : str, optional
+            `PHASE` to add the time to phase ``name``; spans of other
+            categories are only recorded by a `TraceRecorder`.
+        args : dict, optional
+            Details shown with the span in a trace.
+        index : int, optional
+            Appended to ``name`` when the span is recorded, as in
+            ``message 3``, so that nothing is formatted for spans that are
+            not.
+        """
+        if category != PHASE:
+            return _NULL_SPAN
+        return _Span(self, name if index is None else f"{name} {index}")
+
+    def add_time(self, name: str, nanoseconds: int, calls: int = 1) -> None:
+        """Add time spent in phase ``name``."""
+        self.nanoseconds[name] = self.nanoseconds.get(name, 0) + nanoseconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add ``amount`` to counter ``name``."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timed_iter(
+        self, name: str, iterable: typing.Iterable[typing.Any]
+    ) -> typing.Iterator[typing.Any]:
+        """
+        Yield from ``iterable``, timing each step as phase ``name``.
+
+        Only the time spent producing items is recorded, not the time
+        spent by the consumer between items.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter_ns()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter_ns() - start)
+                return
+            self.add_time(name, time.perf_counter_ns() - start)
+            yield item
+
+    def merge(self, other: Recorder) -> None:
+        """Add the timings and counters of ``other`` to this recorder."""
+        for name, nanoseconds in other.nanoseconds.items():
+            self.add_time(name, nanoseconds, other.calls.get(name, 0))
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+
+
+class _NullRecorder(Recorder):
+    """A recorder that records nothing, at the least possible cost."""
+
+    __slots__ = ()
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    def span(
+        self,
+        name: str,
+        category: str = PHASE,
+        args: dict[str, typing.Any] | None = None,
+        index: int | None = None,
+    ) -> typing.ContextManager[None]:
+        return _NULL_SPAN
+
+    def add_time(self, name: str, nanoseconds: int, calls: int = 1) -> None:
+        pass
+
+    def count(self, name: str, amount: int = 1) -> None:
+        pass
+
+    def timed_iter(
+        self, name: str, iterable: typing.Iterable[typing.Any]
+    ) -> typing.Iterator[typing.Any]:
+        return iter(iterable)
+
+
+# The default recorder of the lint functions: instrumentation disabled.
+NULL_RECORDER: Recorder = _NullRecorder()
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class TraceEvent:
+    """
+    A span recorded by a `TraceRecorder`.
+
+    Attributes
+    ----------
+    name, category : str
+        As passed to `Recorder.span`.
+    start, duration : int
+        When the span started, by ``perf_counter_ns``, and its length, in
+        nanoseconds.
+    pid, tid : int
+        The process and native thread that recorded the span.
+    args : dict or None
+        Details shown with the span.
+    """
+
+    name: str
+    category: str
+    start: int
+    duration: int
+    pid: int
+    tid: int
+    args: dict[str, typing.Any] | None = None
+
+    def to_json(self) -> dict[str, typing.Any]:
+        """Return the event as a complete ("X") trace event."""
+        event = {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": self.start / 1e3,
+            "dur": self.duration / 1e3,
+            "pid": self.pid,
+            "tid": self.tid,
+        }
+        if self.args:
+            event["args"] = self.args
+        return event
+
+
+class _TraceSpan:
+    """Records a ``with`` block as a trace event, and phase time if a phase."""
+
+    __slots__ = ("_recorder", "_name", "_category", "_args", "_start")
+
+    def __init__(
+        self,
+        recorder: TraceRecorder,
+        name: str,
+        category: str,
+        args: dict[str, typing.Any] | None,
+    ) -> None:
+        self._recorder = recorder
+        self._name = name
+        self._category = category
+        self._args = args
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info: object) -> None:
+        recorder = self._recorder
+        duration = time.perf_counter_ns() - self._start
+        if self._category == PHASE:
+            recorder.add_time(self._name, duration)
+        recorder.events.append(
+            TraceEvent(
+                self._name,
+                self._category,
+                self._start,
+                duration,
+                recorder.pid,
+                recorder.tid,
+                self._args,
+            )
+        )
+
+
+@dataclasses.dataclass(slots=True)
+class TraceRecorder(Recorder):
+    """
+    A recorder that also keeps every span, of every category, for a trace.
+
+    Attributes
+    ----------
+    events : list of TraceEvent
+        The spans recorded, and those of merged recorders.
+    pid, tid : int
+        The process and native thread that the recorder was created in,
+        with which its spans are tagged.
+    """
+
+    events: list[TraceEvent] = dataclasses.field(default_factory=list)
+    pid: int = dataclasses.field(default_factory=os.getpid)
+    tid: int = dataclasses.field(default_factory=threading.get_native_id)
+
+    def span(
+        self,
+        name: str,
+        category: str = PHASE,
+        args: dict[str, typing.Any] | None = None,
+        index: int | None = None,
+    ) -> typing.ContextManager[None]:
+        if index is not None:
+            name = f"{name} {index}"
+        return _TraceSpan(self, name, category, args)
+
+    def merge(self, other: Recorder) -> None:
+        Recorder.merge(self, other)
+        if isinstance(other, TraceRecorder):
+            self.events.extend(other.events)
+
+
+def write_trace(path: Path, events: typing.Iterable[TraceEvent]) -> None:
+    """
+    Write trace events as Chrome trace-event JSON.
+
+    Each process is named: the current one ``prompt_lint`` and any others
+    ``prompt_lint worker``.
+
+    Parameters
+    ----------
+    path : Path
+        The file to write, which can be opened in ``chrome://tracing`` or
+        https://ui.perfetto.dev.
+    events : iterable of TraceEvent
+        The spans to write.
+    """
+    trace_events = [event.to_json() for event in events]
+    pids = sorted({event["pid"] for event in trace_events} | {os.getpid()})
+    trace_events.extend(
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": pid,
+            "args": {
+                "name": "prompt_lint" if pid == os.getpid() else "prompt_lint worker"
+            },
+        }
+        for pid in pids
+    )
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def _ordered(names: typing.Iterable[str], order: tuple[str, ...]) -> list[str]:
+    present = dict.fromkeys(names)
+    return [name for name in order if name in present] + [
+        name for name in present if name not in order
+    ]
+
+
+def render_stats(recorder: Recorder, wall_seconds: float) -> str:
+    """
+    Render the ``--stats`` report of a lint run.
+
+    Parameters
+    ----------
+    recorder : Recorder
+        The merged recorder of every file in the run.
+    wall_seconds : float
+        The elapsed time of the whole run. With several workers, the phase
+        times add up to more than this.
+
+    Returns
+    -------
+    str
+        A table of phases with their calls, total time, share of the
+        recorded time and the throughput of prompt file bytes through each
+        phase, followed by the counters and overall throughput. Each line is
+        terminated by a newline.
+    """
+    total = sum(recorder.nanoseconds.values()) or 1
+    megabytes = recorder.counters.get("bytes", 0) / 1e6
+    messages = recorder.counters.get("messages", 0)
+
+    lines = [f"{'phase':<12}{'calls':>9}{'time ms':>12}{'share':>8}{'MB/s':>10}"]
+    for name in _ordered(recorder.nanoseconds, PHASE_ORDER):
+        nanoseconds = recorder.nanoseconds[name]
+        rate = f"{megabytes / (nanoseconds / 1e9):.1f}" if nanoseconds else "-"
+        lines.append(
+            f"{name:<12}{recorder.calls[name]:>9}{nanoseconds / 1e6:>12.2f}"
+            f"{nanoseconds / total:>8.1%}{rate:>10}"
+        )
+    lines.append(
+        ", ".join(
+            f"{recorder.counters[name]} {name}"
+            for name in _ordered(recorder.counters, COUNTER_ORDER)
+        )
+    )
+    if wall_seconds > 0:
+        lines.append(
+            f"Linted in {wall_seconds:.3f} s: {megabytes / wall_seconds:.1f} MB/s, "
+            f"{messages / wall_seconds:.0f} messages/s"
+        )
+    return "".join(f"{line}\n" for line in lines)
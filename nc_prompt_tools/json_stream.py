@@ -0,0 +1,447 @@
+"""
+json_stream.py
+
+An incremental reader for Novelcrafter prompt JSON.
+
+Rather than materialising the whole document, the reader walks the top-level
+prompt (or list of prompt and dependencies) as text arrives, decodes each
+entry of every ``messages`` array on its own and skips everything else
+without building it. Peak memory is therefore bounded by the largest single
+message rather than by the size of the bundle.
+
+The same walk can instead locate the source span of each message's ``text``
+string, so that fixed messages can be spliced into the original document
+without re-serialising the rest of it.
+"""
+
+from __future__ import annotations
+
+import collections.abc
+import dataclasses
+import io
+import json
+import re
+import typing
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that end a string or start an escape inside one.
+_STRING_SPECIAL = re.compile(r'["\\]')
+# Characters that matter while skipping over an object or array.
+_CONTAINER_SPECIAL = re.compile(r'["{}\[\]]')
+# Characters that end a scalar (number, true, false or null).
+_SCALAR_END = re.compile(r"[,\]}\s]")
+
+
+class JSONStreamError(ValueError):
+    """
+    Raised when the streamed document is not well-formed JSON.
+
+    Attributes
+    ----------
+    offset : int or None
+        Index in the document at which the problem was found, if known.
+    """
+
+    def __init__(self, message: str, offset: int | None = None) -> None:
+        super().__init__(message)
+        self.offset = offset
+
+
+class PromptShapeError(ValueError):
+    """Raised when a prompt is not of the form {"messages": [...]}."""
+
+
+class UnsupportedDocumentError(PromptShapeError):
+    """Raised when the document is neither a prompt nor a list of prompts."""
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class StreamedPrompt:
+    """
+    Marks the start of a prompt.
+
+    Attributes
+    ----------
+    index : int or None
+        Position of the prompt in a top-level list (0 is the prompt
+        itself, later entries are dependencies), or None when the document
+        is a single prompt object.
+    """
+
+    index: int | None
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class StreamedMessage:
+    """
+    A single decoded message.
+
+    Attributes
+    ----------
+    prompt_index : int or None
+        The index of the enclosing prompt, as for `StreamedPrompt`.
+    index : int
+        Position of the message in its prompt's ``messages`` array.
+    message : Any
+        The decoded message, normally a dict with a ``text`` key.
+    """
+
+    prompt_index: int | None
+    index: int
+    message: typing.Any
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class MessageTextSpan:
+    """
+    Where a message's ``text`` string lies in the document source.
+
+    Attributes
+    ----------
+    prompt_index : int or None
+        The index of the enclosing prompt, as for `StreamedPrompt`.
+    index : int
+        Position of the message in its prompt's ``messages`` array.
+    start : int
+        Index of the string's opening quote.
+    end : int
+        Index just past the string's closing quote.
+    """
+
+    prompt_index: int | None
+    index: int
+    start: int
+    end: int
+
+
+class _StreamReader:
+    """A forward-only cursor over a text stream with bounded buffering."""
+
+    def __init__(self, stream: typing.TextIO, chunk_size: int) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        # Number of characters dropped from the front of the buffer.
+        self._consumed = 0
+        # Start of a value being captured; the buffer is kept from here on.
+        self._mark: int | None = None
+
+    def _fill(self) -> bool:
+        """Read more text, discarding what is no longer needed."""
+        keep = self._pos if self._mark is None else self._mark
+        # Read at least as much as is retained so that capturing a large
+        # value costs amortised linear time rather than quadratic.
+        retained = len(self._buffer) - keep
+        if not (chunk := self._stream.read(max(self._chunk_size, retained))):
+            return False
+        self._buffer = self._buffer[keep:] + chunk
+        self._consumed += keep
+        self._pos -= keep
+        if self._mark is not None:
+            self._mark = 0
+        return True
+
+    @property
+    def offset(self) -> int:
+        """Index of the cursor in the whole document."""
+        return self._consumed + self._pos
+
+    def error(self, message: str) -> JSONStreamError:
+        return JSONStreamError(f"{message} (char {self.offset})", self.offset)
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at the end)."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"Expecting {char!r}")
+        self._pos += 1
+
+    def accept(self, char: str) -> bool:
+        """Consume ``char`` if it is the next character."""
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def _search(self, pattern: re.Pattern[str]) -> re.Match[str]:
+        """Find ``pattern`` at or after the cursor, reading as needed."""
+        while not (found := pattern.search(self._buffer, self._pos)):
+            self._pos = len(self._buffer)
+            if not self._fill():
+                raise self.error("Unexpected end of document")
+        return found
+
+    def _skip_string(self) -> None:
+        # The cursor is just past the opening quote
+        while True:
+            found = self._search(_STRING_SPECIAL)
+            self._pos = found.end()
+            if found.group() == '"':
+                return
+            # Step over the escaped character
+            if self._pos >= len(self._buffer) and not self._fill():
+                raise self.error("Unterminated string")
+            self._pos += 1
+
+    def skip_value(self) -> None:
+        """Step over the next value without decoding it."""
+        match self.peek():
+            case "":
+                raise self.error("Expecting value")
+            case '"':
+                self._pos += 1
+                self._skip_string()
+            case "{" | "[":
+                self._pos += 1
+                depth = 1
+                while depth:
+                    found = self._search(_CONTAINER_SPECIAL)
+                    self._pos = found.end()
+                    match found.group():
+                        case '"':
+                            self._skip_string()
+                        case "{" | "[":
+                            depth += 1
+                        case _:
+                            depth -= 1
+            case _:
+                while not (found := _SCALAR_END.search(self._buffer, self._pos)):
+                    self._pos = len(self._buffer)
+                    if not self._fill():
+                        return
+                self._pos = found.start()
+
+    def read_value(self) -> typing.Any:
+        """Decode the next value; only its own text is held in memory."""
+        self.peek()
+        self._mark = self._pos
+        try:
+            self.skip_value()
+            text = self._buffer[self._mark : self._pos]
+        finally:
+            self._mark = None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise self.error(f"Invalid value: {e.msg}") from e
+
+    def read_string(self) -> str:
+        if self.peek() != '"':
+            raise self.error("Expecting property name enclosed in double quotes")
+        return self.read_value()
+
+
+def _read_text_span(reader: _StreamReader) -> tuple[int, int] | None:
+    """Step over a message, returning the span of its ``text`` string."""
+    if not reader.accept("{"):
+        reader.skip_value()
+        return None
+    span = None
+    if not reader.accept("}"):
+        while True:
+            key = reader.read_string()
+            reader.expect(":")
+            if key == "text" and reader.peek() == '"':
+                # Like json, the last of any duplicate keys wins
+                start = reader.offset
+                reader.skip_value()
+                span = start, reader.offset
+            else:
+                reader.skip_value()
+            if reader.accept("}"):
+                break
+            reader.expect(",")
+    return span
+
+
+def _iter_prompt(
+    reader: _StreamReader,
+    index: int | None,
+    read_message: typing.Callable[[_StreamReader], typing.Any],
+) -> typing.Iterator[StreamedPrompt | StreamedMessage]:
+    yield StreamedPrompt(index)
+    if not reader.accept("{"):
+        raise PromptShapeError('JSON must be in the form {"messages": [...]}')
+
+    seen_messages = False
+    if not reader.accept("}"):
+        while True:
+            key = reader.read_string()
+            reader.expect(":")
+            if key == "messages":
+                if not reader.accept("["):
+                    raise PromptShapeError(
+                        'JSON must be in the form {"messages": [...]}'
+                    )
+                seen_messages = True
+                if not reader.accept("]"):
+                    message_index = 0
+                    while True:
+                        yield StreamedMessage(
+                            index, message_index, read_message(reader)
+                        )
+                        message_index += 1
+                        if reader.accept("]"):
+                            break
+                        reader.expect(",")
+            else:
+                reader.skip_value()
+            if reader.accept("}"):
+                break
+            reader.expect(",")
+
+    if not seen_messages:
+        raise PromptShapeError('JSON must be in the form {"messages": [...]}')
+
+
+def iter_prompt_events(
+    stream: typing.TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> typing.Iterator[StreamedPrompt | StreamedMessage]:
+    """
+    Incrementally walk a prompt document, yielding one message at a time.
+
+    The document is either a single prompt, ``{"messages": [...]}``, or a
+    list of them (the prompt followed by its dependencies).
+
+    Parameters
+    ----------
+    stream : text file object
+        The JSON document.
+    chunk_size : int, optional
+        Number of characters to read at a time.
+
+    Yields
+    ------
+    StreamedPrompt or StreamedMessage
+        A `StreamedPrompt` as each prompt begins, followed by a
+        `StreamedMessage` for each of its messages.
+
+    Raises
+    ------
+    JSONStreamError
+        If the document is not well-formed. Values that are skipped rather
+        than decoded are only checked for balanced nesting.
+    PromptShapeError
+        If a prompt is not of the form ``{"messages": [...]}``.
+    UnsupportedDocumentError
+        If the document is neither an object nor a list.
+    """
+    yield from _iter_document(
+        _StreamReader(stream, chunk_size), _StreamReader.read_value
+    )
+
+
+def _iter_document(
+    reader: _StreamReader,
+    read_message: typing.Callable[[_StreamReader], typing.Any],
+) -> typing.Iterator[StreamedPrompt | StreamedMessage]:
+    match reader.peek():
+        case "{":
+            yield from _iter_prompt(reader, None, read_message)
+        case "[":
+            reader.expect("[")
+            if not reader.accept("]"):
+                index = 0
+                while True:
+                    yield from _iter_prompt(reader, index, read_message)
+                    index += 1
+                    if reader.accept("]"):
+                        break
+                    reader.expect(",")
+        case "":
+            raise reader.error("Expecting value")
+        case _:
+            raise UnsupportedDocumentError("Unsupported JSON data type")
+
+    if reader.peek():
+        raise reader.error("Extra data")
+
+
+def iter_message_text_spans(source: str) -> typing.Iterator[MessageTextSpan]:
+    """
+    Locate the ``text`` string of every message in a prompt document.
+
+    Parameters
+    ----------
+    source : str
+        The document's JSON text.
+
+    Yields
+    ------
+    MessageTextSpan
+        The span of each message's ``text`` string, in document order.
+        Messages that are not objects, or whose ``text`` is not a string,
+        are skipped.
+
+    Raises
+    ------
+    JSONStreamError, PromptShapeError, UnsupportedDocumentError
+        As for `iter_prompt_events`.
+    """
+    reader = _StreamReader(io.StringIO(source), max(len(source), 1))
+    for event in _iter_document(reader, _read_text_span):
+        match event:
+            case StreamedMessage(message=(start, end)):
+                yield MessageTextSpan(event.prompt_index, event.index, start, end)
+
+
+def splice_message_texts(
+    source: str,
+    replacements: collections.abc.Mapping[tuple[int | None, int], str],
+) -> str:
+    """
+    Replace the ``text`` of some messages, leaving the rest of the source as is.
+
+    Only the replaced strings are re-encoded, so formatting, key order and
+    escaping elsewhere in the document are preserved byte for byte. A
+    replaced string is written with ``\\uXXXX`` escapes for non-ASCII
+    characters only if the original used such escapes.
+
+    Parameters
+    ----------
+    source : str
+        The document's JSON text.
+    replacements : mapping
+        New texts, keyed by ``(prompt_index, message_index)`` as in
+        `MessageTextSpan`.
+
+    Returns
+    -------
+    str
+        The document with the replacements spliced in. If a prompt
+        repeats its ``messages`` key, the last array is the one updated,
+        matching how `json` loads the document.
+    """
+    spans = {
+        (span.prompt_index, span.index): span
+        for span in iter_message_text_spans(source)
+    }
+    edits = sorted(
+        (spans[key] for key in replacements.keys() & spans.keys()),
+        key=lambda span: span.start,
+    )
+
+    parts: list[str] = []
+    prev_end = 0
+    for span in edits:
+        original = source[span.start : span.end]
+        parts.append(source[prev_end : span.start])
+        parts.append(
+            json.dumps(
+                replacements[span.prompt_index, span.index],
+                ensure_ascii="\\u" in original,
+            )
+        )
+        prev_end = span.end
+    parts.append(source[prev_end:])
+    return "".join(parts)
@@ -0,0 +1,257 @@
+"""
+lint_cache.py
+
+A persistent, content-addressed cache of message lint results.
+
+Entries are keyed by a hash of the message text, the tool version and the
+active rule set, so an entry can never be served for a message that has
+changed or for a different set of rules. The cache lives in a SQLite
+database in WAL mode, which lets concurrent CI jobs (and the worker
+processes of a single run) read and write it safely.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import os
+import typing
+from pathlib import Path
+
+from ._version import tool_version
+
+CACHE_FILENAME = "lint-cache.sqlite3"
+
+# Bump when the on-disk schema changes; old databases are simply rebuilt.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lint_results (
+    key BLOB PRIMARY KEY,
+    result TEXT NOT NULL,
+    fixed_content TEXT,
+    fix_succeeded INTEGER
+) WITHOUT ROWID
+"""
+
+
+def default_cache_dir() -> Path:
+    """
+    Return the default cache directory.
+
+    Returns
+    -------
+    Path
+        ``$XDG_CACHE_HOME/nc-prompt-tools``, falling back to
+        ``~/.cache/nc-prompt-tools``.
+    """
+    if cache_home := os.environ.get("XDG_CACHE_HOME"):
+        return Path(cache_home) / "nc-prompt-tools"
+    return Path.home() / ".cache" / "nc-prompt-tools"
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class CachedCheck:
+    """
+    A cached lint outcome for one message.
+
+    Attributes
+    ----------
+    result : str
+        The name of the `CheckFileBalanceResult` for the message.
+    fixed_content : str or None
+        The fixed message text, if a fix has been computed.
+    fix_succeeded : bool or None
+        Whether the fix passed re-validation; None if no fix was computed.
+    """
+
+    result: str
+    fixed_content: str | None = None
+    fix_succeeded: bool | None = None
+
+
+class ResultCache(typing.Protocol):
+    """The interface through which message lint results are cached."""
+
+    def lookup(self, content: str) -> CachedCheck | None:
+        """Return the cached outcome for a message, or None on a miss."""
+        ...
+
+    def store(self, content: str, check: CachedCheck) -> None:
+        """Record the outcome for a message."""
+        ...
+
+    def flush(self) -> None:
+        """Make buffered writes durable."""
+        ...
+
+
+class MemoryLintCache:
+    """
+    In-process cache of message lint results, keyed by a hash of the text.
+
+    Entries live for one generation: `sweep` discards every entry that was
+    not looked up or stored since the previous sweep. A long-running
+    process that re-lints a file after each change can therefore keep one
+    cache per file and sweep it after each lint, so that only messages
+    whose text changed are checked again and memory stays bounded by the
+    file's current messages.
+
+    Attributes
+    ----------
+    hits, misses : int
+        Lookups that were and were not answered since the last sweep.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[bytes, CachedCheck] = {}
+        self._live: dict[bytes, CachedCheck] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(content: str) -> bytes:
+        """Return the cache key for a message's text."""
+        return hashlib.blake2b(
+            content.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+
+    def lookup(self, content: str) -> CachedCheck | None:
+        """Return the cached outcome for a message, or None on a miss."""
+        key = self.key(content)
+        check = self._live.get(key) or self._entries.get(key)
+        if check is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._live[key] = check
+        return check
+
+    def store(self, content: str, check: CachedCheck) -> None:
+        """Record the outcome for a message."""
+        self._live[self.key(content)] = check
+
+    def flush(self) -> None:
+        """Do nothing; entries are never written anywhere."""
+
+    def sweep(self) -> None:
+        """Start a new generation, dropping entries unused in this one."""
+        self._entries = self._live
+        self._live = {}
+        self.hits = self.misses = 0
+
+
+class LintCache:
+    """
+    SQLite-backed cache of message lint results.
+
+    Writes are buffered and committed in a single short transaction by
+    `flush`, so concurrent writers only contend briefly for the database.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory holding the cache database; created if missing.
+    ruleset : str
+        Identifies the active lint rules. Entries written under one rule
+        set are never returned under another.
+    """
+
+    def __init__(self, directory: Path, ruleset: str) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / CACHE_FILENAME
+        self._salt = f"{tool_version()}\0{ruleset}\0".encode()
+        self._pending: dict[bytes, tuple[bytes, str, str | None, int | None]] = {}
+        import sqlite3
+
+        self._connection = sqlite3.connect(self.path, timeout=30.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            (schema_version,) = self._connection.execute(
+                "PRAGMA user_version"
+            ).fetchone()
+            if schema_version != _SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS lint_results")
+                self._connection.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+            self._connection.execute(_SCHEMA)
+
+    def key(self, content: str) -> bytes:
+        """Return the cache key for a message's text."""
+        digest = hashlib.blake2b(self._salt, digest_size=20)
+        digest.update(content.encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    def lookup(self, content: str) -> CachedCheck | None:
+        """
+        Look up the cached outcome for a message.
+
+        Parameters
+        ----------
+        content : str
+            The message text.
+
+        Returns
+        -------
+        CachedCheck or None
+            The cached outcome, or None on a cache miss.
+        """
+        key = self.key(content)
+        if (pending := self._pending.get(key)) is not None:
+            row = pending[1:]
+        else:
+            row = self._connection.execute(
+                "SELECT result, fixed_content, fix_succeeded"
+                " FROM lint_results WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+        result, fixed_content, fix_succeeded = row
+        return CachedCheck(
+            result,
+            fixed_content,
+            None if fix_succeeded is None else bool(fix_succeeded),
+        )
+
+    def store(self, content: str, check: CachedCheck) -> None:
+        """
+        Record the outcome for a message. Takes effect on the next `flush`.
+
+        Parameters
+        ----------
+        content : str
+            The message text.
+        check : CachedCheck
+            The outcome to record.
+        """
+        key = self.key(content)
+        self._pending[key] = (
+            key,
+            check.result,
+            check.fixed_content,
+            None if check.fix_succeeded is None else int(check.fix_succeeded),
+        )
+
+    def flush(self) -> None:
+        """Commit all buffered writes in one transaction."""
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO lint_results"
+                " (key, result, fixed_content, fix_succeeded) VALUES (?, ?, ?, ?)",
+                self._pending.values(),
+            )
+        self._pending.clear()
+
+    def close(self) -> None:
+        """Flush buffered writes and close the database."""
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> LintCache:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
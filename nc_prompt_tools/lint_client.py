@@ -0,0 +1,221 @@
+"""
+lint_client.py
+
+The ``prompt_lint`` entry point and the thin ``prompt_lint client``.
+
+``prompt_lint client`` exists to make frequent lint runs cheap, so its path
+to a running daemon imports nothing but `json`, `os`, `socket`, `stat` and
+`sys`: the command line is forwarded unparsed with the client's version, in
+a single request, and the daemon parses it, lints and returns the output to
+print. The linter itself is only imported to lint in-process, when no
+daemon is listening or the daemon refuses the run because it is a
+different version of nc-prompt-tools (as after an upgrade) that might lint
+differently.
+
+The socket must be in a directory that only the current user can access.
+Otherwise another local user could create the directory first and listen
+there, to see the files linted and answer with false results.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import stat
+import sys
+
+from . import _version
+
+# typing is only needed by type checkers, and costs a few ms to import
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import typing
+
+# How long a client waits for the daemon to accept a connection.
+_CONNECT_TIMEOUT = 0.5
+
+
+def default_socket_path() -> str:
+    """
+    Return the default daemon socket path.
+
+    Returns
+    -------
+    str
+        ``$PROMPT_LINT_SOCKET`` if set, otherwise ``prompt_lint.sock`` in a
+        per-user directory under ``$XDG_RUNTIME_DIR`` or the temp directory.
+    """
+    if socket_path := os.environ.get("PROMPT_LINT_SOCKET"):
+        return socket_path
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(runtime_dir, "nc-prompt-tools", "prompt_lint.sock")
+    temp_dir = next(
+        filter(None, map(os.environ.get, ("TMPDIR", "TEMP", "TMP"))), "/tmp"
+    )
+    return os.path.join(
+        temp_dir, f"nc-prompt-tools-{os.getuid()}", "prompt_lint.sock"
+    )
+
+
+class UnsafeSocketError(OSError):
+    """The socket's directory could be accessed by other users."""
+
+
+def check_socket_directory(socket_path: str | os.PathLike[str]) -> None:
+    """
+    Check that only the current user can access the socket's directory.
+
+    Parameters
+    ----------
+    socket_path : str or path-like
+        The daemon's socket.
+
+    Raises
+    ------
+    UnsafeSocketError
+        If the directory is not a real directory owned by the current user
+        with no permissions for group or others (such as mode 0700).
+    FileNotFoundError
+        If the directory does not exist.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    status = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(status.st_mode)
+        or status.st_uid != os.getuid()
+        or status.st_mode & 0o077
+    ):
+        raise UnsafeSocketError(
+            f"Refusing the lint daemon socket in {directory}: it must be a "
+            "directory owned by you that only you can access (mode 0700)"
+        )
+
+
+def send_request(
+    socket_path: str | os.PathLike[str], request: dict[str, typing.Any]
+) -> dict[str, typing.Any] | None:
+    """
+    Send one request to a daemon and wait for its response.
+
+    Parameters
+    ----------
+    socket_path : str or path-like
+        The daemon's socket.
+    request : dict
+        The request, as described in `lint_daemon`.
+
+    Returns
+    -------
+    dict or None
+        The response, or None if no daemon is listening on ``socket_path``.
+
+    Raises
+    ------
+    UnsafeSocketError
+        If other users could access the socket's directory, as for
+        `check_socket_directory`.
+    """
+    try:
+        check_socket_directory(socket_path)
+    except FileNotFoundError:
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(_CONNECT_TIMEOUT)
+        try:
+            connection.connect(os.fspath(socket_path))
+        except OSError:
+            return None
+        connection.settimeout(None)
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile("rb") as response:
+            line = response.readline()
+    return json.loads(line) if line else None
+
+
+def ping(socket_path: str | os.PathLike[str]) -> dict[str, typing.Any] | None:
+    """Return the daemon's ping response, or None if none is running."""
+    return send_request(socket_path, {"op": "ping"})
+
+
+def _socket_argument(argv: list[str]) -> str | None:
+    """Return the value of a ``--socket`` option in ``argv``, if any."""
+    for index, argument in enumerate(argv):
+        if argument == "--":
+            break
+        if argument == "--socket" and index + 1 < len(argv):
+            return argv[index + 1]
+        if argument.startswith("--socket="):
+            return argument.removeprefix("--socket=")
+    return None
+
+
+def _send_run(socket_path: str, argv: list[str]) -> dict[str, typing.Any] | None:
+    """
+    Send a lint run to the daemon.
+
+    Returns
+    -------
+    dict or None
+        The daemon's response, or None to lint in-process because no daemon
+        is listening or it runs a different version than the client.
+    """
+    request = {
+        "op": "run",
+        "version": _version.__version__,
+        "argv": argv,
+        "cwd": os.getcwd(),
+    }
+    match response := send_request(socket_path, request):
+        case {"ok": False, "version": str() as version}:
+            print(
+                f"Lint daemon is version {version}, client "
+                f"{_version.__version__}; linting in-process "
+                "(restart 'prompt_lint serve')",
+                file=sys.stderr,
+            )
+            return None
+    return response
+
+
+def client_main(argv: list[str]) -> typing.NoReturn:
+    """Entry point for ``prompt_lint client``."""
+    if not {"-h", "--help"}.intersection(argv):
+        socket_path = _socket_argument(argv) or default_socket_path()
+        try:
+            response = _send_run(socket_path, argv)
+        except UnsafeSocketError as e:
+            print(f"{e}; linting in-process", file=sys.stderr)
+            response = None
+        match response:
+            case None:
+                pass
+            case {"ok": True, "exit_code": int() as exit_code}:
+                sys.stdout.write(response.get("stdout", ""))
+                sys.stderr.write(response.get("stderr", ""))
+                exit(exit_code)
+            case _:
+                print(f"Lint daemon error: {response.get('error')}")
+                exit(8)
+
+    # No daemon (or help was asked for): lint in this process instead
+    from .lint_daemon import run_client
+
+    exit(run_client(argv))
+
+
+def main(argv: list[str] | None = None) -> typing.NoReturn:
+    """
+    Entry point for ``prompt_lint``.
+
+    ``prompt_lint client`` runs `client_main` without importing the linter;
+    everything else is handled by `prompt_lint.main`.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["client"]:
+        client_main(argv[1:])
+
+    from .prompt_lint import main as lint_main
+
+    lint_main(argv)
+    exit(0)
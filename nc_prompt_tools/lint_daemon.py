@@ -0,0 +1,399 @@
+"""
+lint_daemon.py
+
+A long-running lint daemon and its thin client.
+
+Editor and pre-commit integrations invoke the linter many times a minute,
+where interpreter start-up and imports can outweigh the lint itself.
+``prompt_lint serve`` keeps a pool of warm worker processes behind a Unix
+domain socket, and ``prompt_lint client`` (see `lint_client`) forwards lint
+runs to it, falling back to linting in-process when no daemon is listening.
+
+The protocol is newline-delimited JSON: each request is one JSON object on
+a line, answered by one JSON object on a line. Requests have an ``op``:
+
+``run``
+    Run ``prompt_lint client`` with the arguments in ``argv``, relative to
+    the working directory ``cwd``. The response carries the ``exit_code``
+    and the ``stdout`` and ``stderr`` text to show. ``version`` is the
+    client's nc-prompt-tools version; a daemon of another version fails
+    the request, with its own ``version`` in the response.
+``lint``
+    Lint files. ``paths`` lists absolute file paths; ``fix``, ``stream``,
+    ``cache_dir``, ``all_diagnostics``, ``fix_flow``, ``in_place``,
+    ``emit`` and ``compression_level`` mirror `LintOptions`. The response
+    carries one entry per path in ``reports``.
+``check``
+    Check message texts directly. ``messages`` lists the texts, ``fix``
+    requests fixes and ``fix_flow`` control-flow repairs. The response
+    carries one entry per message in ``results``.
+``ping``
+    Report the daemon's version.
+``shutdown``
+    Stop the daemon.
+
+Every response has ``ok``; failed requests also carry an ``error``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import contextlib
+import dataclasses
+import io
+import itertools
+import json
+import os
+import socketserver
+import threading
+import typing
+from pathlib import Path
+
+from ._version import tool_version
+from .lint_client import (
+    UnsafeSocketError,
+    check_socket_directory,
+    default_socket_path,
+    ping,
+)
+from .payload import DEFAULT_COMPRESSION_LEVEL
+from .prompt_lint import (
+    FileLintReport,
+    LintOptions,
+    OutputFormat,
+    build_parser,
+    expand_lint_paths,
+    lint_files,
+    options_from_args,
+    check_message,
+    parse_lint_args,
+    render_reports,
+)
+
+# Messages sent to a worker per task in a "check" request.
+_CHECK_BATCH_SIZE = 256
+
+
+def check_messages(
+    texts: list[str], fix: bool, fix_flow: bool = False
+) -> list[dict[str, typing.Any]]:
+    """
+    Check a batch of message texts.
+
+    Parameters
+    ----------
+    texts : list of str
+        The message texts.
+    fix : bool
+        Whether to attempt fixes.
+    fix_flow : bool, optional
+        Whether fixes also repair control flow.
+
+    Returns
+    -------
+    list of dict
+        For each message, the name of its `CheckFileBalanceResult` as
+        ``check``, plus ``fixed_content`` and ``fix_succeeded``.
+    """
+    return [
+        {
+            "check": diagnostic.check.name,
+            "fixed_content": diagnostic.fixed_content,
+            "fix_succeeded": diagnostic.fix_succeeded,
+        }
+        for diagnostic in (
+            check_message(text, fix, fix_flow=fix_flow) for text in texts
+        )
+    ]
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+def _report_to_json(report: FileLintReport) -> dict[str, typing.Any]:
+    return {
+        "path": str(report.path),
+        "exit_code": report.exit_code,
+        "success": report.result.success,
+        "had_changes": report.result.had_changes,
+        "output": report.output,
+    }
+
+
+class LintDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server that lints on a pool of warm worker processes.
+
+    Parameters
+    ----------
+    socket_path : Path
+        Where to listen. A stale socket left by a dead daemon is replaced.
+    jobs : int, optional
+        Number of worker processes; 0 uses one per CPU.
+
+    Raises
+    ------
+    RuntimeError
+        If another daemon is already listening on ``socket_path``, or if
+        other users could access its directory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, jobs: int = 0) -> None:
+        socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        try:
+            check_socket_directory(socket_path)
+        except UnsafeSocketError as e:
+            raise RuntimeError(str(e)) from None
+        if socket_path.exists():
+            if ping(socket_path) is not None:
+                raise RuntimeError(
+                    f"A lint daemon is already running on {socket_path}"
+                )
+            socket_path.unlink()
+        self.socket_path = socket_path
+        # Serialises the redirection of stdout and stderr by "run" requests
+        self._output_lock = threading.Lock()
+        workers = jobs or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        # Start every worker now so the first request doesn't pay for it
+        for _ in self.executor.map(_worker_pid, range(workers)):
+            pass
+        super().__init__(str(socket_path), _LintRequestHandler)
+
+    def handle_request_data(
+        self, request: dict[str, typing.Any]
+    ) -> dict[str, typing.Any]:
+        """Execute one decoded request and return its response."""
+        match request:
+            case {"op": "lint", "paths": list() as paths}:
+                cache_dir = request.get("cache_dir")
+                options = LintOptions(
+                    fix=bool(request.get("fix")),
+                    stream=bool(request.get("stream")),
+                    cache_dir=Path(cache_dir) if cache_dir else None,
+                    all_diagnostics=bool(request.get("all_diagnostics")),
+                    fix_flow=bool(request.get("fix_flow")),
+                    in_place=bool(request.get("in_place")),
+                    emit=OutputFormat(request.get("emit", OutputFormat.JSON)),
+                    compression_level=int(
+                        request.get("compression_level", DEFAULT_COMPRESSION_LEVEL)
+                    ),
+                )
+                reports = lint_files(
+                    [Path(path) for path in paths], options, executor=self.executor
+                )
+                return {
+                    "ok": True,
+                    "reports": [_report_to_json(report) for report in reports],
+                }
+            case {"op": "run"} if request.get("version") != tool_version():
+                return {
+                    "ok": False,
+                    "error": f"The daemon is version {tool_version()}",
+                    "version": tool_version(),
+                }
+            case {"op": "run", "argv": list() as argv, "cwd": str() as cwd}:
+                return self._run(argv, Path(cwd))
+            case {"op": "check", "messages": list() as texts}:
+                fix = bool(request.get("fix"))
+                fix_flow = bool(request.get("fix_flow"))
+                batches = [
+                    texts[i : i + _CHECK_BATCH_SIZE]
+                    for i in range(0, len(texts), _CHECK_BATCH_SIZE)
+                ]
+                results = itertools.chain.from_iterable(
+                    self.executor.map(
+                        check_messages,
+                        batches,
+                        itertools.repeat(fix),
+                        itertools.repeat(fix_flow),
+                    )
+                )
+                return {"ok": True, "results": list(results)}
+            case {"op": "ping"}:
+                return {"ok": True, "version": tool_version(), "pid": os.getpid()}
+            case {"op": "shutdown"}:
+                # shutdown() blocks until serve_forever() returns; reply first
+                threading.Thread(target=self.shutdown).start()
+                return {"ok": True}
+        return {"ok": False, "error": f"Unsupported request: {request!r}"}
+
+    def _run(self, argv: list[str], cwd: Path) -> dict[str, typing.Any]:
+        """Run a client command line, capturing what it prints."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        try:
+            with (
+                self._output_lock,
+                contextlib.redirect_stdout(stdout),
+                contextlib.redirect_stderr(stderr),
+            ):
+                args = parse_client_args(argv)
+            # Lint without holding the lock, so clients are served together
+            reports = lint_client_args(args, cwd, self.executor)
+            with self._output_lock, contextlib.redirect_stdout(stdout):
+                exit_code = render_client_reports(reports)
+        except SystemExit as e:
+            # Raised by argparse for bad arguments
+            exit_code = e.code if isinstance(e.code, int) else 2
+        return {
+            "ok": True,
+            "exit_code": exit_code,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+        with contextlib.suppress(FileNotFoundError):
+            self.socket_path.unlink()
+
+
+class _LintRequestHandler(socketserver.StreamRequestHandler):
+    server: LintDaemon
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                response = self.server.handle_request_data(json.loads(line))
+            except Exception as e:  # report failures to the client, keep serving
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+def serve_main(argv: list[str]) -> typing.NoReturn:
+    """Entry point for ``prompt_lint serve``."""
+    parser = argparse.ArgumentParser(
+        prog="prompt_lint serve",
+        description="Run a lint daemon that 'prompt_lint client' forwards to.",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Unix socket to listen on (default: %(default)s).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Number of warm worker processes (default: one per CPU).",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error("--jobs must be zero or a positive integer")
+
+    try:
+        daemon = LintDaemon(args.socket, args.jobs)
+    except RuntimeError as e:
+        print(e)
+        exit(8)
+    print(f"Listening on {args.socket}")
+    with daemon:
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    exit(0)
+
+
+def build_client_parser() -> argparse.ArgumentParser:
+    """Return the argument parser for ``prompt_lint client``."""
+    parser = build_parser(
+        prog="prompt_lint client",
+        description=(
+            "Lint files through a running 'prompt_lint serve' daemon, or "
+            "in-process if none is running."
+        ),
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Unix socket of the daemon (default: %(default)s).",
+    )
+    return parser
+
+
+def parse_client_args(argv: list[str]) -> argparse.Namespace:
+    """Parse and validate the arguments of ``prompt_lint client``."""
+    parser = build_client_parser()
+    args = parse_lint_args(parser, argv)
+    if args.watch:
+        parser.error("--watch is not supported by the client")
+    if args.stats or args.trace:
+        parser.error("--stats and --trace are not supported by the client")
+    return args
+
+
+def lint_client_args(
+    args: argparse.Namespace,
+    cwd: Path,
+    executor: concurrent.futures.Executor | None = None,
+) -> list[FileLintReport]:
+    """
+    Lint the files named by parsed client arguments.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments from `parse_client_args`.
+    cwd : Path
+        The client's working directory, against which relative paths are
+        resolved.
+    executor : concurrent.futures.Executor, optional
+        The daemon's worker pool; without one, ``--jobs`` is honoured.
+
+    Returns
+    -------
+    list of FileLintReport
+        One report per file, with paths under ``cwd`` shown relative to it.
+    """
+    paths = expand_lint_paths(os.path.join(cwd, spec) for spec in args.files)
+    options = options_from_args(args)
+    if options.cache_dir is not None:
+        options = dataclasses.replace(options, cache_dir=cwd / options.cache_dir)
+    return [
+        dataclasses.replace(
+            report,
+            path=report.path.relative_to(cwd)
+            if report.path.is_relative_to(cwd)
+            else report.path,
+        )
+        for report in lint_files(paths, options, args.jobs, executor)
+    ]
+
+
+def render_client_reports(reports: list[FileLintReport]) -> int:
+    """Print the output of a client run and return its exit code."""
+    if not reports:
+        print("No prompt files found")
+        return 8
+    return render_reports(reports)
+
+
+def run_client(argv: list[str]) -> int:
+    """
+    Run ``prompt_lint client`` in this process, without a daemon.
+
+    Returns
+    -------
+    int
+        The exit code.
+    """
+    args = parse_client_args(argv)
+    return render_client_reports(lint_client_args(args, Path.cwd()))
+
+
+def client_main(argv: list[str]) -> typing.NoReturn:
+    """Entry point for ``prompt_lint client``; see `lint_client.client_main`."""
+    from .lint_client import client_main
+
+    client_main(argv)
@@ -0,0 +1,666 @@
+"""
+lsp.py
+
+A Language Server Protocol server for Novelcrafter prompt JSON.
+
+``nc-prompt-lsp`` speaks LSP over stdio and publishes the problems found by
+`collect_balance_issues` in each message's ``text`` as diagnostics, placed
+on the offending characters of the JSON source.
+
+Documents are synchronised incrementally. An edit that stays inside one
+message's ``text`` string, as almost every keystroke does, re-decodes that
+message alone and shifts the positions of the others. The message is then
+kept as a `PromptDocument`, so that its later edits only re-lex the braced
+expressions around them. Any other edit re-scans the document structure,
+but messages whose text is unchanged reuse their earlier results.
+Diagnostics are published once a burst of edits has settled, so large
+bundles stay responsive while typing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import dataclasses
+import functools
+import json
+import json.decoder
+import os
+import re
+import selectors
+import sys
+import time
+import typing
+
+from ._version import tool_version
+from .json_stream import (
+    JSONStreamError,
+    PromptShapeError,
+    iter_message_text_spans,
+)
+from .prompt_lint import BalanceIssue, PromptDocument, collect_balance_issues
+
+# Seconds to wait after the last edit before publishing diagnostics.
+DEFAULT_DEBOUNCE = 0.2
+
+# JSON-RPC error codes.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+
+# LSP constants.
+_SYNC_INCREMENTAL = 2
+_SEVERITY_ERROR = 1
+
+_NEWLINE = re.compile(r"\n")
+_HEADER_END = b"\r\n\r\n"
+_READ_SIZE = 64 * 1024
+
+
+class LspError(Exception):
+    """
+    Raised by a request handler to answer with a JSON-RPC error.
+
+    Parameters
+    ----------
+    code : int
+        The JSON-RPC error code.
+    message : str
+        A description of the error.
+    """
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+@functools.lru_cache(maxsize=4096)
+def message_issues(content: str) -> tuple[BalanceIssue, ...]:
+    """Return the problems in a message's text, memoised by the text."""
+    return tuple(collect_balance_issues(content))
+
+
+# A JSON string escape; a surrogate pair decodes to a single code point.
+_ESCAPE = re.compile(
+    r"\\(?:u[dD][89abAB][0-9a-fA-F]{2}\\u[dD][c-fC-F][0-9a-fA-F]{2}|u.{4}|.)"
+)
+
+
+def _utf16_length(text: str) -> int:
+    """Return the length of ``text`` in UTF-16 code units."""
+    return len(text) if text.isascii() else len(text.encode("utf-16-le")) // 2
+
+
+def _decoded_length(source: str, start: int, end: int) -> int:
+    """
+    Return the length of ``source[start:end]`` decoded as JSON string content.
+
+    Returns -1 if it does not decode, as when it ends inside an escape.
+    """
+    try:
+        content, _ = json.decoder.scanstring(source[start:end] + '"', 0)
+    except json.JSONDecodeError:
+        return -1
+    return len(content)
+
+
+@dataclasses.dataclass(slots=True)
+class _MessageText:
+    """A message's decoded text and the source span of its string literal."""
+
+    # Source offsets of the opening quote and just past the closing quote
+    start: int
+    end: int
+    content: str
+    # (decoded index, offset from start) where the two stop advancing
+    # together, in pairs for the start and end of each escape; computed
+    # when first needed
+    escapes: list[tuple[int, int]] | None = None
+    # The parsed content, once the message has been edited
+    document: PromptDocument | None = None
+
+    def issues(self) -> typing.Sequence[BalanceIssue]:
+        """Return the problems in the message's text."""
+        if self.document is None:
+            return message_issues(self.content)
+        return self.document.issues()
+
+    def edit(self, source: str, start: int, end: int, delta: int, content: str) -> None:
+        """
+        Apply an edit inside the string literal.
+
+        The first edit parses the message into `document`. Later ones are
+        applied to it with `PromptDocument.edit`: the text before and after
+        the edit decodes as it did, which gives the decoded span replaced.
+
+        Parameters
+        ----------
+        source : str
+            The document's JSON text, after the edit.
+        start, end : int
+            The span of the text before the edit that was replaced.
+        delta : int
+            The change in the length of the text.
+        content : str
+            The message text decoded after the edit.
+        """
+        self.end += delta
+        head = _decoded_length(source, self.start + 1, start)
+        tail = _decoded_length(source, end + delta, self.end - 1)
+        aligned = head >= 0 and tail >= 0
+        if (document := self.document) is not None and aligned:
+            old_length = len(self.content)
+            if head + tail <= min(old_length, len(content)):
+                document.edit(
+                    head, old_length - tail, content[head : len(content) - tail]
+                )
+        # An edit that cuts into or forms an escape can still decode at both
+        # ends, so the edited document is checked
+        if document is None or document.content != content:
+            self.document = PromptDocument(content)
+
+        if self.escapes is not None and aligned:
+            self.escapes = self._edit_escapes(
+                source, start, end, delta, content, head, tail
+            )
+        else:
+            self.escapes = None
+        self.content = content
+
+    def _scan_escapes(
+        self, source: str, start: int, end: int, decoded: int
+    ) -> tuple[list[tuple[int, int]], int] | None:
+        """
+        Find the `escapes` entries for ``source[start:end]``.
+
+        ``start`` must not be inside an escape, and ``decoded`` is the
+        decoded index there. Returns the entries and the decoded index at
+        ``end``, or None if an escape crosses ``end``.
+        """
+        escapes = []
+        previous = start
+        for found in _ESCAPE.finditer(source, start, self.end - 1):
+            if found.start() >= end:
+                break
+            if found.end() > end:
+                return None
+            decoded += found.start() - previous
+            escapes.append((decoded, found.start() - self.start))
+            decoded += 1
+            previous = found.end()
+            escapes.append((decoded, previous - self.start))
+        return escapes, decoded + end - previous
+
+    def _edit_escapes(
+        self,
+        source: str,
+        start: int,
+        end: int,
+        delta: int,
+        content: str,
+        head: int,
+        tail: int,
+    ) -> list[tuple[int, int]] | None:
+        """
+        Return `escapes` updated for an edit, rescanning only the edited text.
+
+        Takes the arguments of `edit` and the decoded lengths before and
+        after the edited text. Returns None if an escape crosses either end
+        of the edit.
+        """
+        escapes = self.escapes
+        assert escapes is not None
+        pairs = range(len(escapes) // 2)
+        # The escapes wholly before and wholly after the replaced text
+        first = bisect.bisect_right(
+            pairs, start - self.start, key=lambda k: escapes[2 * k + 1][1]
+        )
+        last = bisect.bisect_left(
+            pairs, end - self.start, key=lambda k: escapes[2 * k][1]
+        )
+        if (first < len(pairs) and escapes[2 * first][1] < start - self.start) or (
+            last and escapes[2 * last - 1][1] > end - self.start
+        ):
+            return None
+        if (scanned := self._scan_escapes(source, start, end + delta, head)) is None:
+            return None
+        entries, edited_end = scanned
+        if edited_end != len(content) - tail:
+            return None
+        shift = len(content) - len(self.content)
+        later = [
+            (decoded + shift, relative + delta)
+            for decoded, relative in escapes[2 * last :]
+        ]
+        return escapes[: 2 * first] + entries + later
+
+    def source_offset(self, source: str, index: int) -> int:
+        """Return the source offset of the decoded character at ``index``."""
+        if self.escapes is None:
+            scanned = self._scan_escapes(source, self.start + 1, self.end - 1, 0)
+            assert scanned is not None
+            self.escapes, _ = scanned
+        i = bisect.bisect_right(self.escapes, (index, sys.maxsize)) - 1
+        if i < 0:
+            return self.start + 1 + index
+        decoded, relative = self.escapes[i]
+        return self.start + relative + index - decoded
+
+
+class PromptTextDocument:
+    """
+    An open prompt document, kept in sync with the editor's copy.
+
+    Parameters
+    ----------
+    text : str
+        The document's JSON text.
+    version : int
+        The editor's version number for ``text``.
+
+    Attributes
+    ----------
+    rechecked : int
+        Messages decoded and checked again since the document was opened,
+        for diagnostics and tests.
+    """
+
+    def __init__(self, text: str, version: int) -> None:
+        self.version = version
+        self.rechecked = 0
+        self._set_text(text)
+
+    def _set_text(self, text: str) -> None:
+        self.text = text
+        # Whether the text may have characters of two UTF-16 code units; if
+        # not, positions are plain offsets into their line
+        self._wide = _utf16_length(text) != len(text)
+        self._line_starts = [0]
+        self._line_starts.extend(m.end() for m in _NEWLINE.finditer(text))
+        self._messages: list[_MessageText] | None = None
+        self._error: tuple[int, str] | None = None
+
+    def offset_at(self, position: dict[str, int]) -> int:
+        """Return the offset of an LSP (UTF-16) position, clamped to the text."""
+        line = position["line"]
+        if line >= len(self._line_starts):
+            return len(self.text)
+        start = self._line_starts[line]
+        end = (
+            self._line_starts[line + 1]
+            if line + 1 < len(self._line_starts)
+            else len(self.text)
+        )
+        character = position["character"]
+        if not self._wide:
+            return start + min(character, end - start)
+        # A message's text is on a single line, so only look at as many
+        # characters as there are code units before the position
+        text = self.text[start : min(end, start + character)]
+        units = text.encode("utf-16-le")[: 2 * character]
+        return start + len(units.decode("utf-16-le", "ignore"))
+
+    def position_at(self, offset: int) -> dict[str, int]:
+        """Return the LSP (UTF-16) position of an offset."""
+        line = bisect.bisect_right(self._line_starts, offset) - 1
+        start = self._line_starts[line]
+        if not self._wide:
+            return {"line": line, "character": offset - start}
+        return {"line": line, "character": _utf16_length(self.text[start:offset])}
+
+    def apply_change(self, change: dict[str, typing.Any]) -> None:
+        """
+        Apply one ``TextDocumentContentChangeEvent``.
+
+        Parameters
+        ----------
+        change : dict
+            Either a ranged edit or a replacement of the whole text.
+        """
+        if (edit_range := change.get("range")) is None:
+            self._set_text(change["text"])
+            return
+
+        start = self.offset_at(edit_range["start"])
+        end = max(start, self.offset_at(edit_range["end"]))
+        replacement = change["text"]
+        delta = len(replacement) - (end - start)
+        self.text = self.text[:start] + replacement + self.text[end:]
+        self._wide = self._wide or _utf16_length(replacement) != len(replacement)
+
+        # Replace the line starts inside the edit and shift those after it
+        first = bisect.bisect_right(self._line_starts, start)
+        last = bisect.bisect_right(self._line_starts, end)
+        self._line_starts[first:] = [
+            start + m.end() for m in _NEWLINE.finditer(replacement)
+        ] + [offset + delta for offset in self._line_starts[last:]]
+
+        if self._messages is not None and not self._edit_message(start, end, delta):
+            self._messages = None
+
+    def _edit_message(self, start: int, end: int, delta: int) -> bool:
+        """Update the message whose text contains an edit, if there is one."""
+        messages = self._messages
+        i = bisect.bisect_left(messages, start, key=lambda message: message.start) - 1
+        if i < 0 or not (messages[i].start < start and end < messages[i].end):
+            return False
+        message = messages[i]
+        try:
+            content, string_end = json.decoder.scanstring(self.text, message.start + 1)
+        except json.JSONDecodeError:
+            return False
+        if string_end != message.end + delta:
+            # The edit changed where the string ends
+            return False
+
+        message.edit(self.text, start, end, delta, content)
+        self.rechecked += 1
+        for later in messages[i + 1 :]:
+            later.start += delta
+            later.end += delta
+        return True
+
+    def _scan(self) -> list[_MessageText]:
+        """
+        Locate and decode every message text in the document.
+
+        If the document is not a well-formed prompt, the problem is kept in
+        ``_error`` and the next call scans again.
+        """
+        if self._messages is not None:
+            return self._messages
+        messages = []
+        try:
+            for span in iter_message_text_spans(self.text):
+                content, _ = json.decoder.scanstring(self.text, span.start + 1)
+                messages.append(_MessageText(span.start, span.end, content))
+        except JSONStreamError as e:
+            self._error = (e.offset or 0, f"Invalid JSON: {e}")
+            return []
+        except (PromptShapeError, json.JSONDecodeError) as e:
+            self._error = (0, str(e))
+            return []
+        self._error = None
+        self.rechecked += len(messages)
+        self._messages = messages
+        return messages
+
+    def diagnostics(self) -> list[dict[str, typing.Any]]:
+        """Return the document's LSP diagnostics."""
+        messages = self._scan()
+        if self._error is not None:
+            offset, text = self._error
+            return [self._diagnostic(offset, offset, text, None)]
+
+        diagnostics = []
+        for message in messages:
+            for issue in message.issues():
+                diagnostics.append(
+                    self._diagnostic(
+                        message.source_offset(self.text, issue.offset),
+                        message.source_offset(self.text, issue.offset + 1),
+                        issue.message,
+                        issue.kind.name,
+                    )
+                )
+        return diagnostics
+
+    def _diagnostic(
+        self, start: int, end: int, message: str, code: str | None
+    ) -> dict[str, typing.Any]:
+        diagnostic = {
+            "range": {"start": self.position_at(start), "end": self.position_at(end)},
+            "severity": _SEVERITY_ERROR,
+            "source": "prompt_lint",
+            "message": message,
+        }
+        if code is not None:
+            diagnostic["code"] = code
+        return diagnostic
+
+
+class _FrameDecoder:
+    """Split a byte stream into LSP base-protocol message bodies."""
+
+    def __init__(self) -> None:
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> typing.Iterator[bytes]:
+        self._buffer += data
+        while (header_end := self._buffer.find(_HEADER_END)) >= 0:
+            length = None
+            for line in self._buffer[:header_end].split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            if length is None:
+                raise ValueError("LSP message without a Content-Length header")
+            body_start = header_end + len(_HEADER_END)
+            if len(self._buffer) < body_start + length:
+                return
+            yield self._buffer[body_start : body_start + length]
+            self._buffer = self._buffer[body_start + length :]
+
+
+class LanguageServer:
+    """
+    An LSP server for prompt documents.
+
+    Parameters
+    ----------
+    output : binary file object
+        Where responses and notifications are written.
+    debounce : float, optional
+        Seconds to wait after the last change to a document before
+        publishing its diagnostics.
+    clock : callable, optional
+        The time source, for tests.
+    """
+
+    def __init__(
+        self,
+        output: typing.BinaryIO,
+        debounce: float = DEFAULT_DEBOUNCE,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._output = output
+        self._debounce = debounce
+        self._clock = clock
+        self.documents: dict[str, PromptTextDocument] = {}
+        # Documents with diagnostics to publish, and when to publish them
+        self._pending: dict[str, float] = {}
+        self._shutdown = False
+        self.exit_code: int | None = None
+
+    def send(self, message: dict[str, typing.Any]) -> None:
+        """Write one JSON-RPC message."""
+        body = json.dumps({"jsonrpc": "2.0", **message}).encode("utf-8")
+        self._output.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        self._output.flush()
+
+    def handle(self, message: typing.Any) -> None:
+        """Dispatch one decoded JSON-RPC request or notification."""
+        if not isinstance(message, dict):
+            self.send(
+                {
+                    "id": None,
+                    "error": {
+                        "code": INVALID_REQUEST,
+                        "message": "A message must be a JSON object",
+                    },
+                }
+            )
+            return
+        method = message.get("method")
+        params = message.get("params") or {}
+        is_request = "id" in message
+        try:
+            if not isinstance(method, str):
+                raise LspError(INVALID_REQUEST, "Missing method")
+            result = self._dispatch(method, params, is_request)
+        except LspError as e:
+            if is_request:
+                self.send(
+                    {
+                        "id": message["id"],
+                        "error": {"code": e.code, "message": str(e)},
+                    }
+                )
+            return
+        except Exception as e:  # report failures to the client, keep serving
+            if is_request:
+                self.send(
+                    {
+                        "id": message["id"],
+                        "error": {
+                            "code": INTERNAL_ERROR,
+                            "message": f"{type(e).__name__}: {e}",
+                        },
+                    }
+                )
+            return
+        if is_request:
+            self.send({"id": message["id"], "result": result})
+
+    def _dispatch(
+        self, method: str, params: dict[str, typing.Any], is_request: bool
+    ) -> typing.Any:
+        match method:
+            case "initialize":
+                return {
+                    "capabilities": {
+                        "positionEncoding": "utf-16",
+                        "textDocumentSync": {
+                            "openClose": True,
+                            "change": _SYNC_INCREMENTAL,
+                        },
+                    },
+                    "serverInfo": {"name": "nc-prompt-lsp", "version": tool_version()},
+                }
+            case "shutdown":
+                self._shutdown = True
+                return None
+            case "exit":
+                self.exit_code = 0 if self._shutdown else 1
+            case "textDocument/didOpen":
+                document = params["textDocument"]
+                self.documents[document["uri"]] = PromptTextDocument(
+                    document["text"], document.get("version", 0)
+                )
+                self._pending[document["uri"]] = self._clock()
+            case "textDocument/didChange":
+                uri = params["textDocument"]["uri"]
+                if (document := self.documents.get(uri)) is None:
+                    return None
+                for change in params["contentChanges"]:
+                    document.apply_change(change)
+                document.version = params["textDocument"].get("version")
+                self._pending[uri] = self._clock() + self._debounce
+            case "textDocument/didClose":
+                uri = params["textDocument"]["uri"]
+                self.documents.pop(uri, None)
+                self._pending.pop(uri, None)
+                self.send(
+                    {
+                        "method": "textDocument/publishDiagnostics",
+                        "params": {"uri": uri, "diagnostics": []},
+                    }
+                )
+            case _ if is_request:
+                raise LspError(METHOD_NOT_FOUND, f"Unsupported method: {method}")
+        return None
+
+    def next_deadline(self) -> float | None:
+        """Return when diagnostics are next due, or None if none are pending."""
+        return min(self._pending.values(), default=None)
+
+    def publish_due(self) -> None:
+        """Publish diagnostics for documents whose debounce has expired."""
+        now = self._clock()
+        for uri in [uri for uri, due in self._pending.items() if due <= now]:
+            del self._pending[uri]
+            document = self.documents[uri]
+            self.send(
+                {
+                    "method": "textDocument/publishDiagnostics",
+                    "params": {
+                        "uri": uri,
+                        "version": document.version,
+                        "diagnostics": document.diagnostics(),
+                    },
+                }
+            )
+
+    def serve(self, input_fd: int) -> int:
+        """
+        Serve requests read from a file descriptor until told to exit.
+
+        Parameters
+        ----------
+        input_fd : int
+            The descriptor to read LSP messages from, normally stdin.
+
+        Returns
+        -------
+        int
+            The exit code: 0 after an orderly shutdown, 1 otherwise.
+        """
+        decoder = _FrameDecoder()
+        with selectors.DefaultSelector() as selector:
+            selector.register(input_fd, selectors.EVENT_READ)
+            while self.exit_code is None:
+                timeout = None
+                if (deadline := self.next_deadline()) is not None:
+                    timeout = max(0.0, deadline - self._clock())
+                if selector.select(timeout):
+                    if not (data := os.read(input_fd, _READ_SIZE)):
+                        # The client went away without saying goodbye
+                        return 1
+                    for body in decoder.feed(data):
+                        try:
+                            message = json.loads(body)
+                        except json.JSONDecodeError as e:
+                            self.send(
+                                {
+                                    "id": None,
+                                    "error": {"code": PARSE_ERROR, "message": str(e)},
+                                }
+                            )
+                            continue
+                        self.handle(message)
+                self.publish_due()
+        return self.exit_code
+
+
+def main(argv: list[str] | None = None) -> typing.NoReturn:
+    """Entry point for ``nc-prompt-lsp``."""
+    parser = argparse.ArgumentParser(
+        prog="nc-prompt-lsp",
+        description="Serve prompt lint diagnostics over the Language Server Protocol.",
+    )
+    parser.add_argument(
+        "--stdio",
+        action="store_true",
+        help="Communicate over stdin and stdout (the default and only transport).",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        metavar="SECONDS",
+        help=(
+            "Wait this long after the last edit before publishing diagnostics "
+            "(default: %(default)s)."
+        ),
+    )
+    args = parser.parse_args(argv)
+    if args.debounce < 0:
+        parser.error("--debounce must not be negative")
+
+    server = LanguageServer(sys.stdout.buffer, args.debounce)
+    exit(server.serve(sys.stdin.buffer.fileno()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+paren_batch.py
+
+A vectorised engine that checks parenthesis balance for many expressions at
+once.
+
+All expressions are packed into a single ``uint8`` array of UTF-8 bytes,
+mapped to +1/-1/0 depth deltas and summed cumulatively. An expression is
+balanced if its depth returns to where it started and never dips below
+that starting depth, which `numpy.minimum.reduceat` decides for every
+expression in one call.
+
+NumPy is an optional dependency (install the ``numpy`` extra). Without it,
+the engine falls back to `prompt_lint.check_parentheses_balance`.
+
+This is a library API, timed by the benchmark suite. ``prompt_lint`` does
+not use it, as it checks each expression while parsing a message.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from .prompt_lint import check_parentheses_balance, iter_braced_spans
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+HAVE_NUMPY = np is not None
+
+if np is not None:
+    # Depth change contributed by each byte value. '(' and ')' are ASCII and
+    # never occur inside a multi-byte UTF-8 sequence.
+    _DELTAS = np.zeros(256, dtype=np.int8)
+    _DELTAS[ord("(")] = 1
+    _DELTAS[ord(")")] = -1
+
+
+def _check_batch_numpy(expressions: typing.Sequence[str]) -> list[bool]:
+    encoded = [expr.encode("utf-8", "surrogatepass") for expr in expressions]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    # depth[i] is the running depth before byte i; depth[-1] after the last
+    depth = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum(_DELTAS[data], out=depth[1:])
+
+    base = depth[starts]
+    balanced = depth[ends] == base
+
+    # Segment minima over each non-empty expression's bytes. Empty
+    # expressions take no bytes, so the remaining starts are contiguous
+    # segment boundaries as reduceat expects.
+    if (nonempty := lengths > 0).any():
+        minima = np.minimum.reduceat(depth[1:], starts[nonempty])
+        balanced[nonempty] &= minima >= base[nonempty]
+
+    return balanced.tolist()
+
+
+def check_parentheses_balance_batch(
+    expressions: typing.Sequence[str], use_numpy: bool | None = None
+) -> list[bool]:
+    """
+    Check parenthesis balance for many expressions in one call.
+
+    Parameters
+    ----------
+    expressions : sequence of str
+        The expressions, for example every braced expression in a document
+        or a whole corpus.
+    use_numpy : bool, optional
+        Force (True) or disable (False) the vectorised engine. By default it
+        is used whenever NumPy is installed.
+
+    Returns
+    -------
+    list of bool
+        For each expression, whether its parentheses are balanced, exactly
+        as `check_parentheses_balance` would report.
+
+    Raises
+    ------
+    ModuleNotFoundError
+        If ``use_numpy`` is True but NumPy is not installed.
+    """
+    if use_numpy is None:
+        use_numpy = HAVE_NUMPY
+    elif use_numpy and not HAVE_NUMPY:
+        raise ModuleNotFoundError(
+            "NumPy is required for the vectorised engine; "
+            "install nc-prompt-tools[numpy]"
+        )
+    if not use_numpy or not expressions:
+        return [check_parentheses_balance(expression) for expression in expressions]
+    return _check_batch_numpy(expressions)
+
+
+def check_documents_parentheses(
+    contents: typing.Iterable[str], use_numpy: bool | None = None
+) -> list[list[bool]]:
+    """
+    Check the parentheses of every braced expression in many messages.
+
+    Parameters
+    ----------
+    contents : iterable of str
+        Message texts. Their braces must be well formed.
+    use_numpy : bool, optional
+        As for `check_parentheses_balance_batch`.
+
+    Returns
+    -------
+    list of list of bool
+        For each message, the balance of each of its braced expressions in
+        order.
+
+    Raises
+    ------
+    IllegalNestingError, BraceMismatchError
+        If a message's braces are not well formed.
+    """
+    expressions: list[str] = []
+    counts: list[int] = []
+    for content in contents:
+        before = len(expressions)
+        expressions.extend(
+            content[start_idx + 1 : end_idx]
+            for start_idx, end_idx in iter_braced_spans(content)
+        )
+        counts.append(len(expressions) - before)
+
+    flags = check_parentheses_balance_batch(expressions, use_numpy)
+    results: list[list[bool]] = []
+    position = 0
+    for count in counts:
+        results.append(flags[position : position + count])
+        position += count
+    return results
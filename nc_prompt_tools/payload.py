@@ -0,0 +1,230 @@
+"""
+payload.py
+
+Streaming decoder for Novelcrafter gzip+base64 prompt payloads.
+
+Novelcrafter copies prompts to the clipboard as base64-encoded gzip data.
+Rather than shelling out to ``base64 -d | gunzip`` (or ``gzip | base64``),
+the helpers here decode and encode such payloads in-process, in
+bounded-size chunks, so memory use does not grow with the size of the
+export.
+"""
+
+from __future__ import annotations
+
+import binascii
+import io
+import typing
+import zlib
+from pathlib import Path
+
+# Suffix of files holding gzip+base64 payloads.
+PAYLOAD_SUFFIX = ".b64"
+
+# Every gzip stream starts with 1f 8b 08, which base64-encodes to "H4sI".
+_GZIP_BASE64_MAGIC = b"H4sI"
+
+_BASE64_WHITESPACE = b" \t\r\n\v\f"
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# The gzip command's default level.
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Raw bytes per line of base64 output: 57 bytes encode to 76 characters,
+# the line length used by the base64 command.
+_BASE64_LINE_BYTES = 57
+
+
+class PayloadError(ValueError):
+    """Raised when a payload is not valid gzip+base64 data."""
+
+
+def is_base64_payload(path: Path) -> bool:
+    """
+    Decide whether a file holds a gzip+base64 payload rather than JSON.
+
+    Parameters
+    ----------
+    path : Path
+        The file to inspect.
+
+    Returns
+    -------
+    bool
+        True if the file has the ``.b64`` suffix, or if its content starts
+        with the base64 encoding of the gzip magic number.
+    """
+    if path.suffix.lower() == PAYLOAD_SUFFIX:
+        return True
+    with path.open("rb") as f:
+        head = f.read(64).lstrip(_BASE64_WHITESPACE)
+    return head.startswith(_GZIP_BASE64_MAGIC)
+
+
+def iter_decoded_payload(
+    stream: typing.BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> typing.Iterator[bytes]:
+    """
+    Decode a gzip+base64 stream incrementally.
+
+    Base64 text is read ``chunk_size`` bytes at a time, decoded, and fed
+    through a gzip decompressor whose output is also capped at
+    ``chunk_size`` bytes per step, so neither the encoded nor the decoded
+    document is ever held in memory as a whole.
+
+    Parameters
+    ----------
+    stream : binary file object
+        Source of the base64 text. Line breaks and other whitespace are
+        ignored.
+    chunk_size : int, optional
+        Upper bound on the size of each read and each yielded chunk.
+
+    Yields
+    ------
+    bytes
+        Successive pieces of the decompressed payload.
+
+    Raises
+    ------
+    PayloadError
+        If the input is not valid base64, not valid gzip data, or is
+        truncated.
+    """
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    carry = b""
+
+    def inflate(data: bytes) -> typing.Iterator[bytes]:
+        while data and not decompressor.eof:
+            try:
+                piece = decompressor.decompress(data, chunk_size)
+            except zlib.error as e:
+                raise PayloadError(f"Invalid gzip data: {e}") from e
+            if piece:
+                yield piece
+            data = decompressor.unconsumed_tail
+
+    while encoded := stream.read(chunk_size):
+        encoded = carry + encoded.translate(None, _BASE64_WHITESPACE)
+        # Base64 decodes in groups of four characters; carry the remainder
+        usable = len(encoded) - len(encoded) % 4
+        carry = encoded[usable:]
+        try:
+            decoded = binascii.a2b_base64(encoded[:usable], strict_mode=True)
+        except binascii.Error as e:
+            raise PayloadError(f"Invalid base64 data: {e}") from e
+        yield from inflate(decoded)
+
+    if carry:
+        raise PayloadError("Invalid base64 data: truncated input")
+    if not decompressor.eof:
+        raise PayloadError("Invalid gzip data: truncated input")
+
+
+class PayloadReader(io.RawIOBase):
+    """
+    A readable binary stream over the decoded contents of a payload.
+
+    Parameters
+    ----------
+    stream : binary file object
+        The gzip+base64 source, as for `iter_decoded_payload`.
+    chunk_size : int, optional
+        Decoding chunk size, as for `iter_decoded_payload`.
+    """
+
+    def __init__(
+        self, stream: typing.BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> None:
+        self._source = stream
+        self._chunks = iter_decoded_payload(stream, chunk_size)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: typing.Any) -> int:
+        while not self._pending:
+            if (chunk := next(self._chunks, None)) is None:
+                return 0
+            self._pending = memoryview(chunk)
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+    def close(self) -> None:
+        if not self.closed:
+            self._source.close()
+        super().close()
+
+
+def open_payload(
+    path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> io.BufferedReader:
+    """
+    Open a gzip+base64 payload file for reading its decoded contents.
+
+    Parameters
+    ----------
+    path : Path
+        The payload file.
+    chunk_size : int, optional
+        Decoding chunk size, as for `iter_decoded_payload`.
+
+    Returns
+    -------
+    io.BufferedReader
+        A buffered binary stream of the decompressed payload.
+    """
+    return io.BufferedReader(
+        PayloadReader(path.open("rb"), chunk_size), buffer_size=chunk_size
+    )
+
+
+def iter_encoded_payload(
+    chunks: typing.Iterable[bytes],
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+) -> typing.Iterator[bytes]:
+    """
+    Encode data as a gzip+base64 payload incrementally.
+
+    The data is fed through a gzip compressor and its output is base64
+    encoded as it is produced, so only the compressor's state and one
+    partial line are ever held in memory. The output matches
+    ``gzip | base64``: lines of 76 characters, each ending in a newline.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+        Successive pieces of the data to encode.
+    compression_level : int, optional
+        The gzip compression level, from 0 (none) to 9 (best).
+
+    Yields
+    ------
+    bytes
+        Successive pieces of the base64 text.
+    """
+    compressor = zlib.compressobj(
+        compression_level, zlib.DEFLATED, zlib.MAX_WBITS | 16
+    )
+    carry = b""
+
+    def encode(compressed: bytes, final: bool = False) -> typing.Iterator[bytes]:
+        nonlocal carry
+        data = carry + compressed
+        # Only whole lines are encoded until the end of the data
+        usable = len(data) if final else len(data) - len(data) % _BASE64_LINE_BYTES
+        carry = data[usable:]
+        if usable:
+            yield b"".join(
+                binascii.b2a_base64(data[i : i + _BASE64_LINE_BYTES])
+                for i in range(0, usable, _BASE64_LINE_BYTES)
+            )
+
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield from encode(compressed)
+    yield from encode(compressor.flush(), final=True)
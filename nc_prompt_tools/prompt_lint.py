@@ -8,8 +8,9 @@ A script that checks if a given file contains:
    {#if (...)} ... {#else} ... {#endif}
    (including nested if/else statements).
 
-Optionally, it attempts a naive fix for one common exporter bug that
-strips out a final parenthesis before a break.
+Optionally, it repairs unbalanced parentheses, including those left by
+one common exporter bug that strips out a final parenthesis before a
+break.
 
 This script uses Python 3.13 features (including modern type hints) and
 adheres to best practices and PEP standards.
@@ -17,15 +18,53 @@ adheres to best practices and PEP standards.
 
 from __future__ import annotations
 
+import bisect
+import contextlib
 import dataclasses
 import enum
+import functools
+import glob
+import io
+import itertools
 import json
+import os
 import re
+import sys
+import time
 import argparse
 from pathlib import Path
 from enum import Enum, auto
 import typing
 
+from .json_stream import (
+    JSONStreamError,
+    PromptShapeError,
+    StreamedMessage,
+    StreamedPrompt,
+    UnsupportedDocumentError,
+    iter_prompt_events,
+    splice_message_texts,
+)
+from .instrument import (
+    NULL_RECORDER,
+    Recorder,
+    TraceRecorder,
+    render_stats,
+    write_trace,
+)
+from .lint_cache import CachedCheck, LintCache, ResultCache, default_cache_dir
+from .payload import (
+    DEFAULT_COMPRESSION_LEVEL,
+    PAYLOAD_SUFFIX,
+    PayloadError,
+    is_base64_payload,
+    iter_encoded_payload,
+    open_payload,
+)
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+
 
 class CheckFileBalanceResult(Enum):
     OK = auto()
@@ -53,6 +92,71 @@ class IfControlMismatchError(Exception):
     """Raised when there is a mismatch in {#if}, {#else}, or {#endif} usage."""
 
 
+def iter_braced_spans(file_content: str) -> typing.Iterator[tuple[int, int]]:
+    """
+    Lazily yield the spans of all top-level braced expressions.
+
+    This is the zero-copy counterpart of `parse_braced_expressions`: only
+    offsets are produced, and callers slice the content themselves if and
+    when they need an expression's text.
+
+    The scanner jumps between braces with `str.find`, so its cost grows with
+    the number of braced expressions rather than the length of the prose
+    around them.
+
+    Parameters
+    ----------
+    file_content : str
+        The full contents of the file as a single string.
+
+    Yields
+    ------
+    tuple of (int, int)
+        The index of the '{' character and the index of the matching '}'.
+
+    Raises
+    ------
+    IllegalNestingError
+        If nested braces are encountered.
+    BraceMismatchError
+        If unmatched braces are encountered.
+    """
+    find = file_content.find
+    position = 0
+
+    # Jump from brace to brace; the prose in between is never visited from
+    # Python code.
+    while (brace_start_index := find("{", position)) >= 0:
+        stray_close = find("}", position, brace_start_index)
+        if stray_close >= 0:
+            # Unmatched closing brace
+            raise BraceMismatchError(
+                "Encountered a closing brace without an opening brace."
+            )
+        brace_end_index = find("}", brace_start_index + 1)
+        nested_open = find(
+            "{",
+            brace_start_index + 1,
+            brace_end_index if brace_end_index >= 0 else len(file_content),
+        )
+        if nested_open >= 0:
+            # Braced expressions cannot contain other braces.
+            raise IllegalNestingError(
+                "Nested braces encountered, which is not allowed."
+            )
+        if brace_end_index < 0:
+            # We opened a brace but never closed it
+            raise BraceMismatchError("Unmatched opening brace found in file.")
+        yield brace_start_index, brace_end_index
+        position = brace_end_index + 1
+
+    if find("}", position) >= 0:
+        # Unmatched closing brace
+        raise BraceMismatchError(
+            "Encountered a closing brace without an opening brace."
+        )
+
+
 def parse_braced_expressions(
     file_content: str,
 ) -> list[tuple[int, int, str]]:
@@ -81,54 +185,41 @@ def parse_braced_expressions(
     ------
     IllegalNestingError
         If nested braces or unmatched braces are encountered.
+
+    See Also
+    --------
+    iter_braced_spans : Yields the same spans without copying the contents.
     """
-    expressions: list[tuple[int, int, str]] = []
-    brace_buffer: list[str] = []
-    inside_brace = False
-    brace_start_index = -1
-
-    for i, char in enumerate(file_content):
-        if char == "{":
-            if inside_brace:
-                # Braced expressions cannot contain other braces.
-                raise IllegalNestingError(
-                    "Nested braces encountered, which is not allowed."
-                )
-            inside_brace = True
-            brace_start_index = i
-            brace_buffer = []
-        elif char == "}":
-            if not inside_brace:
-                # Unmatched closing brace
-                raise BraceMismatchError(
-                    "Encountered a closing brace without an opening brace."
-                )
-            inside_brace = False
-            expressions.append((brace_start_index, i, "".join(brace_buffer)))
-            brace_buffer = []
-        else:
-            if inside_brace:
-                brace_buffer.append(char)
+    return [
+        (start_idx, end_idx, file_content[start_idx + 1 : end_idx])
+        for start_idx, end_idx in iter_braced_spans(file_content)
+    ]
 
-    if inside_brace:
-        # We opened a brace but never closed it
-        raise BraceMismatchError("Unmatched opening brace found in file.")
 
-    return expressions
+_PARENTHESES = re.compile(r"[()]")
 
 
-def check_parentheses_balance(expression: str) -> bool:
+def check_parentheses_balance(
+    expression: str, start: int = 0, end: int | None = None
+) -> bool:
     """
     Check whether parentheses in a single braced expression are balanced.
 
-    Uses a simple stack-based approach: every '(' pushes to the stack,
-    every ')' pops from the stack. If the stack is empty when trying
-    to pop or remains non-empty at the end, balance is not achieved.
+    Tracks the nesting depth: every '(' increments it and every ')'
+    decrements it. If a ')' arrives at depth zero, or the depth is
+    non-zero at the end, balance is not achieved.
 
     Parameters
     ----------
     expression : str
-        The string content of a single braced expression.
+        The string content of a single braced expression, or a larger
+        string containing it.
+    start : int, optional
+        Index at which the expression starts, by default 0.
+    end : int, optional
+        Index just past the end of the expression, by default the end of
+        the string. Together with ``start`` this allows an expression to be
+        checked in place without slicing it out of its message.
 
     Returns
     -------
@@ -136,22 +227,37 @@ def check_parentheses_balance(expression: str) -> bool:
         True if all parentheses within the expression are balanced,
         False otherwise.
     """
-    stack: list[str] = []
-    for char in expression:
-        if char == "(":
-            stack.append(char)
-        elif char == ")":
-            if not stack:
-                return False
-            stack.pop()
-    return len(stack) == 0
+    depth = 0
+    for paren in _PARENTHESES.finditer(
+        expression, start, len(expression) if end is None else end
+    ):
+        if paren.group() == "(":
+            depth += 1
+        elif not depth:
+            return False
+        else:
+            depth -= 1
+    return depth == 0
 
 
-def naive_fix_expression_if_needed(expression: str, start_idx: int) -> str:
+# Parentheses and the line breaks an exporter may have stripped a ')' before.
+_PAREN_REPAIR_EVENTS = re.compile(r"[()]|\r?\n")
+
+
+def repair_parentheses(expression: str) -> str:
     """
-    Attempt a naive fix for the common issue where a final parenthesis
-    might be stripped out by an exporter before a break. If the difference
-    between '(' and ')' is exactly +1, appends a ')' and re-checks.
+    Repair the parentheses of a braced expression in a single linear pass.
+
+    A ')' that would close a group that was never opened is deleted. Each
+    group still open at the end is closed by inserting a ')': exporters
+    tend to strip a final parenthesis before a line break, so a ')' is
+    placed before each line break at which it keeps the expression valid,
+    earliest first and at most one per break; any still missing are
+    appended at the end.
+
+    Valid insertion points are found from the prefix depth at each line
+    break and the minimum depth that follows it, so no candidate repair
+    needs to be re-checked.
 
     Parameters
     ----------
@@ -161,23 +267,96 @@ def naive_fix_expression_if_needed(expression: str, start_idx: int) -> str:
     Returns
     -------
     str
-        The potentially fixed expression. If the fix is not applicable
-        or doesn't resolve the balance issue, returns the original.
+        The expression with balanced parentheses. Balanced expressions are
+        returned unchanged.
     """
-    if check_parentheses_balance(expression):
+    depth = 0
+    deletions: list[int] = []
+    # For each line break, its position and the lowest depth reached
+    # between it and the next line break
+    breaks: list[list[int]] = []
+    for found in _PAREN_REPAIR_EVENTS.finditer(expression):
+        match found.group():
+            case "(":
+                depth += 1
+            case ")" if not depth:
+                deletions.append(found.start())
+            case ")":
+                depth -= 1
+                if breaks and depth < breaks[-1][1]:
+                    breaks[-1][1] = depth
+            case _:
+                breaks.append([found.start(), depth])
+
+    if not deletions and not depth:
         return expression
 
-    print(f"Attempting naive fix for expression at byte {start_idx} ({expression!r})")
+    # Inserting a ')' before a break lowers the depth of everything after
+    # it, so a break can take the n-th insertion only if the depth never
+    # falls below n from there on.
+    suffix_minimum = depth
+    for segment in reversed(breaks):
+        suffix_minimum = segment[1] = min(segment[1], suffix_minimum)
+    insertions: list[int] = []
+    for position, minimum in breaks:
+        if len(insertions) == depth:
+            break
+        if minimum > len(insertions):
+            insertions.append(position)
+
+    # Surplus ')' only occur where the depth is zero, which no insertion
+    # point is followed by, so every deletion precedes every insertion
+    parts: list[str] = []
+    prev_end = 0
+    for position in deletions:
+        parts.append(expression[prev_end:position])
+        prev_end = position + 1
+    for position in insertions:
+        parts.append(expression[prev_end:position])
+        parts.append(")")
+        prev_end = position
+    parts.append(expression[prev_end:])
+    parts.append(")" * (depth - len(insertions)))
+    return "".join(parts)
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class FixAttempt:
+    """
+    A braced expression that the fixer attempted to repair.
+
+    Attributes
+    ----------
+    offset : int
+        Index of the expression's opening '{' in its message.
+    expression : str
+        The expression as it was before the attempt.
+    """
+
+    offset: int
+    expression: str
+
+
+def naive_fix_expression_if_needed(expression: str, start_idx: int) -> str:
+    """
+    Attempt a fix for the common issue where a final parenthesis might be
+    stripped out by an exporter before a break.
 
-    open_count = expression.count("(")
-    close_count = expression.count(")")
-    if open_count - close_count == 1:
-        # Attempt to fix by adding one closing parenthesis at the end
-        fixed = expression + ")"
-        if check_parentheses_balance(fixed):
-            return fixed
+    Parameters
+    ----------
+    expression : str
+        The string content of a braced expression.
+    start_idx : int
+        Index of the expression's opening '{' in its message. Attempts are
+        recorded by `fix_message_content`, so this is informational only.
 
-    return expression
+    Returns
+    -------
+    str
+        The fixed expression, as repaired by `repair_parentheses`. Balanced
+        expressions are returned unchanged.
+    """
+    return repair_parentheses(expression)
 
 
 class ControlFlowToken(enum.StrEnum):
@@ -187,6 +366,89 @@ class ControlFlowToken(enum.StrEnum):
     ENDIF = "ENDIF"
 
 
+# Compiled once at import time and shared by every tokenizer.
+_CONTROL_FLOW_GRAMMAR = re.compile(
+    r"""
+    (?P<if>\{\#if\s*(?P<if_expr>[^}]*)\})          # e.g. {#if (condition)}
+    |(?P<elseif>\{\#elseif\s*(?P<elif_expr>[^}]*)\})  # e.g. {#elseif (condition)}
+    |(?P<else>\{\#else\})                          # e.g. {#else}
+    |(?P<endif>\{\#endif\})                        # e.g. {#endif}
+    """,
+    re.VERBOSE,
+)
+
+
+class ControlFlowTokenizer:
+    """
+    Tokenizer for {#if}/{#elseif}/{#else}/{#endif} control-flow tokens.
+
+    The tokenizer holds no per-call state, so a single instance can be
+    reused for any number of messages and shared freely between threads.
+
+    Parameters
+    ----------
+    grammar : re.Pattern of str, optional
+        The compiled token grammar. Must define the ``if``, ``elseif``,
+        ``else`` and ``endif`` groups (and ``if_expr``/``elif_expr``) of
+        the default grammar.
+    """
+
+    __slots__ = ("_grammar",)
+
+    def __init__(self, grammar: re.Pattern[str] = _CONTROL_FLOW_GRAMMAR) -> None:
+        self._grammar = grammar
+
+    def tokens(
+        self, file_content: str
+    ) -> typing.Iterator[tuple[int, ControlFlowToken, str]]:
+        """
+        Lazily yield the control-flow tokens in the order they appear.
+
+        Parameters
+        ----------
+        file_content : str
+            The content to tokenize.
+
+        Yields
+        ------
+        tuple of (int, ControlFlowToken, str)
+            (position_in_file, token_name, optional_text), as described in
+            `parse_control_flow_tokens`.
+
+        Raises
+        ------
+        ParenthesisMismatchError
+            If the parentheses in an #if or #elseif expression are
+            unbalanced. Raised when the offending token is reached.
+        """
+        for match in self._grammar.finditer(file_content):
+            start_idx = match.start()
+            match match.lastgroup:
+                case "if":
+                    token_type, expr_group = ControlFlowToken.IF, "if_expr"
+                case "elseif":
+                    token_type, expr_group = ControlFlowToken.ELSEIF, "elif_expr"
+                case "else":
+                    yield start_idx, ControlFlowToken.ELSE, ""
+                    continue
+                case _:
+                    yield start_idx, ControlFlowToken.ENDIF, ""
+                    continue
+
+            # Check parentheses are balanced in the #if/#elseif expression
+            expr_start, expr_end = match.span(expr_group)
+            if not check_parentheses_balance(file_content, expr_start, expr_end):
+                raise ParenthesisMismatchError(
+                    f"Unbalanced parentheses in #{token_type.lower()} expression "
+                    f"at position {start_idx}: '{match.group(expr_group)}'"
+                )
+            yield start_idx, token_type, match.group(expr_group)
+
+
+CONTROL_FLOW_TOKENIZER = ControlFlowTokenizer()
+"""Shared, thread-safe tokenizer instance used by the module's checks."""
+
+
 def parse_control_flow_tokens(
     file_content: str,
 ) -> list[tuple[int, ControlFlowToken, str]]:
@@ -203,45 +465,12 @@ def parse_control_flow_tokens(
     ------
     ParenthesisMismatchError
         If the parentheses in #if or #elseif expressions are unbalanced.
-    """
-    tokens: list[tuple[int, ControlFlowToken, str]] = []
-
-    pattern = re.compile(
-        r"""
-        (?P<if>\{\#if\s*(?P<if_expr>[^}]*)\})          # e.g. {#if (condition)}
-        |(?P<elseif>\{\#elseif\s*(?P<elif_expr>[^}]*)\})  # e.g. {#elseif (condition)}
-        |(?P<else>\{\#else\})                          # e.g. {#else}
-        |(?P<endif>\{\#endif\})                        # e.g. {#endif}
-        """,
-        re.VERBOSE,
-    )
-
-    for match in pattern.finditer(file_content):
-        start_idx = match.start()
-        if match.group("if"):
-            expr = match.group("if_expr") or ""
-            # Check parentheses are balanced in the #if expression
-            if not check_parentheses_balance(expr):
-                raise ParenthesisMismatchError(
-                    f"Unbalanced parentheses in #if expression at position {start_idx}: '{expr}'"
-                )
-            tokens.append((start_idx, ControlFlowToken.IF, expr))
-        elif match.group("elseif"):
-            expr = match.group("elif_expr") or ""
-            # Check parentheses are balanced in the #elseif expression
-            if not check_parentheses_balance(expr):
-                raise ParenthesisMismatchError(
-                    f"Unbalanced parentheses in #elseif expression at position {start_idx}: '{expr}'"
-                )
-            tokens.append((start_idx, ControlFlowToken.ELSEIF, expr))
-        elif match.group("else"):
-            tokens.append((start_idx, ControlFlowToken.ELSE, ""))
-        elif match.group("endif"):
-            tokens.append((start_idx, ControlFlowToken.ENDIF, ""))
 
-    # Sort tokens by appearance order (though finditer typically is in order)
-    tokens.sort(key=lambda t: t[0])
-    return tokens
+    See Also
+    --------
+    ControlFlowTokenizer.tokens : Yields the same tokens lazily.
+    """
+    return list(CONTROL_FLOW_TOKENIZER.tokens(file_content))
 
 
 @dataclasses.dataclass(slots=True, frozen=True)
@@ -260,6 +489,57 @@ class IfBlockState:
         return IfBlockState(has_else=False, has_elseif=True)
 
 
+def advance_if_block_stack(
+    stack: list[IfBlockState], token_type: ControlFlowToken
+) -> None:
+    """
+    Apply a single control-flow token to a stack of open {#if} blocks.
+
+    Parameters
+    ----------
+    stack : list of IfBlockState
+        The currently open blocks, innermost last. Modified in place.
+    token_type : ControlFlowToken
+        The token being applied.
+
+    Raises
+    ------
+    IfControlMismatchError
+        If the token cannot legally appear given the current stack.
+    """
+    match token_type:
+        case ControlFlowToken.IF:
+            stack.append(IfBlockState())
+        case ControlFlowToken.ELSEIF:
+            if not stack:
+                raise IfControlMismatchError(
+                    "Encountered {#elseif} without matching {#if}."
+                )
+            current = stack[-1]
+            if current.has_else:  # Terminal else already seen
+                raise IfControlMismatchError(
+                    "Encountered {#elseif} after {#else} in the same {#if} block."
+                )
+            stack[-1] = current.with_elseif()
+        case ControlFlowToken.ELSE:
+            if not stack:
+                raise IfControlMismatchError(
+                    "Encountered {#else} without matching {#if}."
+                )
+            current = stack[-1]
+            if current.has_else:  # Terminal else already seen
+                raise IfControlMismatchError(
+                    "Encountered second {#else} for the same {#if}."
+                )
+            stack[-1] = current.with_else()
+        case ControlFlowToken.ENDIF:
+            if not stack:
+                raise IfControlMismatchError(
+                    "Encountered {#endif} without matching {#if}."
+                )
+            stack.pop()
+
+
 def check_if_else_endif_structure(file_content: str) -> bool:
     """
     Check that each {#if (...)} statement is matched with a corresponding
@@ -283,43 +563,11 @@ def check_if_else_endif_structure(file_content: str) -> bool:
         If the if/else/endif structure is invalid (e.g., elseif after else,
         leftover if, unmatched endif).
     """
-    tokens = parse_control_flow_tokens(file_content)
-
     # Stack for #if blocks: we track whether we've hit a terminal else
     stack: list[IfBlockState] = []
 
-    for _, token_type, _ in tokens:
-        match token_type:
-            case ControlFlowToken.IF:
-                stack.append(IfBlockState())
-            case ControlFlowToken.ELSEIF:
-                if not stack:
-                    raise IfControlMismatchError(
-                        "Encountered {#elseif} without matching {#if}."
-                    )
-                current = stack[-1]
-                if current.has_else:  # Terminal else already seen
-                    raise IfControlMismatchError(
-                        "Encountered {#elseif} after {#else} in the same {#if} block."
-                    )
-                stack[-1] = current.with_elseif()
-            case ControlFlowToken.ELSE:
-                if not stack:
-                    raise IfControlMismatchError(
-                        "Encountered {#else} without matching {#if}."
-                    )
-                current = stack[-1]
-                if current.has_else:  # Terminal else already seen
-                    raise IfControlMismatchError(
-                        "Encountered second {#else} for the same {#if}."
-                    )
-                stack[-1] = current.with_else()
-            case ControlFlowToken.ENDIF:
-                if not stack:
-                    raise IfControlMismatchError(
-                        "Encountered {#endif} without matching {#if}."
-                    )
-                stack.pop()
+    for _, token_type, _ in CONTROL_FLOW_TOKENIZER.tokens(file_content):
+        advance_if_block_stack(stack, token_type)
 
     if stack:
         # leftover #if
@@ -328,6 +576,267 @@ def check_if_else_endif_structure(file_content: str) -> bool:
     return True
 
 
+# Every character the balance checks care about. Everything else is prose and
+# is skipped by the regex engine without a round trip through Python.
+_STRUCTURAL_CHARS = re.compile(r"[{}()]")
+
+
+def classify_control_flow(
+    file_content: str, start_idx: int, end_idx: int
+) -> ControlFlowToken | None:
+    """
+    Classify the braced expression spanning ``start_idx``..``end_idx``.
+
+    Mirrors the grammar used by `parse_control_flow_tokens`, but inspects
+    the expression in place rather than slicing it out of the content.
+
+    Parameters
+    ----------
+    file_content : str
+        The content containing the expression.
+    start_idx : int
+        Index of the opening '{'.
+    end_idx : int
+        Index of the closing '}'.
+
+    Returns
+    -------
+    ControlFlowToken or None
+        The control-flow token the expression represents, or None if it is
+        an ordinary expression.
+    """
+    body_start = start_idx + 1
+    if not file_content.startswith("#", body_start, end_idx):
+        return None
+    if file_content.startswith("#if", body_start, end_idx):
+        return ControlFlowToken.IF
+    if file_content.startswith("#elseif", body_start, end_idx):
+        return ControlFlowToken.ELSEIF
+    match end_idx - body_start:
+        case 5 if file_content.startswith("#else", body_start, end_idx):
+            return ControlFlowToken.ELSE
+        case 6 if file_content.startswith("#endif", body_start, end_idx):
+            return ControlFlowToken.ENDIF
+    return None
+
+
+def lex_message(file_content: str) -> CheckFileBalanceResult:
+    """
+    Validate braces, parentheses and control flow in a single pass.
+
+    This is a fused lexer: it walks the structural characters of the
+    content once, tracking brace nesting, the parenthesis depth of the
+    current braced expression and the stack of open {#if} blocks at the
+    same time.
+
+    The reported result follows the same precedence as running the three
+    individual checks in sequence: brace errors win over parenthesis
+    errors, which in turn win over control-flow errors.
+
+    Parameters
+    ----------
+    file_content : str
+        The content to validate.
+
+    Returns
+    -------
+    CheckFileBalanceResult
+        The first problem found, by precedence, or OK.
+    """
+    brace_start = -1
+    depth = 0
+    expression_balanced = True
+    parens_balanced = True
+    flow_valid = True
+    if_stack: list[IfBlockState] = []
+
+    for found in _STRUCTURAL_CHARS.finditer(file_content):
+        match found.group():
+            case "{":
+                if brace_start >= 0:
+                    return CheckFileBalanceResult.ILLEGAL_NESTING
+                brace_start = found.start()
+                depth = 0
+                expression_balanced = True
+            case "}":
+                if brace_start < 0:
+                    return CheckFileBalanceResult.MISMATCHED_BRACES
+                if not expression_balanced or depth:
+                    parens_balanced = False
+                elif flow_valid and (
+                    token_type := classify_control_flow(
+                        file_content, brace_start, found.start()
+                    )
+                ):
+                    try:
+                        advance_if_block_stack(if_stack, token_type)
+                    except IfControlMismatchError:
+                        flow_valid = False
+                brace_start = -1
+            case "(" if brace_start >= 0:
+                depth += 1
+            case ")" if brace_start >= 0:
+                if depth:
+                    depth -= 1
+                else:
+                    expression_balanced = False
+
+    if brace_start >= 0:
+        return CheckFileBalanceResult.MISMATCHED_BRACES
+    if not parens_balanced:
+        return CheckFileBalanceResult.MISMATCHED_PARENTHESIS
+    if not flow_valid or if_stack:
+        return CheckFileBalanceResult.INVALID_FLOW_CONTROL
+    return CheckFileBalanceResult.OK
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class BalanceIssue:
+    """
+    A single problem found by `collect_balance_issues`.
+
+    Attributes
+    ----------
+    offset : int
+        Index in the content at which the problem was found.
+    kind : CheckFileBalanceResult
+        The category of the problem.
+    message : str
+        A description of the problem.
+    """
+
+    offset: int
+    kind: CheckFileBalanceResult
+    message: str
+
+
+def collect_balance_issues(file_content: str) -> list[BalanceIssue]:
+    """
+    Find every brace, parenthesis and control-flow problem in one pass.
+
+    Unlike `check_file_balance`, which stops at the first problem, this
+    recovers and keeps scanning:
+
+    - A '{' inside an expression abandons the outer expression and starts
+      a new one.
+    - A stray '}' is skipped.
+    - An expression with unbalanced parentheses is reported once, at its
+      first surplus ')' or otherwise at its first unclosed '('.
+    - Control-flow tokens that cannot apply ({#else} or {#endif} without
+      an {#if}, a second {#else}, ...) are reported and ignored, and every
+      {#if} left open at the end is reported at its own offset.
+
+    The content passes `check_file_balance` if and only if no issues are
+    returned. Otherwise `check_file_balance` reports the kind of the first
+    issue in the most severe category found (braces, then parentheses,
+    then control flow).
+
+    Parameters
+    ----------
+    file_content : str
+        The content to validate.
+
+    Returns
+    -------
+    list of BalanceIssue
+        All problems found, ordered by offset.
+    """
+    issues: list[BalanceIssue] = []
+    brace_start = -1
+    open_parens: list[int] = []
+    surplus_close = -1
+    if_stack: list[IfBlockState] = []
+    if_offsets: list[int] = []
+
+    for found in _STRUCTURAL_CHARS.finditer(file_content):
+        offset = found.start()
+        match found.group():
+            case "{":
+                if brace_start >= 0:
+                    issues.append(
+                        BalanceIssue(
+                            offset,
+                            CheckFileBalanceResult.ILLEGAL_NESTING,
+                            "Nested braces encountered, which is not allowed.",
+                        )
+                    )
+                brace_start = offset
+                open_parens.clear()
+                surplus_close = -1
+            case "}":
+                if brace_start < 0:
+                    issues.append(
+                        BalanceIssue(
+                            offset,
+                            CheckFileBalanceResult.MISMATCHED_BRACES,
+                            "Encountered a closing brace without an opening brace.",
+                        )
+                    )
+                    continue
+                if surplus_close >= 0:
+                    issues.append(
+                        BalanceIssue(
+                            surplus_close,
+                            CheckFileBalanceResult.MISMATCHED_PARENTHESIS,
+                            "Unmatched ')' in braced expression.",
+                        )
+                    )
+                elif open_parens:
+                    issues.append(
+                        BalanceIssue(
+                            open_parens[0],
+                            CheckFileBalanceResult.MISMATCHED_PARENTHESIS,
+                            "Unclosed '(' in braced expression.",
+                        )
+                    )
+                if token_type := classify_control_flow(
+                    file_content, brace_start, offset
+                ):
+                    try:
+                        advance_if_block_stack(if_stack, token_type)
+                    except IfControlMismatchError as e:
+                        issues.append(
+                            BalanceIssue(
+                                brace_start,
+                                CheckFileBalanceResult.INVALID_FLOW_CONTROL,
+                                str(e),
+                            )
+                        )
+                    else:
+                        match token_type:
+                            case ControlFlowToken.IF:
+                                if_offsets.append(brace_start)
+                            case ControlFlowToken.ENDIF:
+                                if_offsets.pop()
+                brace_start = -1
+            case "(" if brace_start >= 0:
+                open_parens.append(offset)
+            case ")" if brace_start >= 0:
+                if open_parens:
+                    open_parens.pop()
+                elif surplus_close < 0:
+                    surplus_close = offset
+
+    if brace_start >= 0:
+        issues.append(
+            BalanceIssue(
+                brace_start,
+                CheckFileBalanceResult.MISMATCHED_BRACES,
+                "Unmatched opening brace found in file.",
+            )
+        )
+    issues.extend(
+        BalanceIssue(
+            offset,
+            CheckFileBalanceResult.INVALID_FLOW_CONTROL,
+            "Unmatched {#if} (missing {#endif}).",
+        )
+        for offset in if_offsets
+    )
+    issues.sort(key=lambda issue: issue.offset)
+    return issues
+
+
 def check_file_balance(file_content: str) -> CheckFileBalanceResult:
     """
     Check file content for structural validity and balanced expressions.
@@ -349,145 +858,973 @@ def check_file_balance(file_content: str) -> CheckFileBalanceResult:
         ILLEGAL_NESTING: Invalid nesting of braced expressions found
         MISMATCHED_PARENTHESIS: Unbalanced parentheses in expressions
         INVALID_FLOW_CONTROL: Invalid if/else/endif structure
+
+    Notes
+    -----
+    All checks are performed by `lex_message` in a single pass over the
+    content.
     """
-    # 1) Braced expressions check
-    try:
-        braced_expressions = parse_braced_expressions(file_content)
-    except IllegalNestingError:
-        return CheckFileBalanceResult.ILLEGAL_NESTING
-    except BraceMismatchError:
-        return CheckFileBalanceResult.MISMATCHED_BRACES
+    return lex_message(file_content)
 
-    # Check each braced expression for parenthesis balance
-    for _, _, expr in braced_expressions:
-        if not check_parentheses_balance(expr):
-            return CheckFileBalanceResult.MISMATCHED_PARENTHESIS
 
-    # 2) If/else/endif structure check
-    try:
-        check_if_else_endif_structure(file_content)
-    except ParenthesisMismatchError:
-        return CheckFileBalanceResult.MISMATCHED_PARENTHESIS
-    except IfControlMismatchError:
-        return CheckFileBalanceResult.INVALID_FLOW_CONTROL
+@dataclasses.dataclass(slots=True)
+class BracedExpression:
+    """
+    A braced expression within a `PromptDocument`.
 
-    return CheckFileBalanceResult.OK
+    Attributes
+    ----------
+    start : int
+        Index of the opening '{' in the document's original content.
+    end : int
+        Index of the closing '}' in the document's original content.
+    balanced : bool
+        Whether the expression's parentheses are balanced.
+    token : ControlFlowToken or None
+        The control-flow token the expression represents, if any.
+    """
 
+    start: int
+    end: int
+    balanced: bool
+    token: ControlFlowToken | None = None
 
-def fix_message_content(content: str) -> str:
-    """
-    Attempt to fix the file contents by appending a missing final parenthesis
-    in each braced expression if appropriate. Rebuilds the file content with
-    any expressions that were successfully fixed.
 
-    (Does not fix if/else/endif control flow errors.)
+@dataclasses.dataclass(slots=True)
+class IfBlock:
+    """
+    An {#if} block in a `PromptDocument`'s block tree.
 
-    Parameters
+    Attributes
     ----------
-    content : str
+    opening : int
+        Index of the {#if} expression in `PromptDocument.expressions`.
+    branches : list of int
+        Indices of the block's {#elseif} and {#else} expressions.
+    closing : int or None
+        Index of the {#endif} expression, or None if the block is unclosed.
+    children : list of IfBlock
+        Blocks nested directly inside this one.
+    """
 
-    Returns
-    -------
-    str
-        The modified file contents after attempting naive fixes for parentheses.
+    opening: int
+    branches: list[int] = dataclasses.field(default_factory=list)
+    closing: int | None = None
+    children: list[IfBlock] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class FlowRepair:
     """
-    try:
-        expressions_with_positions = parse_braced_expressions(content)
-    except (IllegalNestingError, BraceMismatchError):
-        # If braces are invalid, naive fix won't help; return as-is
-        return content
+    A control-flow token inserted or removed by `PromptDocument.fix_control_flow`.
 
-    new_content_parts: list[str] = []
-    prev_end = 0
+    Attributes
+    ----------
+    offset : int
+        Where the token was inserted, or the index of the opening '{' of
+        the token that was removed, in the text being repaired.
+    token : str
+        The token, for example ``"{#endif}"``.
+    inserted : bool
+        True if the token was inserted, False if it was removed.
+    """
 
-    for start_idx, end_idx, expr in expressions_with_positions:
-        # Copy everything from previous end up to the opening brace
-        new_content_parts.append(content[prev_end:start_idx])
-        # Add the opening brace
-        new_content_parts.append("{")
+    offset: int
+    token: str
+    inserted: bool
 
-        # Attempt naive fix
 
-        fixed_expr = naive_fix_expression_if_needed(expr, start_idx)
-        new_content_parts.append(fixed_expr)
+@dataclasses.dataclass(slots=True)
+class _OpenIfBlock:
+    # Indentation of the {#if}'s line, or None if the {#if} doesn't start it
+    indent: str | None
+    # Whether the block is never closed, so may be closed at a dedent
+    unclosed: bool
+    # Whether the block's body is indented beyond its {#if}; None until the
+    # first line after the {#if} is seen
+    indented_body: bool | None = None
 
-        # Add closing brace
-        new_content_parts.append("}")
 
-        prev_end = end_idx + 1
+# The indentation of each non-blank line.
+_LINE_INDENT = re.compile(r"^[ \t]*(?=[^ \t\r\n])", re.MULTILINE)
 
-    # Append any leftover content
-    new_content_parts.append(content[prev_end:])
-    return "".join(new_content_parts)
+_BLOCK_CONTINUATIONS = frozenset(
+    {ControlFlowToken.ELSEIF, ControlFlowToken.ELSE, ControlFlowToken.ENDIF}
+)
 
 
-def process_message_check_result(
-    content: str, do_fix: bool = False
-) -> tuple[bool, str | None]:
-    """Process file validation results and optionally apply fixes.
+def _lex_expressions(content: str, start: int, end: int) -> list[BracedExpression]:
+    """
+    Lex the braced expressions in ``content[start:end]``.
+
+    The region must not begin or end inside a braced expression.
+
+    Raises
+    ------
+    IllegalNestingError, BraceMismatchError
+        If the region's braces are invalid.
+    """
+    region = content if start == 0 and end == len(content) else content[start:end]
+    return [
+        BracedExpression(
+            start + start_idx,
+            start + end_idx,
+            check_parentheses_balance(content, start + start_idx + 1, start + end_idx),
+            classify_control_flow(content, start + start_idx, start + end_idx),
+        )
+        for start_idx, end_idx in iter_braced_spans(region)
+    ]
 
-    Checks if a file has balanced parentheses and correct control flow.
-    If fixes are requested and the file is invalid, attempts to fix the issues
-    and writes the result to a new file.
+
+class PromptDocument:
+    """
+    A message parsed once into braced expressions and control-flow blocks.
+
+    The spans, parenthesis balance and control-flow classification of every
+    braced expression are computed up front, so that checking, fixing and
+    re-checking a message share a single parse. Expressions can then be
+    patched; only a patched expression is re-validated, and the block tree
+    is rebuilt only if a patch changes an expression's control-flow token.
+    The text can also be edited in place with `edit`, which re-lexes only
+    the region around the edit.
 
     Parameters
     ----------
     content : str
-        The content of the message to validate and potentially fix
-    do_fix : bool, optional
-        If True, attempts to fix any validation issues found, by default False
+        The message text.
 
-    Returns
-    -------
-    int
-        Exit code - 0 if valid or fixed successfully, 1 if validation failed
-    """
-    fixable = False
-    match check_file_balance(content):
-        case CheckFileBalanceResult.OK:
-            return True, None
-        case CheckFileBalanceResult.ILLEGAL_NESTING:
-            print("Validation failed: illegal nesting of braced expressions detected.")
-        case CheckFileBalanceResult.MISMATCHED_PARENTHESIS:
-            print("Validation failed: unbalanced parentheses detected.")
-            fixable = True
-        case CheckFileBalanceResult.MISMATCHED_BRACES:
-            print("Validation failed: unbalanced braces detected.")
-        case CheckFileBalanceResult.INVALID_FLOW_CONTROL:
-            print("Validation failed: incorrect control flow structure detected.")
-
-    if not fixable or not do_fix:
-        return False, None
-
-    # Attempt fixes
-    fixed_content = fix_message_content(content)
-    fix_succeeded = check_file_balance(fixed_content) == CheckFileBalanceResult.OK
-    return fix_succeeded, fixed_content
+    Attributes
+    ----------
+    content : str
+        The original message text. Patches are not applied to it; see
+        `text`.
+    expressions : list of BracedExpression
+        Every braced expression in order. Empty if the braces are invalid.
+    blocks : list of IfBlock
+        The top-level {#if} blocks, as far as the control flow is valid.
+    brace_error : CheckFileBalanceResult or None
+        ILLEGAL_NESTING or MISMATCHED_BRACES if the braces are invalid.
+    flow_error : str or None
+        Why the control flow is invalid, or None if it is valid.
+    """
 
+    __slots__ = (
+        "content",
+        "expressions",
+        "blocks",
+        "brace_error",
+        "flow_error",
+        "_flow_error_at",
+        "_patches",
+        "_unbalanced",
+    )
 
-def load_messages(json_data: typing.Any) -> list[dict[str, str]]:
+    def __init__(self, content: str) -> None:
+        self._parse(content)
+
+    def _parse(self, content: str) -> None:
+        """Parse ``content`` from scratch, replacing all state."""
+        self.content = content
+        self.expressions: list[BracedExpression] = []
+        self.blocks: list[IfBlock] = []
+        self.brace_error: CheckFileBalanceResult | None = None
+        self.flow_error: str | None = None
+        # Index of the expression at which the control flow first fails
+        self._flow_error_at: int | None = None
+        self._patches: dict[int, str] = {}
+        self._unbalanced = 0
+
+        try:
+            self.expressions = _lex_expressions(content, 0, len(content))
+        except IllegalNestingError:
+            self.brace_error = CheckFileBalanceResult.ILLEGAL_NESTING
+        except BraceMismatchError:
+            self.brace_error = CheckFileBalanceResult.MISMATCHED_BRACES
+        else:
+            self._unbalanced = sum(
+                not expression.balanced for expression in self.expressions
+            )
+            self._build_blocks()
+
+    def _build_blocks(self, start: int = 0) -> None:
+        """
+        Rebuild the block tree from the expressions' control-flow tokens.
+
+        Parameters
+        ----------
+        start : int, optional
+            Index of the first expression whose token may have changed. The
+            tree is kept up to it, and only the tokens from it on are
+            replayed.
+        """
+        if self._flow_error_at is not None and self._flow_error_at < start:
+            # The control flow still fails before anything that changed
+            return
+        self.flow_error = None
+        self._flow_error_at = None
+        if start:
+            if_stack, open_blocks = self._truncate_blocks(start)
+        else:
+            self.blocks = []
+            if_stack, open_blocks = [], []
+        for index, token_type in self.control_flow_tokens(start):
+            try:
+                advance_if_block_stack(if_stack, token_type)
+            except IfControlMismatchError as e:
+                self.flow_error = str(e)
+                self._flow_error_at = index
+                return
+            match token_type:
+                case ControlFlowToken.IF:
+                    block = IfBlock(index)
+                    siblings = open_blocks[-1].children if open_blocks else self.blocks
+                    siblings.append(block)
+                    open_blocks.append(block)
+                case ControlFlowToken.ELSEIF | ControlFlowToken.ELSE:
+                    open_blocks[-1].branches.append(index)
+                case ControlFlowToken.ENDIF:
+                    open_blocks.pop().closing = index
+        if open_blocks:
+            self.flow_error = "Unclosed {#if} block."
+            self._flow_error_at = len(self.expressions)
+
+    def _truncate_blocks(
+        self, start: int
+    ) -> tuple[list[IfBlockState], list[IfBlock]]:
+        """
+        Cut the block tree back to the state before expression ``start``.
+
+        Returns
+        -------
+        tuple of (list of IfBlockState, list of IfBlock)
+            The {#if} stack and the blocks still open before ``start``,
+            outermost first, recovered by descending the tree.
+        """
+        if_stack: list[IfBlockState] = []
+        open_blocks: list[IfBlock] = []
+        siblings = self.blocks
+        while True:
+            count = bisect.bisect_left(siblings, start, key=lambda b: b.opening)
+            del siblings[count:]
+            if not count:
+                break
+            block = siblings[-1]
+            if block.closing is not None and block.closing < start:
+                break
+            block.closing = None
+            del block.branches[bisect.bisect_left(block.branches, start) :]
+            if_stack.append(IfBlockState())
+            for branch in block.branches:
+                advance_if_block_stack(if_stack, self.expressions[branch].token)
+            open_blocks.append(block)
+            siblings = block.children
+        return if_stack, open_blocks
+
+    def control_flow_tokens(
+        self, start: int = 0
+    ) -> typing.Iterator[tuple[int, ControlFlowToken]]:
+        """
+        Yield the document's control-flow tokens.
+
+        Parameters
+        ----------
+        start : int, optional
+            Index in `expressions` of the first expression to consider.
+
+        Yields
+        ------
+        tuple of (int, ControlFlowToken)
+            The index of each control-flow expression in `expressions`, and
+            its token, in order.
+        """
+        expressions = self.expressions
+        for index in range(start, len(expressions)):
+            if (token_type := expressions[index].token) is not None:
+                yield index, token_type
+
+    @property
+    def check(self) -> CheckFileBalanceResult:
+        """
+        The document's check result, including any patches.
+
+        Follows the same precedence as `check_file_balance`, with which it
+        agrees for the patched text.
+        """
+        if self.brace_error is not None:
+            return self.brace_error
+        if self._unbalanced:
+            return CheckFileBalanceResult.MISMATCHED_PARENTHESIS
+        if self.flow_error is not None:
+            return CheckFileBalanceResult.INVALID_FLOW_CONTROL
+        return CheckFileBalanceResult.OK
+
+    def issues(self) -> list[BalanceIssue]:
+        """
+        Find every problem in `text`, as `collect_balance_issues` does.
+
+        When the braces are valid, only expressions with unbalanced
+        parentheses, and control-flow tokens if the flow is invalid, can
+        have problems, so only they are scanned rather than the whole text.
+
+        Returns
+        -------
+        list of BalanceIssue
+            All problems found, ordered by offset.
+        """
+        if self.brace_error is not None or self._patches:
+            return collect_balance_issues(self.text)
+        if self.check == CheckFileBalanceResult.OK:
+            return []
+        content = self.content
+        flow_valid = self.flow_error is None
+        relevant = [
+            expression
+            for expression in self.expressions
+            if not expression.balanced
+            or (expression.token is not None and not flow_valid)
+        ]
+        # Scan the relevant expressions side by side, then map the offsets
+        # found back to the content
+        starts = list(
+            itertools.accumulate(
+                (expression.end + 1 - expression.start for expression in relevant),
+                initial=0,
+            )
+        )
+        excerpt = "".join(
+            content[expression.start : expression.end + 1] for expression in relevant
+        )
+        issues = []
+        for issue in collect_balance_issues(excerpt):
+            if flow_valid and issue.kind == CheckFileBalanceResult.INVALID_FLOW_CONTROL:
+                # From the tokens of unbalanced expressions, seen out of context
+                continue
+            index = bisect.bisect_right(starts, issue.offset) - 1
+            offset = relevant[index].start + issue.offset - starts[index]
+            issues.append(dataclasses.replace(issue, offset=offset))
+        return issues
+
+    def body(self, index: int) -> str:
+        """Return the current text between an expression's braces."""
+        if (patched := self._patches.get(index)) is not None:
+            return patched
+        expression = self.expressions[index]
+        return self.content[expression.start + 1 : expression.end]
+
+    def patch(self, index: int, body: str) -> None:
+        """
+        Replace the text between an expression's braces.
+
+        Only the patched expression is re-validated. Its body must not
+        contain braces.
+
+        Parameters
+        ----------
+        index : int
+            Index of the expression in `expressions`.
+        body : str
+            The new text between the braces.
+        """
+        expression = self.expressions[index]
+        self._patches[index] = body
+        balanced = check_parentheses_balance(body)
+        self._unbalanced += expression.balanced - balanced
+        expression.balanced = balanced
+
+        braced = f"{{{body}}}"
+        token_type = classify_control_flow(braced, 0, len(braced) - 1)
+        if token_type != expression.token:
+            expression.token = token_type
+            self._build_blocks()
+
+    @property
+    def patched(self) -> bool:
+        """Whether any expression has been patched."""
+        return bool(self._patches)
+
+    def edit(self, start: int, end: int, replacement: str) -> range:
+        """
+        Replace ``text[start:end]`` with ``replacement``, re-lexing locally.
+
+        The edit is widened to the nearest brace boundaries: from just after
+        the last expression that ends before it to the first expression
+        that starts after it. Only that region is lexed again. Expressions
+        outside it are reused, those after it with their offsets shifted.
+        If the region's control-flow tokens are unchanged the block tree is
+        kept; otherwise the {#if} stack before the region is recovered from
+        the tree and the tokens are replayed from the region on.
+
+        Any patches are first folded into `content` the same way. If the
+        braces are invalid, before the edit or within the region after it,
+        the whole text is parsed again. Either way the document ends up as
+        `PromptDocument` would parse the edited text.
+
+        Parameters
+        ----------
+        start, end : int
+            The span of `text` to replace.
+        replacement : str
+            The new text for the span.
+
+        Returns
+        -------
+        range
+            Indices in `expressions` of the expressions that were lexed
+            again; every expression if the whole text was parsed again.
+
+        Raises
+        ------
+        ValueError
+            If the span is not within `text`.
+        """
+        if self._patches:
+            patches, self._patches = self._patches, {}
+            # Last first, so that earlier offsets stay valid
+            for index in sorted(patches, reverse=True):
+                expression = self.expressions[index]
+                self.edit(expression.start + 1, expression.end, patches[index])
+
+        content = self.content
+        if not 0 <= start <= end <= len(content):
+            raise ValueError(f"Edit span {start}:{end} is outside the text")
+        edited = content[:start] + replacement + content[end:]
+        if self.brace_error is not None:
+            self._parse(edited)
+            return range(len(self.expressions))
+
+        expressions = self.expressions
+        delta = len(replacement) - (end - start)
+        first = bisect.bisect_left(expressions, start, key=lambda e: e.end)
+        last = max(first, bisect.bisect_left(expressions, end, key=lambda e: e.start))
+        region_start = expressions[first - 1].end + 1 if first else 0
+        region_end = (
+            expressions[last].start if last < len(expressions) else len(content)
+        )
+        try:
+            relexed = _lex_expressions(edited, region_start, region_end + delta)
+        except (IllegalNestingError, BraceMismatchError):
+            self._parse(edited)
+            return range(len(self.expressions))
+
+        replaced = expressions[first:last]
+        self._unbalanced += sum(not e.balanced for e in relexed) - sum(
+            not e.balanced for e in replaced
+        )
+        if delta:
+            for expression in itertools.islice(expressions, last, None):
+                expression.start += delta
+                expression.end += delta
+        expressions[first:last] = relexed
+        self.content = edited
+        if [e.token for e in relexed] != [e.token for e in replaced]:
+            self._build_blocks(first)
+        return range(first, first + len(relexed))
+
+    @property
+    def text(self) -> str:
+        """The message text with all patches applied."""
+        if not self._patches:
+            return self.content
+        parts: list[str] = []
+        prev_end = 0
+        for index in sorted(self._patches):
+            expression = self.expressions[index]
+            # Copy everything from the previous end up to and including the
+            # opening brace, then the patched body
+            parts.append(self.content[prev_end : expression.start + 1])
+            parts.append(self._patches[index])
+            prev_end = expression.end
+        # Append any leftover content, starting with the last closing brace
+        parts.append(self.content[prev_end:])
+        return "".join(parts)
+
+    def _flow_events(self) -> typing.Iterator[tuple[int, re.Match[str] | None]]:
+        """
+        Yield the document's non-blank lines and control-flow tokens in order.
+
+        Each event is the index of the next expression in `expressions`,
+        with the line's indentation match for a line, or None for a token.
+        Lines that start inside a braced expression are skipped.
+        """
+        expressions = self.expressions
+        index = 0
+        for line in _LINE_INDENT.finditer(self.content):
+            while index < len(expressions) and expressions[index].start < line.start():
+                if expressions[index].token is not None:
+                    yield index, None
+                index += 1
+            if not index or expressions[index - 1].end < line.start():
+                yield index, line
+        for index in range(index, len(expressions)):
+            if expressions[index].token is not None:
+                yield index, None
+
+    def fix_control_flow(
+        self, repairs: list[FlowRepair] | None = None
+    ) -> PromptDocument:
+        """
+        Repair the document's {#if}/{#elseif}/{#else}/{#endif} structure.
+
+        The tokens are replayed through the {#if} stack, making minimal
+        edits:
+
+        - a {#elseif}, {#else} or {#endif} that cannot legally appear where
+          it does is removed;
+        - an unclosed block whose {#if} starts its line and whose body is
+          indented is closed, with an {#endif} on a line of its own, before
+          the next line indented no deeper than the {#if} that does not
+          continue the block;
+        - any block still open is closed at the end of the message.
+
+        A first pass over the tokens alone finds the unclosed blocks; a
+        second pass over the tokens and lines makes the edits. Both are
+        linear in the length of the message.
+
+        Parameters
+        ----------
+        repairs : list of FlowRepair, optional
+            If given, a `FlowRepair` is appended for every token inserted or
+            removed.
+
+        Returns
+        -------
+        PromptDocument
+            The repaired document, parsed afresh from the repaired text so
+            that its `check` re-validates the result. The document itself is
+            returned if its control flow is already valid or its braces are
+            invalid.
+        """
+        if self.brace_error is not None or self.flow_error is None:
+            return self
+        if self._patches:
+            return PromptDocument(self.text).fix_control_flow(repairs)
+
+        content = self.content
+        expressions = self.expressions
+        # (start, end, replacement) in order of position
+        edits: list[tuple[int, int, str]] = []
+        if_stack: list[IfBlockState] = []
+        open_blocks: list[_OpenIfBlock] = []
+        # Find the blocks that are never closed; only they may be closed at
+        # a dedent, so that blocks with their own {#endif} keep it
+        opened: list[int] = []
+        for index, token_type in self.control_flow_tokens():
+            try:
+                advance_if_block_stack(if_stack, token_type)
+            except IfControlMismatchError:
+                continue
+            match token_type:
+                case ControlFlowToken.IF:
+                    opened.append(index)
+                case ControlFlowToken.ENDIF:
+                    opened.pop()
+        unclosed = set(opened)
+        if_stack.clear()
+
+        line_indent = ""
+        line_first = -1
+
+        def record(offset: int, token: str, inserted: bool) -> None:
+            if repairs is not None:
+                repairs.append(FlowRepair(offset, token, inserted))
+
+        for index, line in self._flow_events():
+            if line is not None:
+                line_indent, line_first = line.group(), line.end()
+                for block in reversed(open_blocks):
+                    if block.indented_body is not None:
+                        break
+                    block.indented_body = block.indent is not None and len(
+                        line_indent
+                    ) > len(block.indent)
+
+                while open_blocks and open_blocks[-1].indented_body:
+                    block = open_blocks[-1]
+                    if not block.unclosed:
+                        break
+                    if len(line_indent) > len(block.indent):
+                        break
+                    if (
+                        len(line_indent) == len(block.indent)
+                        and index < len(expressions)
+                        and expressions[index].start == line_first
+                        and expressions[index].token in _BLOCK_CONTINUATIONS
+                    ):
+                        break
+                    edits.append(
+                        (line.start(), line.start(), f"{block.indent}{{#endif}}\n")
+                    )
+                    record(line.start(), "{#endif}", True)
+                    open_blocks.pop()
+                    if_stack.pop()
+                continue
+
+            expression = expressions[index]
+            try:
+                advance_if_block_stack(if_stack, expression.token)
+            except IfControlMismatchError:
+                edits.append((expression.start, expression.end + 1, ""))
+                record(
+                    expression.start,
+                    content[expression.start : expression.end + 1],
+                    False,
+                )
+                continue
+            match expression.token:
+                case ControlFlowToken.IF:
+                    open_blocks.append(
+                        _OpenIfBlock(
+                            line_indent if expression.start == line_first else None,
+                            index in unclosed,
+                        )
+                    )
+                case ControlFlowToken.ENDIF:
+                    open_blocks.pop()
+
+        for _ in open_blocks:
+            edits.append((len(content), len(content), "{#endif}"))
+            record(len(content), "{#endif}", True)
+
+        parts: list[str] = []
+        prev_end = 0
+        for start, end, replacement in edits:
+            parts.append(content[prev_end:start])
+            parts.append(replacement)
+            prev_end = end
+        parts.append(content[prev_end:])
+        return PromptDocument("".join(parts))
+
+    def fix_parentheses(self, attempts: list[FixAttempt] | None = None) -> int:
+        """
+        Patch every expression with unbalanced parentheses.
+
+        Parameters
+        ----------
+        attempts : list of FixAttempt, optional
+            If given, a `FixAttempt` is appended for every expression that
+            needed repair, whether or not the repair succeeded.
+
+        Returns
+        -------
+        int
+            The number of expressions patched.
+        """
+        if not self._unbalanced:
+            return 0
+        patched = 0
+        for index, expression in enumerate(self.expressions):
+            if expression.balanced:
+                continue
+            expr = self.body(index)
+            if attempts is not None:
+                attempts.append(FixAttempt(expression.start, expr))
+            fixed_expr = repair_parentheses(expr)
+            if fixed_expr != expr:
+                self.patch(index, fixed_expr)
+                patched += 1
+        return patched
+
+
+def fix_message_content(
+    content: str, attempts: list[FixAttempt] | None = None
+) -> str:
     """
-    Given loaded JSON, extract the list of message objects.
+    Attempt to fix the file contents by repairing the parentheses of each
+    braced expression with `repair_parentheses`. Rebuilds the file content
+    with any expressions that were fixed.
 
-    We data in the form:
+    (Does not fix if/else/endif control flow errors.)
 
-    1) {
-         "messages": [
-            {"text": "..."},
-            {"text": "..."}
-         ]
-       }
+    The content is parsed into a `PromptDocument`; only expressions that
+    fail the balance check are copied out, and content without any fixes
+    is returned unchanged rather than rebuilt. Content whose braces are
+    invalid is returned as-is, without recording any attempts.
+
+    Parameters
+    ----------
+    content : str
+    attempts : list of FixAttempt, optional
+        If given, a `FixAttempt` is appended for every expression that
+        needed repair, whether or not the repair succeeded.
 
     Returns
     -------
-    list of dict with key "text"
+    str
+        The modified file contents after attempting fixes for parentheses.
     """
-    match json_data:
-        case {"messages": list() as messages}:
-            return messages
+    document = PromptDocument(content)
+    document.fix_parentheses(attempts)
+    return document.text
 
-    # Otherwise, we don't know how to parse
-    raise ValueError('JSON must be in the form {"messages": [...]}')
+
+# Identifies the behaviour of the checks and fixes for the lint cache. Bump
+# whenever check_file_balance or fix_message_content change their results.
+LINT_RULESET = "balance+flow;fix=paren-repair;v2"
+
+# As LINT_RULESET, when control flow is repaired as well. Bump whenever
+# PromptDocument.fix_control_flow changes its results.
+FLOW_FIX_RULESET = f"{LINT_RULESET};fix=flow-repair;v1"
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class MessageDiagnostic:
+    """
+    The outcome of linting a single message.
+
+    Attributes
+    ----------
+    check : CheckFileBalanceResult
+        The result of checking the message as it stands.
+    fixed_content : str or None
+        The fixed text, if a fix was attempted.
+    fix_succeeded : bool
+        Whether the fixed text passes all checks.
+    fix_attempts : tuple of FixAttempt
+        The expressions the fixer tried to repair. Empty when the fix was
+        served from a cache.
+    issues : tuple of BalanceIssue
+        Every problem in the message as it stands, if they were collected.
+    flow_repairs : tuple of FlowRepair
+        The control-flow tokens inserted or removed, if control flow was
+        repaired. Empty when the fix was served from a cache.
+    """
+
+    check: CheckFileBalanceResult
+    fixed_content: str | None = None
+    fix_succeeded: bool = False
+    fix_attempts: tuple[FixAttempt, ...] = ()
+    issues: tuple[BalanceIssue, ...] = ()
+    flow_repairs: tuple[FlowRepair, ...] = ()
+
+    @property
+    def result(self) -> LintResult:
+        """The message's contribution to a `LintResult`."""
+        if self.check == CheckFileBalanceResult.OK:
+            return LintResult(success=True, had_changes=False)
+        if self.fix_succeeded:
+            return LintResult(success=True, had_changes=True)
+        return LintResult(success=False, had_changes=False)
+
+
+# Problems that fix_message_content can attempt to repair.
+_FIXABLE_CHECKS = frozenset({CheckFileBalanceResult.MISMATCHED_PARENTHESIS})
+
+# Problems that can be repaired when control flow is repaired as well.
+_FLOW_FIXABLE_CHECKS = _FIXABLE_CHECKS | {CheckFileBalanceResult.INVALID_FLOW_CONTROL}
+
+_CHECK_FAILURE_MESSAGES = {
+    CheckFileBalanceResult.ILLEGAL_NESTING: (
+        "Validation failed: illegal nesting of braced expressions detected."
+    ),
+    CheckFileBalanceResult.MISMATCHED_PARENTHESIS: (
+        "Validation failed: unbalanced parentheses detected."
+    ),
+    CheckFileBalanceResult.MISMATCHED_BRACES: (
+        "Validation failed: unbalanced braces detected."
+    ),
+    CheckFileBalanceResult.INVALID_FLOW_CONTROL: (
+        "Validation failed: incorrect control flow structure detected."
+    ),
+}
+
+
+# The openings of control-flow expressions, counted for statistics.
+_CONTROL_FLOW_TAGS = ("{#if", "{#elseif", "{#else}", "{#endif}")
+
+
+def check_message(
+    content: str,
+    fix: bool = False,
+    cache: ResultCache | None = None,
+    collect_all: bool = False,
+    fix_flow: bool = False,
+    recorder: Recorder = NULL_RECORDER,
+) -> MessageDiagnostic:
+    """
+    Check a message and, if requested, attempt to fix it.
+
+    This has no side effects beyond reading and updating ``cache`` and
+    ``recorder``.
+
+    Parameters
+    ----------
+    content : str
+        The message text.
+    fix : bool, optional
+        Whether to attempt a fix if the message fails a fixable check.
+    cache : ResultCache, optional
+        If given, previously computed results for identical content are
+        reused and new results are recorded.
+    collect_all : bool, optional
+        If True, messages that fail are rescanned with
+        `collect_balance_issues` to report every problem, not just the
+        first.
+    fix_flow : bool, optional
+        If True, fixes also repair the control flow with
+        `PromptDocument.fix_control_flow`. A ``cache`` used with this
+        option must have been opened with `FLOW_FIX_RULESET`.
+    recorder : Recorder, optional
+        Records the time spent checking, diagnosing and fixing, and counts
+        the message, its expressions, control-flow tokens and fixes.
+
+    Returns
+    -------
+    MessageDiagnostic
+        The check result and any fix.
+    """
+    if recorder.enabled:
+        recorder.count("messages")
+        recorder.count("expressions", content.count("{"))
+        recorder.count("tokens", sum(map(content.count, _CONTROL_FLOW_TAGS)))
+
+    document: PromptDocument | None = None
+    cached = cache.lookup(content) if cache is not None else None
+    if cached is not None:
+        check_result = CheckFileBalanceResult[cached.result]
+    else:
+        with recorder.span("check"):
+            if fix:
+                # A message that fails is then fixed from this same parse
+                document = PromptDocument(content)
+                check_result = document.check
+            else:
+                check_result = check_file_balance(content)
+        cached = CachedCheck(check_result.name)
+        if cache is not None:
+            cache.store(content, cached)
+
+    issues: tuple[BalanceIssue, ...] = ()
+    if collect_all and check_result != CheckFileBalanceResult.OK:
+        with recorder.span("diagnose"):
+            issues = tuple(collect_balance_issues(content))
+
+    fixable = _FLOW_FIXABLE_CHECKS if fix_flow else _FIXABLE_CHECKS
+    if not fix or check_result not in fixable:
+        return MessageDiagnostic(check_result, issues=issues)
+
+    match cached:
+        case CachedCheck(
+            fixed_content=str() as fixed_content, fix_succeeded=bool() as fix_succeeded
+        ):
+            return MessageDiagnostic(
+                check_result, fixed_content, fix_succeeded, issues=issues
+            )
+
+    # Attempt fixes. Re-checking the document afterwards only re-validates
+    # the expressions that were patched.
+    attempts: list[FixAttempt] = []
+    repairs: list[FlowRepair] = []
+    with recorder.span("fix"):
+        if document is None:
+            # Only the check result was cached
+            document = PromptDocument(content)
+        document.fix_parentheses(attempts)
+        if fix_flow:
+            document = document.fix_control_flow(repairs)
+        fixed_content = document.text
+        fix_succeeded = document.check == CheckFileBalanceResult.OK
+    recorder.count("fixes", len(attempts) + len(repairs))
+    if cache is not None:
+        cache.store(
+            content,
+            dataclasses.replace(
+                cached, fixed_content=fixed_content, fix_succeeded=fix_succeeded
+            ),
+        )
+    return MessageDiagnostic(
+        check_result,
+        fixed_content,
+        fix_succeeded,
+        tuple(attempts),
+        issues,
+        tuple(repairs),
+    )
+
+
+def render_check(diagnostic: MessageDiagnostic) -> list[str]:
+    """Return the lines describing a failed check, its issues and fixes."""
+    if diagnostic.check == CheckFileBalanceResult.OK:
+        return []
+    return (
+        [_CHECK_FAILURE_MESSAGES[diagnostic.check]]
+        + [
+            f"  at byte {issue.offset}: {issue.message}"
+            for issue in diagnostic.issues
+        ]
+        + [
+            f"Attempting naive fix for expression at byte {attempt.offset} "
+            f"({attempt.expression!r})"
+            for attempt in diagnostic.fix_attempts
+        ]
+        + [
+            f"{'Inserting' if repair.inserted else 'Removing'} {repair.token} "
+            f"at byte {repair.offset}"
+            for repair in diagnostic.flow_repairs
+        ]
+    )
+
+
+def process_message_check_result(
+    content: str, do_fix: bool = False, cache: ResultCache | None = None
+) -> tuple[bool, str | None]:
+    """Process file validation results and optionally apply fixes.
+
+    Checks if a file has balanced parentheses and correct control flow,
+    printing any problems found. If fixes are requested and the file is
+    invalid, attempts to fix the issues.
+
+    Parameters
+    ----------
+    content : str
+        The content of the message to validate and potentially fix
+    do_fix : bool, optional
+        If True, attempts to fix any validation issues found, by default False
+    cache : ResultCache, optional
+        If given, previously computed results for identical content are
+        reused and new results are recorded. Fixes served from the cache
+        are not re-attempted, so their progress messages are not repeated.
+
+    Returns
+    -------
+    tuple of (bool, str or None)
+        Whether the content is valid (after fixes, if attempted), and the
+        fixed content if a fix was attempted.
+
+    See Also
+    --------
+    check_message : The same check without printing.
+    """
+    diagnostic = check_message(content, do_fix, cache)
+    for line in render_check(diagnostic):
+        print(line)
+    if diagnostic.check == CheckFileBalanceResult.OK:
+        return True, None
+    return diagnostic.fix_succeeded, diagnostic.fixed_content
+
+
+def load_messages(json_data: typing.Any) -> list[dict[str, str]]:
+    """
+    Given loaded JSON, extract the list of message objects.
+
+    We data in the form:
+
+    1) {
+         "messages": [
+            {"text": "..."},
+            {"text": "..."}
+         ]
+       }
+
+    Returns
+    -------
+    list of dict with key "text"
+    """
+    match json_data:
+        case {"messages": list() as messages}:
+            return messages
+
+    # Otherwise, we don't know how to parse
+    raise ValueError('JSON must be in the form {"messages": [...]}')
 
 
 @dataclasses.dataclass(slots=True, frozen=True)
@@ -505,101 +1842,1040 @@ class LintResult:
         )
 
 
-def lint_prompt(prompt: dict, fix: bool) -> LintResult:
-    # Extract message objects
-    try:
-        messages = load_messages(prompt)
-    except ValueError as e:
-        print(f"Error: {e}")
-        exit(8)
+@dataclasses.dataclass(slots=True, frozen=True)
+class PromptReport:
+    """
+    The outcome of linting one prompt of a document.
 
-    # Lint each message
-    had_errors = []
-    had_changes = []
-    for i, msg_obj in enumerate(messages):
-        text = msg_obj.get("text", "")
-        result = process_message_check_result(text, fix)
-        match result:
-            case (True, str() as new_text):
-                # We have a fix
-                print(f"Message index {i} passed all checks following fixes")
-                msg_obj["text"] = new_text
-                had_changes.append(True)
-                had_errors.append(True)
-            case (False, _):
-                if not fix:
-                    print(
-                        f"Message index {i} has errors, but may be fixable (use --fix to try)"
+    Attributes
+    ----------
+    index : int or None
+        Position of the prompt in a list of prompt and dependencies, or
+        None if the document is a single prompt.
+    messages : tuple of MessageDiagnostic
+        One diagnostic per message, in order.
+    error : str or None
+        Why the prompt could not be linted, if it is of the wrong shape.
+    """
+
+    index: int | None
+    messages: tuple[MessageDiagnostic, ...] = ()
+    error: str | None = None
+
+    @property
+    def result(self) -> LintResult:
+        """The combined result of the prompt's messages."""
+        result = LintResult(success=self.error is None, had_changes=False)
+        for diagnostic in self.messages:
+            result = result.tally(diagnostic.result)
+        return result
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class Report:
+    """
+    The outcome of linting a document, as returned by `lint_document`.
+
+    Attributes
+    ----------
+    prompts : tuple of PromptReport
+        One report per prompt linted. Linting stops at the first prompt
+        with an error.
+    fix : bool
+        Whether fixes were requested.
+    error : str or None
+        Why the document could not be linted, if it is of an unsupported
+        type.
+    """
+
+    prompts: tuple[PromptReport, ...]
+    fix: bool = False
+    error: str | None = None
+
+    @property
+    def valid(self) -> bool:
+        """Whether the document and all its prompts had a usable shape."""
+        return self.error is None and all(p.error is None for p in self.prompts)
+
+    @property
+    def result(self) -> LintResult:
+        """The combined result of the document's prompts."""
+        result = LintResult(success=self.error is None, had_changes=False)
+        for prompt in self.prompts:
+            result = result.tally(prompt.result)
+        return result
+
+    def fixed_messages(self) -> dict[tuple[int | None, int], str]:
+        """
+        Return the text of every successfully fixed message.
+
+        Returns
+        -------
+        dict
+            The fixed texts, keyed by ``(prompt_index, message_index)`` as
+            for `json_stream.splice_message_texts`.
+        """
+        return {
+            (prompt.index, index): diagnostic.fixed_content
+            for prompt in self.prompts
+            for index, diagnostic in enumerate(prompt.messages)
+            if diagnostic.fix_succeeded
+        }
+
+    def apply_fixes(self, document: typing.Any) -> None:
+        """
+        Write successful fixes into the document that was linted.
+
+        Parameters
+        ----------
+        document : Any
+            The document passed to `lint_document`.
+        """
+        prompts = [document] if isinstance(document, dict) else document
+        for report, prompt in zip(self.prompts, prompts):
+            if report.error is not None:
+                continue
+            for diagnostic, msg_obj in zip(report.messages, load_messages(prompt)):
+                if diagnostic.fix_succeeded:
+                    msg_obj["text"] = diagnostic.fixed_content
+
+
+def lint_document(
+    document: typing.Any,
+    fix: bool = False,
+    cache: ResultCache | None = None,
+    collect_all: bool = False,
+    fix_flow: bool = False,
+    recorder: Recorder = NULL_RECORDER,
+) -> Report:
+    """
+    Lint a loaded prompt document without printing or exiting.
+
+    Parameters
+    ----------
+    document : Any
+        A prompt, ``{"messages": [...]}``, or a list of them (the prompt
+        followed by its dependencies), as loaded from JSON.
+    fix : bool, optional
+        Whether to attempt fixes. Fixes are recorded in the report; use
+        `Report.apply_fixes` to write them into the document.
+    cache : ResultCache, optional
+        Cache of message results, as for `check_message`.
+    collect_all : bool, optional
+        Report every problem in failing messages, as for `check_message`.
+    fix_flow : bool, optional
+        Also repair control flow, as for `check_message`.
+    recorder : Recorder, optional
+        Records phase timings and counters, as for `check_message`, and
+        a span for each prompt and message.
+
+    Returns
+    -------
+    Report
+        Diagnostics for every message linted.
+    """
+    match document:
+        case dict():
+            prompts: typing.Iterable[tuple[int | None, typing.Any]] = [
+                (None, document)
+            ]
+        case list():
+            prompts = enumerate(document)
+        case _:
+            return Report((), fix, "Unsupported JSON data type")
+
+    reports: list[PromptReport] = []
+    for index, prompt in prompts:
+        with recorder.span(
+            "dependency" if index else "prompt", "prompt", index=index or None
+        ):
+            try:
+                messages = load_messages(prompt)
+            except ValueError as e:
+                reports.append(PromptReport(index, error=str(e)))
+                break
+            diagnostics: list[MessageDiagnostic] = []
+            for message_index, msg_obj in enumerate(messages):
+                with recorder.span("message", "message", index=message_index):
+                    diagnostics.append(
+                        check_message(
+                            msg_obj.get("text", ""),
+                            fix,
+                            cache,
+                            collect_all,
+                            fix_flow,
+                            recorder,
+                        )
                     )
-                else:
-                    print(f"Message index {i} could not be fixed")
-                had_changes.append(False)
-                had_errors.append(True)
-            case _:
-                print(f"Message index {i} passed all checks")
-    success = not any(err and not fixed for err, fixed in zip(had_errors, had_changes))
-    return LintResult(success=success, had_changes=any(had_changes))
+        reports.append(PromptReport(index, tuple(diagnostics)))
+    return Report(tuple(reports), fix)
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description=(
-            "Lint messages from a Novelcrafter JSON prompt file "
-            "(with inline or bundled dependencies). "
-            "Exits 0 if all messages pass lint or can be fixed automatically."
+def render_message(index: int, diagnostic: MessageDiagnostic, fix: bool) -> str:
+    """
+    Render the CLI report for one message.
+
+    Parameters
+    ----------
+    index : int
+        The message's position in its prompt.
+    diagnostic : MessageDiagnostic
+        The message's diagnostic.
+    fix : bool
+        Whether fixes were requested.
+
+    Returns
+    -------
+    str
+        The report lines, each terminated by a newline.
+    """
+    lines = render_check(diagnostic)
+    if diagnostic.check == CheckFileBalanceResult.OK:
+        lines.append(f"Message index {index} passed all checks")
+    elif diagnostic.fix_succeeded:
+        lines.append(f"Message index {index} passed all checks following fixes")
+    elif not fix:
+        lines.append(
+            f"Message index {index} has errors, but may be fixable (use --fix to try)"
         )
-    )
-    parser.add_argument("file", type=str, help="Path to the JSON prompt file.")
-    parser.add_argument(
-        "--fix",
-        action="store_true",
-        help="Attempt to fix automatically fixable lint problems.",
-    )
-    args = parser.parse_args()
+    else:
+        lines.append(f"Message index {index} could not be fixed")
+    return "".join(f"{line}\n" for line in lines)
+
+
+def render_prompt_header(index: int | None) -> str:
+    """Render the line introducing a prompt within a list of prompts."""
+    match index:
+        case None:
+            return ""
+        case 0:
+            return "Checking prompt\n"
+        case _:
+            return f"Checking dependency {index}\n"
+
+
+def render_report(report: Report) -> str:
+    """
+    Render the CLI report for a document.
+
+    Parameters
+    ----------
+    report : Report
+        The report from `lint_document`.
+
+    Returns
+    -------
+    str
+        The report, as printed by ``prompt_lint``.
+    """
+    parts: list[str] = []
+    for prompt in report.prompts:
+        parts.append(render_prompt_header(prompt.index))
+        if prompt.error is not None:
+            parts.append(f"Error: {prompt.error}\n")
+        for index, diagnostic in enumerate(prompt.messages):
+            parts.append(render_message(index, diagnostic, report.fix))
+    if report.error is not None:
+        parts.append(f"{report.error}\n")
+    return "".join(parts)
+
+
+def lint_prompt(
+    prompt: dict, fix: bool, cache: ResultCache | None = None
+) -> LintResult:
+    """
+    Lint a single prompt, printing the report and applying any fixes.
+
+    Exits with status 8 if the prompt is not of the form
+    ``{"messages": [...]}``. Use `lint_document` to lint without printing,
+    exiting or modifying the prompt.
+    """
+    report = lint_document(prompt, fix, cache)
+    print(render_report(report), end="")
+    if not report.valid:
+        exit(8)
+    report.apply_fixes(prompt)
+    return report.result
+
+
+def open_prompt_file(path: Path) -> typing.TextIO:
+    """
+    Open a prompt file as JSON text, decoding gzip+base64 payloads.
+
+    Parameters
+    ----------
+    path : Path
+        A JSON prompt file, or a gzip+base64 payload as copied from
+        Novelcrafter (see `payload.is_base64_payload`).
+
+    Returns
+    -------
+    text file object
+        A stream of the prompt's JSON text, with line endings as they
+        are in the file. Payloads are decoded lazily as the stream is read.
+    """
+    if is_base64_payload(path):
+        return io.TextIOWrapper(open_payload(path), encoding="utf-8", newline="")
+    return path.open(encoding="utf-8", newline="")
+
+
+class OutputFormat(enum.StrEnum):
+    """The format in which fixed prompts are written."""
+
+    JSON = "json"
+    B64 = "b64"
+
+
+# Appended to the stem of a prompt file to name the copy its fixes go in.
+FIXED_STEM_SUFFIX = "_fixed"
+
+
+def fixed_output_path(path: Path, emit: OutputFormat = OutputFormat.JSON) -> Path:
+    """
+    Return where fixes for ``path`` are written.
+
+    Fixes are written as JSON to ``<stem>_fixed<suffix>``, or to
+    ``<stem>_fixed.json`` for gzip+base64 payloads. When emitting
+    gzip+base64, they are written to ``<stem>_fixed.b64``.
+    """
+    if emit == OutputFormat.B64:
+        suffix = PAYLOAD_SUFFIX
+    elif path.suffix.lower() == PAYLOAD_SUFFIX:
+        suffix = ".json"
+    else:
+        suffix = path.suffix
+    return path.parent / f"{path.stem}{FIXED_STEM_SUFFIX}{suffix}"
+
+
+@contextlib.contextmanager
+def atomic_write(path: Path) -> typing.Iterator[typing.BinaryIO]:
+    """
+    Open a binary stream whose content atomically replaces ``path``.
+
+    The content is written to a temporary file in the same directory,
+    which replaces ``path`` with an atomic rename once the ``with`` block
+    completes, so readers see either the old or the new file whole. The
+    file's permissions are kept. If the block raises, ``path`` is left
+    untouched.
+
+    Parameters
+    ----------
+    path : Path
+        The existing file to replace.
+
+    Yields
+    ------
+    binary file object
+        The stream to write the new content to.
+    """
+    import tempfile
+
+    fd, name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    temporary = Path(name)
+    try:
+        with open(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        temporary.chmod(path.stat().st_mode & 0o7777)
+        temporary.replace(path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+_COMPACT_JSON = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+# Characters of compact JSON gathered before each is encoded and written.
+_JSON_CHUNK_SIZE = 64 * 1024
 
-    path = Path(args.file)
+
+def iter_compact_json(data: typing.Any) -> typing.Iterator[bytes]:
+    """
+    Serialise ``data`` as compact UTF-8 JSON, as ``jq -Mc`` would, in pieces.
+
+    Parameters
+    ----------
+    data : Any
+        The document.
+
+    Yields
+    ------
+    bytes
+        Successive pieces of the JSON text, of roughly 64 KiB each.
+    """
+    pieces: list[str] = []
+    size = 0
+    for piece in _COMPACT_JSON.iterencode(data):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= _JSON_CHUNK_SIZE:
+            yield "".join(pieces).encode("utf-8")
+            pieces.clear()
+            size = 0
+    yield "".join(pieces).encode("utf-8")
+
+
+def lint_file(
+    path: Path,
+    fix: bool,
+    cache: ResultCache | None = None,
+    collect_all: bool = False,
+    fix_flow: bool = False,
+    in_place: bool = False,
+    emit: OutputFormat = OutputFormat.JSON,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    recorder: Recorder = NULL_RECORDER,
+) -> tuple[int, LintResult]:
+    """
+    Lint a single JSON prompt file, writing any fixes alongside it.
+
+    JSON fixes are spliced into the file's original JSON text, so only the
+    fixed ``text`` strings differ from the input. Gzip+base64 fixes are
+    encoded from the loaded document as compact JSON, streamed through
+    the compressor and encoder.
+
+    Parameters
+    ----------
+    path : Path
+        The JSON prompt file or gzip+base64 payload.
+    fix : bool
+        If True, attempt fixes and write them to `fixed_output_path`.
+    cache : ResultCache, optional
+        Cache of message results to consult and update. Buffered cache
+        writes are flushed once the file has been linted.
+    collect_all : bool, optional
+        Report every problem in failing messages, as for `check_message`.
+    fix_flow : bool, optional
+        Also repair control flow, as for `check_message`.
+    in_place : bool, optional
+        Write fixes back to ``path`` itself, atomically and in its own
+        format, rather than to `fixed_output_path`.
+    emit : OutputFormat, optional
+        The format of fixes written to `fixed_output_path`.
+    compression_level : int, optional
+        The gzip compression level for gzip+base64 output.
+    recorder : Recorder, optional
+        Records the time spent reading, loading, linting, rendering and
+        writing the file, and counts it and its size on disk.
+
+    Returns
+    -------
+    tuple of (int, LintResult)
+        The exit code for the file and the combined result of its prompts.
+    """
+    failed = LintResult(success=False, had_changes=False)
     if not path.exists():
         print(f"File not found: {path}")
-        exit(8)
+        return 8, failed
+    if recorder.enabled:
+        recorder.count("files")
+        recorder.count("bytes", path.stat().st_size)
 
     try:
-        with path.open(encoding="utf-8") as f:
-            data = json.load(f)
+        with recorder.span("read"), open_prompt_file(path) as f:
+            source = f.read()
+        with recorder.span("json.load"):
+            data = json.loads(source)
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
-        exit(8)
+        return 8, failed
+    except PayloadError as e:
+        print(f"Error decoding payload: {e}")
+        return 8, failed
 
-    match data:
-        case dict():
-            result = lint_prompt(data, args.fix)
-        case list():
-            result = LintResult(success=True, had_changes=False)
-            for index, item in enumerate(data):
-                if index == 0:
-                    print("Checking prompt")
-                else:
-                    print(f"Checking dependency {index}")
-                result = result.tally(lint_prompt(item, args.fix))
-        case _:
-            print("Unsupported JSON data type")
-            exit(8)
+    try:
+        report = lint_document(data, fix, cache, collect_all, fix_flow, recorder)
+    finally:
+        if cache is not None:
+            cache.flush()
+
+    with recorder.span("render"):
+        print(render_report(report), end="")
+    if not report.valid:
+        return 8, failed
+    result = report.result
 
     # If we used --fix and we changed something, write out the result
-    if args.fix and result.had_changes:
-        # E.g., write to <stem>_fixed<suffix>
-        fixed_path = path.parent / f"{path.stem}_fixed{path.suffix}"
-        with fixed_path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    if fix and result.had_changes:
+        if in_place:
+            fixed_path = path
+            emit = OutputFormat.B64 if is_base64_payload(path) else OutputFormat.JSON
+        else:
+            fixed_path = fixed_output_path(path, emit)
+        with (
+            recorder.span("dump"),
+            atomic_write(path) if in_place else fixed_path.open("wb") as f,
+        ):
+            if emit == OutputFormat.B64:
+                report.apply_fixes(data)
+                f.writelines(
+                    iter_encoded_payload(iter_compact_json(data), compression_level)
+                )
+            else:
+                fixed_source = splice_message_texts(source, report.fixed_messages())
+                f.write(fixed_source.encode("utf-8"))
         if result.success:
             print(f"Fixes applied and written to {fixed_path}")
         else:
             print(
                 f"Fixes applied and written to {fixed_path}, but some errors could not be automatically fixed"
             )
-            exit(1)
+            return 1, result
 
     # If we get here, everything is good (or good after fixes).
-    exit(0)
+    return 0, result
+
+
+def lint_file_streaming(
+    path: Path,
+    cache: ResultCache | None = None,
+    collect_all: bool = False,
+    recorder: Recorder = NULL_RECORDER,
+) -> tuple[int, LintResult]:
+    """
+    Lint a single prompt file without loading the whole document.
+
+    Messages are decoded and linted one at a time as the file is read, so
+    memory use is bounded by the largest message rather than the file.
+    Fixes are not supported in this mode.
+
+    Parameters
+    ----------
+    path : Path
+        The JSON prompt file or gzip+base64 payload.
+    cache : ResultCache, optional
+        Cache of message results to consult and update.
+    collect_all : bool, optional
+        Report every problem in failing messages, as for `check_message`.
+    recorder : Recorder, optional
+        Records phase timings and counters, as for `lint_file`, and a span
+        for each message. Reading and decoding the file are interleaved,
+        and are both timed as ``json.load``.
+
+    Returns
+    -------
+    tuple of (int, LintResult)
+        The exit code for the file and the combined result of its prompts.
+    """
+    failed = LintResult(success=False, had_changes=False)
+    if not path.exists():
+        print(f"File not found: {path}")
+        return 8, failed
+    if recorder.enabled:
+        recorder.count("files")
+        recorder.count("bytes", path.stat().st_size)
+
+    result = LintResult(success=True, had_changes=False)
+    try:
+        with open_prompt_file(path) as f:
+            for event in recorder.timed_iter("json.load", iter_prompt_events(f)):
+                match event:
+                    case StreamedPrompt(index=index):
+                        print(render_prompt_header(index), end="")
+                    case StreamedMessage(index=index, message=msg_obj):
+                        with recorder.span("message", "message", index=index):
+                            diagnostic = check_message(
+                                msg_obj.get("text", ""),
+                                False,
+                                cache,
+                                collect_all,
+                                recorder=recorder,
+                            )
+                        with recorder.span("render"):
+                            print(render_message(index, diagnostic, False), end="")
+                        result = result.tally(diagnostic.result)
+    except JSONStreamError as e:
+        print(f"Error parsing JSON: {e}")
+        return 8, failed
+    except PayloadError as e:
+        print(f"Error decoding payload: {e}")
+        return 8, failed
+    except UnsupportedDocumentError:
+        print("Unsupported JSON data type")
+        return 8, failed
+    except PromptShapeError as e:
+        print(f"Error: {e}")
+        return 8, failed
+    finally:
+        if cache is not None:
+            cache.flush()
+
+    return 0, result
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class LintOptions:
+    """
+    Settings shared by every file in a lint run.
+
+    Attributes
+    ----------
+    fix : bool
+        Attempt fixes and write them out, as for `lint_file`.
+    stream : bool
+        Lint with `lint_file_streaming` instead of `lint_file`.
+    cache_dir : Path or None
+        Directory of a `LintCache` shared by all workers, if any.
+    all_diagnostics : bool
+        Report every problem in failing messages, not just the first.
+    fix_flow : bool
+        When fixing, repair control flow as well.
+    in_place : bool
+        When fixing, rewrite each file rather than writing a fixed copy.
+    emit : OutputFormat
+        The format of fixed copies.
+    compression_level : int
+        The gzip compression level for gzip+base64 output.
+    stats : bool
+        Record phase timings and counters for each file.
+    trace : bool
+        Record a trace of the spans of each file, with its prompts,
+        messages and phases (implies ``stats``).
+    """
+
+    fix: bool = False
+    stream: bool = False
+    cache_dir: Path | None = None
+    all_diagnostics: bool = False
+    fix_flow: bool = False
+    in_place: bool = False
+    emit: OutputFormat = OutputFormat.JSON
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL
+    stats: bool = False
+    trace: bool = False
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class FileLintReport:
+    """
+    The captured outcome of linting one file, as produced by a worker.
+
+    ``stats`` holds the file's phase timings and counters if they were
+    requested with `LintOptions.stats`, as a `TraceRecorder` holding its
+    spans if `LintOptions.trace` was requested.
+    """
+
+    path: Path
+    exit_code: int
+    result: LintResult
+    output: str
+    stats: Recorder | None = None
+
+
+@functools.cache
+def open_lint_cache(directory: Path, ruleset: str = LINT_RULESET) -> LintCache:
+    """Open the lint cache in ``directory``, once per process and rule set."""
+    return LintCache(directory, ruleset)
+
+
+def _lint_file_captured(path: Path, options: LintOptions) -> FileLintReport:
+    """Lint one file, capturing its output so it can be replayed in order."""
+    ruleset = FLOW_FIX_RULESET if options.fix_flow else LINT_RULESET
+    cache = open_lint_cache(options.cache_dir, ruleset) if options.cache_dir else None
+    if options.trace:
+        recorder: Recorder = TraceRecorder()
+    else:
+        recorder = Recorder() if options.stats else NULL_RECORDER
+    with (
+        recorder.span(str(path), "file"),
+        contextlib.redirect_stdout(io.StringIO()) as output,
+    ):
+        if options.stream:
+            exit_code, result = lint_file_streaming(
+                path, cache, options.all_diagnostics, recorder
+            )
+        else:
+            exit_code, result = lint_file(
+                path,
+                options.fix,
+                cache,
+                options.all_diagnostics,
+                options.fix_flow,
+                options.in_place,
+                options.emit,
+                options.compression_level,
+                recorder,
+            )
+    return FileLintReport(
+        path,
+        exit_code,
+        result,
+        output.getvalue(),
+        recorder if recorder.enabled else None,
+    )
+
+
+_GLOB_MAGIC = re.compile(r"[*?[]")
+
+# File types picked up when searching directories for prompts.
+PROMPT_SUFFIXES = frozenset({".json", PAYLOAD_SUFFIX})
+
+
+def is_prompt_file_name(name: str | os.PathLike[str]) -> bool:
+    """
+    Return whether a file found in a directory search should be linted.
+
+    It should if it has one of the `PROMPT_SUFFIXES`, in any case (as
+    ``.JSON`` files saved on Windows), and is not a copy
+    written by `fixed_output_path`, which would otherwise be linted (and
+    fixed again) alongside its original.
+    """
+    stem, suffix = os.path.splitext(os.path.basename(name))
+    return suffix.lower() in PROMPT_SUFFIXES and not stem.endswith(FIXED_STEM_SUFFIX)
+
+
+def expand_lint_paths(specs: typing.Iterable[str]) -> list[Path]:
+    """
+    Expand command-line path arguments into an ordered list of files.
+
+    Parameters
+    ----------
+    specs : iterable of str
+        Files, directories (searched recursively for ``*.json`` and
+        ``*.b64`` files, except ``*_fixed`` copies, as by
+        `is_prompt_file_name`) and glob patterns (``**`` is supported).
+
+    Returns
+    -------
+    list of Path
+        The matching files, deduplicated, in argument order. Directory and
+        glob matches are sorted so the order is deterministic. Plain paths
+        are passed through even if they do not exist, so that they are
+        reported as missing.
+    """
+    paths: dict[Path, None] = {}
+    for spec in specs:
+        path = Path(spec)
+        if path.is_dir():
+            matches = sorted(
+                p
+                for p in path.rglob("*")
+                if is_prompt_file_name(p) and p.is_file()
+            )
+        elif _GLOB_MAGIC.search(spec):
+            matches = sorted(
+                p for m in glob.glob(spec, recursive=True) if (p := Path(m)).is_file()
+            )
+        else:
+            matches = [path]
+        paths.update(dict.fromkeys(matches))
+    return list(paths)
+
+
+def lint_files(
+    paths: list[Path],
+    options: LintOptions,
+    jobs: int = 1,
+    executor: concurrent.futures.Executor | None = None,
+) -> list[FileLintReport]:
+    """
+    Lint many files, optionally across a pool of worker processes.
+
+    Parameters
+    ----------
+    paths : list of Path
+        The files to lint.
+    options : LintOptions
+        Settings applied to every file.
+    jobs : int, optional
+        Number of worker processes; 0 uses one per CPU. With a single job
+        (the default) or a single file, files are linted in-process.
+    executor : concurrent.futures.Executor, optional
+        An existing pool of worker processes to use instead; ``jobs`` is
+        then ignored.
+
+    Returns
+    -------
+    list of FileLintReport
+        One report per path, in the same order as ``paths``.
+    """
+    if executor is not None:
+        return list(
+            executor.map(_lint_file_captured, paths, itertools.repeat(options))
+        )
+    if jobs == 1 or len(paths) <= 1:
+        return [_lint_file_captured(path, options) for path in paths]
+
+    # Deferred so that single-process runs don't import it
+    import concurrent.futures
+
+    workers = min(jobs or os.cpu_count() or 1, len(paths))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() yields results in submission order, keeping output stable
+        return list(
+            pool.map(
+                _lint_file_captured,
+                paths,
+                itertools.repeat(options),
+                chunksize=max(1, len(paths) // (workers * 4)),
+            )
+        )
+
+
+def build_parser(
+    prog: str | None = None, description: str | None = None
+) -> argparse.ArgumentParser:
+    """Return the argument parser for linting files."""
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=description
+        or (
+            "Lint messages from Novelcrafter JSON prompt files "
+            "(with inline or bundled dependencies). "
+            "Exits 0 if all messages pass lint or can be fixed automatically."
+        ),
+        epilog=(
+            "Run 'prompt_lint serve --help' or 'prompt_lint client --help' "
+            "for the lint daemon."
+        ),
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        metavar="file",
+        help=(
+            "Path to a JSON prompt file or gzip+base64 payload (*.b64), a "
+            "directory to search for them, or a glob pattern."
+        ),
+    )
+    parser.add_argument(
+        "--fix",
+        action="store_true",
+        help="Attempt to fix automatically fixable lint problems.",
+    )
+    parser.add_argument(
+        "--fix-flow",
+        action="store_true",
+        help=(
+            "Also repair {#if}/{#else}/{#endif} structure by removing stray "
+            "tokens and closing unclosed blocks (implies --fix)."
+        ),
+    )
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        help=(
+            "Write fixes back to each file, atomically, instead of to "
+            "<stem>_fixed<suffix> (implies --fix)."
+        ),
+    )
+    parser.add_argument(
+        "--emit",
+        type=OutputFormat,
+        choices=list(OutputFormat),
+        help=(
+            "Write fixed copies as JSON, or as compact JSON compressed with "
+            "gzip and base64 encoded, ready to paste into Novelcrafter "
+            f"(requires --fix; default: {OutputFormat.JSON})."
+        ),
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help=(
+            "The gzip compression level for --emit b64 and payloads fixed "
+            f"--in-place (default: {DEFAULT_COMPRESSION_LEVEL})."
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Lint up to N files in parallel (0 uses one process per CPU).",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=(
+            "Reuse results for messages that are unchanged since a previous "
+            f"run (stored in {default_cache_dir()})."
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="DIR",
+        help="Use the lint cache in DIR (implies --cache).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Lint messages as they are read instead of loading each file "
+            "whole. Cannot be combined with --fix."
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        type=Path,
+        action="append",
+        metavar="DIR",
+        help=(
+            "Lint the prompts in DIR, then keep re-linting the files and "
+            "messages that change until interrupted. May be repeated."
+        ),
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="With --watch, poll for changes instead of using inotify.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help=(
+            "Print the time spent in each phase of the run, counts of the "
+            "messages, expressions and fixes linted, and the throughput."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        metavar="FILE",
+        help=(
+            "Write a Chrome trace-event file of the run, with a span for "
+            "every file, prompt, message and phase in each worker, to open "
+            "in chrome://tracing or Perfetto."
+        ),
+    )
+    parser.add_argument(
+        "--all-diagnostics",
+        action="store_true",
+        help=(
+            "List every problem in each failing message, with its offset, "
+            "rather than only the first."
+        ),
+    )
+    return parser
+
+
+def parse_lint_args(
+    parser: argparse.ArgumentParser, argv: list[str]
+) -> argparse.Namespace:
+    """Parse and validate arguments from a parser made by `build_parser`."""
+    args = parser.parse_args(argv)
+    args.fix = args.fix or args.fix_flow or args.in_place
+    if args.jobs < 0:
+        parser.error("--jobs must be zero or a positive integer")
+    if args.stream and args.fix:
+        parser.error("--stream cannot be combined with --fix")
+    # Both only shape the fixed copies, so they are rejected rather than
+    # ignored when nothing would be written
+    if args.emit is not None and not args.fix:
+        parser.error("--emit requires --fix")
+    if args.emit is not None and args.in_place:
+        parser.error("--emit cannot be combined with --in-place")
+    if args.compression_level is not None and not (
+        args.emit == OutputFormat.B64 or args.in_place
+    ):
+        parser.error("--compression-level requires --emit b64 or --in-place")
+    args.emit = args.emit or OutputFormat.JSON
+    if args.compression_level is None:
+        args.compression_level = DEFAULT_COMPRESSION_LEVEL
+    if args.watch:
+        if args.files:
+            parser.error("--watch cannot be combined with file arguments")
+        if args.fix:
+            parser.error("--watch cannot be combined with --fix")
+        if args.stats or args.trace:
+            parser.error("--watch cannot be combined with --stats or --trace")
+        if not_directories := [str(d) for d in args.watch if not d.is_dir()]:
+            parser.error(f"--watch needs a directory: {', '.join(not_directories)}")
+    elif args.poll:
+        parser.error("--poll requires --watch")
+    elif not args.files:
+        parser.error("the following arguments are required: file")
+    return args
+
+
+def options_from_args(args: argparse.Namespace) -> LintOptions:
+    """Build the `LintOptions` described by parsed command-line arguments."""
+    return LintOptions(
+        fix=args.fix,
+        stream=args.stream,
+        cache_dir=args.cache_dir or (default_cache_dir() if args.cache else None),
+        all_diagnostics=args.all_diagnostics,
+        fix_flow=args.fix_flow,
+        in_place=args.in_place,
+        emit=args.emit,
+        compression_level=args.compression_level,
+        stats=args.stats,
+        trace=args.trace is not None,
+    )
+
+
+def render_reports(reports: list[FileLintReport]) -> int:
+    """
+    Print the output of a lint run.
+
+    Parameters
+    ----------
+    reports : list of FileLintReport
+        The per-file reports, in the order they should be shown.
+
+    Returns
+    -------
+    int
+        The exit code for the run: the highest of the per-file codes.
+    """
+    for report in reports:
+        if len(reports) > 1:
+            print(f"Checking file {report.path}")
+        print(report.output, end="")
+
+    if len(reports) > 1:
+        result = functools.reduce(
+            LintResult.tally, (report.result for report in reports)
+        )
+        outcome = "all passed" if result.success else "some had errors"
+        print(f"Checked {len(reports)} files: {outcome}")
+
+    return max((report.exit_code for report in reports), default=0)
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    match argv:
+        case ["serve", *daemon_argv]:
+            from .lint_daemon import serve_main
+
+            serve_main(daemon_argv)
+        case ["client", *client_argv]:
+            from .lint_client import client_main
+
+            client_main(client_argv)
+
+    args = parse_lint_args(build_parser(), argv)
+    if args.watch:
+        from .watch import watch
+
+        watch(args.watch, options_from_args(args), args.poll)
+
+    paths = expand_lint_paths(args.files)
+    if not paths:
+        print("No prompt files found")
+        exit(8)
+
+    recorder = TraceRecorder() if args.trace else Recorder()
+    start = time.perf_counter()
+    with recorder.span("prompt_lint", "run", {"files": len(paths)}):
+        reports = lint_files(paths, options_from_args(args), args.jobs)
+    wall_seconds = time.perf_counter() - start
+    exit_code = render_reports(reports)
+    for report in reports:
+        if report.stats is not None:
+            recorder.merge(report.stats)
+    if args.stats:
+        print(render_stats(recorder, wall_seconds), end="")
+    if args.trace:
+        write_trace(args.trace, recorder.events)
+        print(f"Trace written to {args.trace}")
+    exit(exit_code)
 
 
 if __name__ == "__main__":
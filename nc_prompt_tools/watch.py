@@ -0,0 +1,424 @@
+"""
+watch.py
+
+Watch mode: keep linting prompt files as they change.
+
+``prompt_lint --watch DIR`` lints every prompt under ``DIR`` and then waits
+for changes, re-linting only the files whose contents changed. On Linux
+changes are reported by inotify, called through `ctypes`; elsewhere, or
+if inotify is unavailable, directories are polled. Bursts of events, such
+as an editor's save sequence, are debounced into a single re-lint.
+
+Each watched file keeps a `MemoryLintCache` of its messages' results, so a
+re-lint only checks the messages whose text changed.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import ctypes
+import ctypes.util
+import dataclasses
+import datetime
+import hashlib
+import io
+import os
+import selectors
+import struct
+import time
+import typing
+from pathlib import Path
+
+from .lint_cache import MemoryLintCache
+from .prompt_lint import (
+    FileLintReport,
+    LintOptions,
+    expand_lint_paths,
+    is_prompt_file_name,
+    lint_file,
+)
+
+# Seconds to wait for a burst of changes to settle before re-linting.
+DEFAULT_DEBOUNCE = 0.1
+
+# Seconds between scans when polling.
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify event masks, from <sys/inotify.h>.
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_ONLYDIR
+)
+
+# struct inotify_event: wd, mask, cookie and the length of the name that
+# follows it.
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+_READ_SIZE = 64 * 1024
+
+
+class Watcher(typing.Protocol):
+    """A source of changed prompt file paths."""
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        """
+        Wait for changes.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Seconds to wait at most; None waits for a change.
+
+        Returns
+        -------
+        set of Path
+            Prompt files (and directories) that may have been created,
+            modified or removed. Empty if nothing changed in time.
+        """
+        ...
+
+    def close(self) -> None:
+        """Release the watcher's resources."""
+        ...
+
+
+class InotifyWatcher:
+    """
+    Watch directory trees with Linux inotify, called through `ctypes`.
+
+    Parameters
+    ----------
+    directories : list of Path
+        The directories to watch, recursively.
+
+    Raises
+    ------
+    OSError
+        If inotify is not available.
+    """
+
+    def __init__(self, directories: list[Path]) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError as e:
+            raise OSError("inotify is not available") from e
+        self._add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        if (fd := init(os.O_NONBLOCK | os.O_CLOEXEC)) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._fd = fd
+        self._roots = directories
+        self._directories: dict[int, Path] = {}
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(fd, selectors.EVENT_READ)
+        for directory in directories:
+            self._watch_tree(directory)
+
+    def _watch_tree(self, directory: Path) -> set[Path]:
+        """Watch a directory and its subdirectories; return prompts in them."""
+        found: set[Path] = set()
+        for parent, subdirectories, files in os.walk(directory):
+            wd = self._add_watch(self._fd, os.fsencode(parent), _WATCH_MASK)
+            if wd < 0:
+                # Removed before it could be watched
+                subdirectories.clear()
+                continue
+            self._directories[wd] = Path(parent)
+            found.update(
+                Path(parent, name)
+                for name in files
+                if is_prompt_file_name(name)
+            )
+        return found
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        if not self._selector.select(timeout):
+            return set()
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed: set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost; report everything
+                changed.update(expand_lint_paths(map(str, self._roots)))
+                continue
+            if mask & _IN_IGNORED:
+                self._directories.pop(wd, None)
+                continue
+            if (parent := self._directories.get(wd)) is None:
+                continue
+            path = parent / os.fsdecode(name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    changed.update(self._watch_tree(path))
+                else:
+                    changed.add(path)
+            elif is_prompt_file_name(path):
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        self._selector.close()
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Watch directory trees by periodically comparing file sizes and times.
+
+    Parameters
+    ----------
+    directories : list of Path
+        The directories to watch, recursively.
+    interval : float, optional
+        Seconds between scans.
+    """
+
+    def __init__(
+        self, directories: list[Path], interval: float = DEFAULT_POLL_INTERVAL
+    ) -> None:
+        self._specs = [str(directory) for directory in directories]
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        snapshot = {}
+        for path in expand_lint_paths(self._specs):
+            with contextlib.suppress(OSError):
+                stat = path.stat()
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: float | None) -> set[Path]:
+        if timeout is not None:
+            time.sleep(min(timeout, self._interval))
+        else:
+            time.sleep(self._interval)
+        previous, self._snapshot = self._snapshot, self._scan()
+        return {
+            path
+            for path in previous.keys() | self._snapshot.keys()
+            if previous.get(path) != self._snapshot.get(path)
+        }
+
+    def close(self) -> None:
+        pass
+
+
+def open_watcher(directories: list[Path], poll: bool = False) -> Watcher:
+    """
+    Return the best available watcher for ``directories``.
+
+    Parameters
+    ----------
+    directories : list of Path
+        The directories to watch, recursively.
+    poll : bool, optional
+        Always poll, even if inotify is available.
+
+    Returns
+    -------
+    Watcher
+        An `InotifyWatcher` where possible, otherwise a `PollingWatcher`.
+    """
+    if not poll:
+        with contextlib.suppress(OSError):
+            return InotifyWatcher(directories)
+    return PollingWatcher(directories)
+
+
+def iter_change_batches(
+    watcher: Watcher, debounce: float = DEFAULT_DEBOUNCE
+) -> typing.Iterator[set[Path]]:
+    """
+    Yield batches of changes, once each burst of changes has settled.
+
+    Parameters
+    ----------
+    watcher : Watcher
+        The source of changes.
+    debounce : float, optional
+        A batch is complete once no further change arrives for this many
+        seconds.
+
+    Yields
+    ------
+    set of Path
+        The paths changed in each burst.
+    """
+    while True:
+        if not (changed := watcher.wait(None)):
+            continue
+        while more := watcher.wait(debounce):
+            changed |= more
+        yield changed
+
+
+@dataclasses.dataclass(slots=True)
+class _WatchedFile:
+    digest: bytes
+    cache: MemoryLintCache
+
+
+class WatchSession:
+    """
+    The lint state of a set of watched files.
+
+    Parameters
+    ----------
+    options : LintOptions
+        Settings applied to every file. Fixes are not supported.
+
+    Attributes
+    ----------
+    checked, reused : int
+        Messages checked and messages whose result was reused by the last
+        `update`.
+    """
+
+    def __init__(self, options: LintOptions) -> None:
+        self.options = options
+        self._files: dict[Path, _WatchedFile] = {}
+        self.checked = 0
+        self.reused = 0
+
+    def update(
+        self, paths: typing.Iterable[Path]
+    ) -> tuple[list[FileLintReport], list[Path]]:
+        """
+        Re-lint the files among ``paths`` whose contents changed.
+
+        Parameters
+        ----------
+        paths : iterable of Path
+            Paths that may have changed: prompt files, or directories whose
+            removal removed watched files.
+
+        Returns
+        -------
+        tuple of (list of FileLintReport, list of Path)
+            Reports for the files that were linted, and the watched files
+            that no longer exist, both in path order.
+        """
+        candidates = set(paths)
+        # A directory that was removed or moved away takes its files with it
+        candidates.update(
+            path
+            for path in self._files
+            if not candidates.isdisjoint(path.parents)
+        )
+
+        self.checked = self.reused = 0
+        reports: list[FileLintReport] = []
+        removed: list[Path] = []
+        for path in sorted(candidates):
+            try:
+                digest = hashlib.blake2b(path.read_bytes()).digest()
+            except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+                if self._files.pop(path, None) is not None:
+                    removed.append(path)
+                continue
+
+            watched = self._files.get(path)
+            if watched is not None and watched.digest == digest:
+                continue
+            if watched is None:
+                watched = _WatchedFile(digest, MemoryLintCache())
+                self._files[path] = watched
+            watched.digest = digest
+
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                exit_code, result = lint_file(
+                    path,
+                    False,
+                    watched.cache,
+                    self.options.all_diagnostics,
+                )
+            self.checked += watched.cache.misses
+            self.reused += watched.cache.hits
+            watched.cache.sweep()
+            reports.append(
+                FileLintReport(path, exit_code, result, output.getvalue())
+            )
+        return reports, removed
+
+
+def watch(
+    directories: list[Path],
+    options: LintOptions,
+    poll: bool = False,
+    debounce: float = DEFAULT_DEBOUNCE,
+) -> typing.NoReturn:
+    """
+    Lint the prompts in ``directories``, then re-lint them as they change.
+
+    Runs until interrupted.
+
+    Parameters
+    ----------
+    directories : list of Path
+        The directories to watch, recursively.
+    options : LintOptions
+        Settings applied to every file. Fixes are not supported.
+    poll : bool, optional
+        Poll for changes even if inotify is available.
+    debounce : float, optional
+        Seconds for a burst of changes to settle, as for
+        `iter_change_batches`.
+    """
+    session = WatchSession(options)
+    watcher = open_watcher(directories, poll)
+    method = "polling" if isinstance(watcher, PollingWatcher) else "inotify"
+    print(f"Watching {', '.join(map(str, directories))} ({method})")
+
+    def show(reports: list[FileLintReport], removed: list[Path]) -> None:
+        for path in removed:
+            print(f"No longer watching {path} (removed)")
+        for report in reports:
+            print(f"Checking file {report.path}")
+            print(report.output, end="")
+        if reports or removed:
+            now = datetime.datetime.now().strftime("%H:%M:%S")
+            print(
+                f"[{now}] Checked {session.checked} messages, "
+                f"reused {session.reused} unchanged"
+            )
+
+    try:
+        show(*session.update(expand_lint_paths(map(str, directories))))
+        for changed in iter_change_batches(watcher, debounce):
+            show(*session.update(changed))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    exit(0)
@@ -0,0 +1,169 @@
+import dataclasses
+import json
+
+import pytest
+
+from nc_prompt_tools.bench import cli
+from nc_prompt_tools.bench.corpus import (
+    CorpusSpec,
+    generate_corpus,
+    iter_message_texts,
+    write_corpus,
+)
+from nc_prompt_tools.bench.suites import (
+    BENCHMARK_NAMES,
+    BenchmarkResult,
+    BenchmarkRun,
+    Comparison,
+    build_suite,
+    compare_runs,
+    run_suite,
+)
+from nc_prompt_tools.prompt_lint import (
+    CheckFileBalanceResult,
+    check_file_balance,
+    fix_message_content,
+)
+
+TINY = CorpusSpec(bundles=2, dependencies=2, messages=4)
+
+
+class TestCorpus:
+    def test_seeded(self):
+        assert generate_corpus(TINY) == generate_corpus(TINY)
+        assert generate_corpus(TINY) != generate_corpus(CorpusSpec(seed=1, bundles=2))
+
+    def test_shape(self):
+        corpus = generate_corpus(TINY)
+        assert len(corpus) == 2
+        assert all(len(bundle) == 3 for bundle in corpus)
+        assert all(len(prompt["messages"]) == 4 for prompt in corpus[0])
+
+    def test_only_parentheses_are_broken(self):
+        spec = CorpusSpec(bundles=1, dependencies=0, messages=4, broken=1.0)
+        for text in iter_message_texts(generate_corpus(spec)):
+            assert check_file_balance(text) in (
+                CheckFileBalanceResult.OK,
+                CheckFileBalanceResult.MISMATCHED_PARENTHESIS,
+            )
+            assert check_file_balance(fix_message_content(text)) == (
+                CheckFileBalanceResult.OK
+            )
+
+    def test_valid_by_default(self):
+        spec = CorpusSpec(bundles=1, dependencies=0, messages=4, broken=0)
+        for text in iter_message_texts(generate_corpus(spec)):
+            assert check_file_balance(text) == CheckFileBalanceResult.OK
+
+    def test_write_corpus(self, tmp_path):
+        corpus = generate_corpus(TINY)
+        paths = write_corpus(corpus, tmp_path / "corpus")
+        assert [json.loads(path.read_text()) for path in paths] == corpus
+
+
+class TestSuites:
+    def test_suite_names(self, tmp_path):
+        suite = build_suite(generate_corpus(TINY), tmp_path)
+        assert tuple(benchmark.name for benchmark in suite) == BENCHMARK_NAMES
+
+    def test_results_round_trip(self, tmp_path):
+        run = run_suite(TINY, repeat=2, only={"check_file_balance", "main"})
+        assert [result.name for result in run.results] == [
+            "check_file_balance",
+            "main",
+        ]
+        assert all(len(result.times) == 2 for result in run.results)
+        path = tmp_path / "results.json"
+        run.save(path)
+        assert BenchmarkRun.load(path) == run
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "results.json"
+        path.write_text('{"format": 99}')
+        with pytest.raises(ValueError, match="supported format"):
+            BenchmarkRun.load(path)
+
+
+def timings(*times):
+    return BenchmarkResult("check_file_balance", times, 1, 1)
+
+
+class TestStatistics:
+    @pytest.mark.parametrize(
+        "n, bounds",
+        [(5, (1, 5)), (6, (1, 6)), (10, (2, 9)), (20, (6, 15))],
+    )
+    def test_confidence_interval(self, n, bounds):
+        # The standard 95% order-statistic intervals for the median
+        result = timings(*range(n, 0, -1))
+        assert result.confidence_interval() == bounds
+
+    def test_regression_needs_threshold_and_separation(self):
+        baseline = timings(*[1.0] * 10)
+        assert Comparison(baseline, timings(*[1.2] * 10)).regressed(0.1)
+        assert not Comparison(baseline, timings(*[1.05] * 10)).regressed(0.1)
+        # A slower median whose interval overlaps the baseline's is noise
+        noisy = timings(0.9, 0.95, 1.0, 1.2, 1.2, 1.2, 1.3, 1.4, 1.5, 1.6)
+        assert not Comparison(baseline, noisy).regressed(0.1)
+
+    def test_noisy_baseline_round_does_not_hide_regression(self):
+        baseline = timings(1.0, 1.0, 1.0, 1.0, 1.5)
+        assert Comparison(baseline, timings(*[1.3] * 15)).regressed(0.1)
+
+    def test_compare_runs_pairs_by_name(self):
+        spec = CorpusSpec()
+        first = BenchmarkResult("main", (1.0,), 1, 1)
+        second = BenchmarkResult("check_file_balance", (1.0,), 1, 1)
+        baseline = BenchmarkRun(spec, (first, second), {})
+        current = BenchmarkRun(spec, (second,), {})
+        assert compare_runs(baseline, current) == [Comparison(second, second)]
+
+
+def test_run_command(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(
+            ["run", "--bundles", "1", "--dependencies", "0", "--messages", "2"]
+            + ["--repeat", "1", "--only", "parse_braced_expressions"]
+            + ["--output", str(output)]
+        )
+    assert excinfo.value.code == 0
+    assert "parse_braced_expressions" in capsys.readouterr().out
+    (result,) = BenchmarkRun.load(output).results
+    assert result.name == "parse_braced_expressions"
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    run = run_suite(TINY, repeat=3, only={"check_file_balance"})
+    return run, tmp_path / "baseline.json"
+
+
+def scaled(run, factor):
+    return dataclasses.replace(
+        run,
+        results=tuple(
+            dataclasses.replace(
+                result, times=tuple(time * factor for time in result.times)
+            )
+            for result in run.results
+        ),
+    )
+
+
+@pytest.mark.parametrize("factor, exit_code", [(1e-6, 1), (1e6, 0)])
+def test_compare_command(baseline, factor, exit_code, capsys):
+    run, path = baseline
+    scaled(run, factor).save(path)
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(["compare", str(path), "--repeat", "3", "--warmup", "0"])
+    assert excinfo.value.code == exit_code
+    output = capsys.readouterr().out
+    assert ("REGRESSED" in output) == (exit_code == 1)
+
+
+def test_compare_command_without_baseline(tmp_path, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(["compare", str(tmp_path / "missing.json")])
+    assert excinfo.value.code == 2
+    assert "Cannot load baseline" in capsys.readouterr().out
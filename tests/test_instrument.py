@@ -0,0 +1,187 @@
+import json
+
+import pytest
+
+from nc_prompt_tools import prompt_lint
+from nc_prompt_tools.instrument import (
+    NULL_RECORDER,
+    Recorder,
+    TraceEvent,
+    TraceRecorder,
+    render_stats,
+    write_trace,
+)
+from nc_prompt_tools.prompt_lint import LintOptions, check_message, lint_files
+
+
+class TestRecorder:
+    def test_span_and_count(self):
+        recorder = Recorder()
+        for _ in range(3):
+            with recorder.span("check"):
+                pass
+        recorder.count("messages", 2)
+        recorder.count("messages")
+        with recorder.span("a.json", "file"):
+            pass
+        assert recorder.calls == {"check": 3}
+        assert recorder.nanoseconds["check"] >= 0
+        assert recorder.counters == {"messages": 3}
+
+    def test_timed_iter(self):
+        recorder = Recorder()
+        assert list(recorder.timed_iter("json.load", "ab")) == ["a", "b"]
+        # One step per item, and one to find the end
+        assert recorder.calls == {"json.load": 3}
+
+    def test_merge(self):
+        first = Recorder({"check": 5}, {"check": 1}, {"messages": 1})
+        second = Recorder({"check": 7, "fix": 2}, {"check": 2, "fix": 1}, {})
+        first.merge(second)
+        assert first == Recorder(
+            {"check": 12, "fix": 2}, {"check": 3, "fix": 1}, {"messages": 1}
+        )
+
+    def test_null_recorder_records_nothing(self):
+        with NULL_RECORDER.span("check"):
+            NULL_RECORDER.count("messages")
+        assert list(NULL_RECORDER.timed_iter("json.load", "ab")) == ["a", "b"]
+        assert not NULL_RECORDER.enabled
+        assert (NULL_RECORDER.calls, NULL_RECORDER.counters) == ({}, {})
+
+
+class TestTraceRecorder:
+    def test_spans_of_every_category(self):
+        recorder = TraceRecorder()
+        with recorder.span("a.json", "file", {"size": 1}):
+            with recorder.span("check"):
+                pass
+        check, file = recorder.events
+        assert (check.name, check.category) == ("check", "phase")
+        assert (file.name, file.category, file.args) == ("a.json", "file", {"size": 1})
+        assert file.start <= check.start
+        assert check.start + check.duration <= file.start + file.duration
+        assert recorder.calls == {"check": 1}
+
+    def test_indexed_span_names(self):
+        recorder = TraceRecorder()
+        with recorder.span("message", "message", index=3):
+            with recorder.span("message", "message", index=None):
+                pass
+        assert [event.name for event in recorder.events] == ["message", "message 3"]
+
+    def test_merge_keeps_other_processes_events(self):
+        event = TraceEvent("b.json", "file", 0, 10, 1, 2)
+        worker = TraceRecorder(events=[event], pid=1, tid=2)
+        recorder = TraceRecorder()
+        recorder.merge(worker)
+        recorder.merge(Recorder({"check": 5}, {"check": 1}))
+        assert recorder.events == [event]
+        assert recorder.calls == {"check": 1}
+
+    def test_write_trace(self, tmp_path):
+        path = tmp_path / "trace.json"
+        write_trace(path, [TraceEvent("check", "phase", 2000, 500, 1, 2)])
+        trace = json.loads(path.read_text())
+        assert trace["traceEvents"][0] == {
+            "name": "check",
+            "cat": "phase",
+            "ph": "X",
+            "ts": 2.0,
+            "dur": 0.5,
+            "pid": 1,
+            "tid": 2,
+        }
+        names = {
+            event["pid"]: event["args"]["name"]
+            for event in trace["traceEvents"]
+            if event["ph"] == "M"
+        }
+        assert names[1] == "prompt_lint worker"
+        assert "prompt_lint" in names.values()
+
+
+def test_check_message_counts():
+    recorder = Recorder()
+    check_message("{#if (x)}{a (b}{#else}{c}{#endif}", fix=True, recorder=recorder)
+    assert recorder.counters == {
+        "messages": 1,
+        "expressions": 5,
+        "tokens": 3,
+        "fixes": 1,
+    }
+    assert set(recorder.calls) == {"check", "fix"}
+
+
+def test_render_stats():
+    recorder = Recorder(
+        {"fix": 2_000_000, "json.load": 1_000_000, "custom": 1_000_000},
+        {"fix": 4, "json.load": 1, "custom": 1},
+        {"messages": 4, "bytes": 2_000_000, "files": 1},
+    )
+    lines = render_stats(recorder, 2.0).splitlines()
+    assert [line.split()[0] for line in lines[1:4]] == ["json.load", "fix", "custom"]
+    assert lines[2].split() == ["fix", "4", "2.00", "50.0%", "1000.0"]
+    assert lines[4] == "1 files, 2000000 bytes, 4 messages"
+    assert lines[5] == "Linted in 2.000 s: 1.0 MB/s, 2 messages/s"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_stats_are_returned_by_workers(tmp_path, jobs):
+    for name in ("a.json", "b.json"):
+        (tmp_path / name).write_text(
+            json.dumps({"messages": [{"text": "{a (b}"}, {"text": "{c}"}]})
+        )
+    paths = sorted(tmp_path.iterdir())
+    reports = lint_files(paths, LintOptions(fix=True, stats=True), jobs)
+    for report in reports:
+        assert report.stats.counters["files"] == 1
+        assert report.stats.counters["messages"] == 2
+        assert {"read", "json.load", "check", "fix", "dump"} <= set(report.stats.calls)
+    assert all(
+        report.stats is None for report in lint_files(paths, LintOptions(), jobs)
+    )
+
+
+def test_stats_option(tmp_path, capsys):
+    path = tmp_path / "prompt.json"
+    path.write_text(json.dumps({"messages": [{"text": "{a}"}]}))
+    with pytest.raises(SystemExit) as excinfo:
+        prompt_lint.main(["--stats", "--stream", str(path)])
+    assert excinfo.value.code == 0
+    output = capsys.readouterr().out
+    assert "1 files" in output
+    assert "messages/s" in output
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_trace_option(tmp_path, jobs, capsys):
+    for name in ("a.json", "b.json"):
+        (tmp_path / name).write_text(
+            json.dumps([{"messages": [{"text": "{a}"}]}, {"messages": []}])
+        )
+    trace_path = tmp_path / "trace.json"
+    with pytest.raises(SystemExit) as excinfo:
+        prompt_lint.main(["--trace", str(trace_path), "-j", jobs, str(tmp_path)])
+    assert excinfo.value.code == 0
+    assert f"Trace written to {trace_path}" in capsys.readouterr().out
+
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    assert sorted(
+        event["name"] for event in spans if event["cat"] == "file"
+    ) == [str(tmp_path / "a.json"), str(tmp_path / "b.json")]
+    assert [event["name"] for event in spans if event["cat"] == "prompt"] == [
+        "prompt",
+        "dependency 1",
+    ] * 2
+    assert [event["name"] for event in spans if event["cat"] == "message"] == [
+        "message 0"
+    ] * 2
+    assert {"read", "json.load", "check"} <= {
+        event["name"] for event in spans if event["cat"] == "phase"
+    }
+    (run,) = [event for event in spans if event["cat"] == "run"]
+    assert all(
+        run["ts"] <= event["ts"] <= run["ts"] + run["dur"] for event in spans
+    )
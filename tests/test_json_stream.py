@@ -0,0 +1,144 @@
+import io
+import json
+
+import pytest
+
+from nc_prompt_tools.json_stream import (
+    JSONStreamError,
+    MessageTextSpan,
+    PromptShapeError,
+    StreamedMessage,
+    StreamedPrompt,
+    UnsupportedDocumentError,
+    iter_message_text_spans,
+    iter_prompt_events,
+    splice_message_texts,
+)
+from nc_prompt_tools.prompt_lint import LintOptions, lint_files
+
+
+def events(document: str, chunk_size: int = 3) -> list:
+    return list(iter_prompt_events(io.StringIO(document), chunk_size))
+
+
+BUNDLE = [
+    {
+        "name": "prompt",
+        "settings": {"nested": [1, {"x": "}]\"{["}], "flag": True},
+        "messages": [{"text": "{a (b)}", "role": "user"}, {"text": "é \\ \" x"}],
+    },
+    {"messages": [], "extra": None},
+    {"messages": [{"text": ""}], "count": -1.5e3},
+]
+
+
+class TestPromptEvents:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 5, 4096])
+    @pytest.mark.parametrize("indent", [None, 2])
+    def test_bundle(self, chunk_size, indent):
+        document = json.dumps(BUNDLE, indent=indent)
+        assert events(document, chunk_size) == [
+            StreamedPrompt(0),
+            StreamedMessage(0, 0, BUNDLE[0]["messages"][0]),
+            StreamedMessage(0, 1, BUNDLE[0]["messages"][1]),
+            StreamedPrompt(1),
+            StreamedPrompt(2),
+            StreamedMessage(2, 0, {"text": ""}),
+        ]
+
+    def test_single_prompt(self):
+        assert events('{"messages": [{"text": "hi"}]}') == [
+            StreamedPrompt(None),
+            StreamedMessage(None, 0, {"text": "hi"}),
+        ]
+
+    def test_messages_decoded_lazily(self):
+        stream = iter_prompt_events(io.StringIO('{"messages": [{"text": "a"}, oops]}'))
+        assert next(stream) == StreamedPrompt(None)
+        assert next(stream) == StreamedMessage(None, 0, {"text": "a"})
+        with pytest.raises(JSONStreamError):
+            next(stream)
+
+    @pytest.mark.parametrize(
+        "document",
+        ['{"other": []}', '{"messages": {}}', '[{"messages": []}, 3]'],
+    )
+    def test_bad_shape(self, document):
+        with pytest.raises(PromptShapeError):
+            events(document)
+
+    def test_unsupported(self):
+        with pytest.raises(UnsupportedDocumentError):
+            events('"text"')
+
+    @pytest.mark.parametrize(
+        "document",
+        ['{"messages": [', '{"messages": []', '{"messages": []} {}', ""],
+    )
+    def test_malformed(self, document):
+        with pytest.raises(JSONStreamError):
+            events(document)
+
+
+class TestMessageTextSpans:
+    @pytest.mark.parametrize("indent", [None, 2])
+    def test_spans(self, indent):
+        document = json.dumps(BUNDLE, indent=indent)
+        spans = list(iter_message_text_spans(document))
+        assert [(span.prompt_index, span.index) for span in spans] == [
+            (0, 0),
+            (0, 1),
+            (2, 0),
+        ]
+        assert [json.loads(document[span.start : span.end]) for span in spans] == [
+            "{a (b)}",
+            'é \\ " x',
+            "",
+        ]
+
+    def test_skips_messages_without_string_text(self):
+        document = '{"messages": [1, {"role": "x"}, {"text": null}, {"text": "a"}]}'
+        assert list(iter_message_text_spans(document)) == [
+            MessageTextSpan(None, 3, 57, 60)
+        ]
+
+    def test_last_duplicate_key_wins(self):
+        document = '{"messages": [{"text": "a", "text": "b"}]}'
+        (span,) = iter_message_text_spans(document)
+        assert document[span.start : span.end] == '"b"'
+
+
+class TestSpliceMessageTexts:
+    def test_preserves_everything_else(self):
+        document = json.dumps(BUNDLE, indent=4).replace("\n", "\r\n")
+        spliced = splice_message_texts(document, {(0, 0): "{a (b))}", (2, 0): "new"})
+        expected = json.loads(document)
+        expected[0]["messages"][0]["text"] = "{a (b))}"
+        expected[2]["messages"][0]["text"] = "new"
+        assert json.loads(spliced) == expected
+        changed = [
+            (old, new)
+            for old, new in zip(document.split("\r\n"), spliced.split("\r\n"))
+            if old != new
+        ]
+        assert len(changed) == 2
+
+    def test_keeps_ascii_escaping(self):
+        escaped = '{"messages": [{"text": "\\u00e9 {x"}]}'
+        assert splice_message_texts(escaped, {(None, 0): "é {x}"}) == (
+            '{"messages": [{"text": "\\u00e9 {x}"}]}'
+        )
+        raw = '{"messages": [{"text": "é {x"}]}'
+        assert splice_message_texts(raw, {(None, 0): "é {x}"}) == (
+            '{"messages": [{"text": "é {x}"}]}'
+        )
+
+
+def test_lint_streaming_matches_loaded(tmp_path):
+    path = tmp_path / "bundle.json"
+    bundle = BUNDLE + [{"messages": [{"text": "{(broken}"}]}]
+    path.write_text(json.dumps(bundle), encoding="utf-8")
+    (loaded,) = lint_files([path], LintOptions())
+    (streamed,) = lint_files([path], LintOptions(stream=True))
+    assert streamed == loaded
+    assert "Checking dependency 3" in streamed.output
@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from nc_prompt_tools import prompt_lint
+from nc_prompt_tools.lint_cache import (
+    CACHE_FILENAME,
+    CachedCheck,
+    LintCache,
+    MemoryLintCache,
+)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with LintCache(tmp_path, "rules") as cache:
+        yield cache
+
+
+class TestLintCache:
+    def test_round_trip(self, cache):
+        assert cache.lookup("{a}") is None
+        cache.store("{a}", CachedCheck("OK"))
+        # Buffered writes are visible before they are flushed
+        assert cache.lookup("{a}") == CachedCheck("OK")
+        cache.flush()
+        assert cache.lookup("{a}") == CachedCheck("OK")
+
+    def test_persists_fixes(self, tmp_path):
+        check = CachedCheck("MISMATCHED_PARENTHESIS", "{(a)}", True)
+        with LintCache(tmp_path, "rules") as cache:
+            cache.store("{(a}", check)
+        with LintCache(tmp_path, "rules") as cache:
+            assert cache.lookup("{(a}") == check
+
+    def test_keyed_by_ruleset(self, tmp_path):
+        with LintCache(tmp_path, "rules") as cache:
+            cache.store("{a}", CachedCheck("OK"))
+        with LintCache(tmp_path, "other rules") as cache:
+            assert cache.lookup("{a}") is None
+
+    def test_uses_wal(self, cache):
+        with sqlite3.connect(cache.path) as connection:
+            (mode,) = connection.execute("PRAGMA journal_mode").fetchone()
+        assert mode == "wal"
+
+    def test_concurrent_writers(self, tmp_path):
+        def write(worker: int) -> None:
+            with LintCache(tmp_path, "rules") as cache:
+                for i in range(50):
+                    cache.store(f"{worker}-{i}", CachedCheck("OK"))
+                    cache.flush()
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with LintCache(tmp_path, "rules") as cache:
+            assert all(cache.lookup(f"{n}-49") for n in range(4))
+
+
+class TestMemoryLintCache:
+    def test_round_trip(self):
+        cache = MemoryLintCache()
+        assert cache.lookup("{a}") is None
+        cache.store("{a}", CachedCheck("OK"))
+        assert cache.lookup("{a}") == CachedCheck("OK")
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_sweep_drops_unused_entries(self):
+        cache = MemoryLintCache()
+        cache.store("{a}", CachedCheck("OK"))
+        cache.store("{b}", CachedCheck("OK"))
+        cache.sweep()
+        assert (cache.hits, cache.misses) == (0, 0)
+        # Only "{a}" is used in this generation
+        assert cache.lookup("{a}") == CachedCheck("OK")
+        cache.sweep()
+        assert cache.lookup("{a}") == CachedCheck("OK")
+        assert cache.lookup("{b}") is None
+
+
+class TestCachedLinting:
+    def test_unchanged_messages_skip_checks(self, cache, monkeypatch):
+        assert prompt_lint.process_message_check_result("{(a}", True, cache) == (
+            True,
+            "{(a)}",
+        )
+
+        def fail(content):
+            raise AssertionError("check should have been served from the cache")
+
+        monkeypatch.setattr(prompt_lint, "check_file_balance", fail)
+        monkeypatch.setattr(prompt_lint, "fix_message_content", fail)
+        assert prompt_lint.process_message_check_result("{(a}", True, cache) == (
+            True,
+            "{(a)}",
+        )
+
+    def test_fix_computed_after_check_only_run(self, cache):
+        assert prompt_lint.process_message_check_result("{(a}", False, cache) == (
+            False,
+            None,
+        )
+        assert cache.lookup("{(a}") == CachedCheck("MISMATCHED_PARENTHESIS")
+        assert prompt_lint.process_message_check_result("{(a}", True, cache) == (
+            True,
+            "{(a)}",
+        )
+
+    def test_lint_files_with_cache_dir(self, tmp_path):
+        prompt = tmp_path / "prompt.json"
+        prompt.write_text(json.dumps({"messages": [{"text": "{a}"}]}))
+        cache_dir = tmp_path / "cache"
+        (report,) = prompt_lint.lint_files(
+            [prompt], prompt_lint.LintOptions(cache_dir=cache_dir)
+        )
+        assert report.exit_code == 0
+        assert (cache_dir / CACHE_FILENAME).exists()
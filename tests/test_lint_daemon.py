@@ -0,0 +1,216 @@
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+from nc_prompt_tools import __version__, lint_daemon
+from nc_prompt_tools.lint_client import (
+    UnsafeSocketError,
+    client_main,
+    ping,
+    send_request,
+)
+from nc_prompt_tools.lint_daemon import LintDaemon
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 characters, so avoid the
+    # deeply nested pytest tmp_path
+    with tempfile.TemporaryDirectory(prefix="pl-") as directory:
+        yield Path(directory) / "daemon.sock"
+
+
+@pytest.fixture
+def daemon(socket_path):
+    server = LintDaemon(socket_path, jobs=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    send_request(socket_path, {"op": "shutdown"})
+    thread.join(timeout=10)
+    server.server_close()
+
+
+class TestLintDaemon:
+    def test_no_daemon(self, socket_path):
+        assert ping(socket_path) is None
+
+    def test_ping(self, daemon):
+        assert ping(daemon.socket_path)["ok"] is True
+
+    def test_refuses_second_daemon(self, daemon):
+        with pytest.raises(RuntimeError, match="already running"):
+            LintDaemon(daemon.socket_path, jobs=1)
+
+    def test_lint_files(self, daemon, tmp_path):
+        path = tmp_path / "prompt.json"
+        path.write_text(json.dumps({"messages": [{"text": "{(a}"}]}))
+        response = send_request(
+            daemon.socket_path, {"op": "lint", "paths": [str(path)], "fix": True}
+        )
+        (report,) = response["reports"]
+        assert report["exit_code"] == 0
+        assert report["had_changes"] is True
+        assert "passed all checks following fixes" in report["output"]
+        assert (tmp_path / "prompt_fixed.json").exists()
+
+    def test_check_messages(self, daemon):
+        texts = ["{a}", "{(a}"] * 300
+        response = send_request(
+            daemon.socket_path, {"op": "check", "messages": texts, "fix": True}
+        )
+        assert response["results"][:2] == [
+            {"check": "OK", "fixed_content": None, "fix_succeeded": False},
+            {
+                "check": "MISMATCHED_PARENTHESIS",
+                "fixed_content": "{(a)}",
+                "fix_succeeded": True,
+            },
+        ]
+        assert len(response["results"]) == len(texts)
+
+    def test_bad_request(self, daemon):
+        response = send_request(daemon.socket_path, {"op": "nonsense"})
+        assert response["ok"] is False
+
+    def test_shutdown_removes_socket(self, socket_path):
+        server = LintDaemon(socket_path, jobs=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        assert send_request(socket_path, {"op": "shutdown"}) == {"ok": True}
+        thread.join(timeout=10)
+        server.server_close()
+        assert not socket_path.exists()
+
+    def test_run_resolves_paths_against_client_cwd(self, daemon, tmp_path):
+        (tmp_path / "prompts").mkdir()
+        (tmp_path / "prompts" / "a.json").write_text(
+            json.dumps({"messages": [{"text": "{a}"}]})
+        )
+        response = send_request(
+            daemon.socket_path,
+            {
+                "op": "run",
+                "version": __version__,
+                "argv": ["prompts", "missing.json"],
+                "cwd": str(tmp_path),
+            },
+        )
+        assert response["exit_code"] == 8
+        assert "Checking file prompts/a.json" in response["stdout"]
+        assert "Checking file missing.json" in response["stdout"]
+
+    def test_run_reports_argument_errors(self, daemon, tmp_path):
+        response = send_request(
+            daemon.socket_path,
+            {
+                "op": "run",
+                "version": __version__,
+                "argv": ["--jobs"],
+                "cwd": str(tmp_path),
+            },
+        )
+        assert response["exit_code"] == 2
+        assert "--jobs" in response["stderr"]
+
+
+@pytest.fixture
+def prompt_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "prompt.json"
+    path.write_text(json.dumps({"messages": [{"text": "{(a}"}]}))
+    return path
+
+
+@pytest.mark.parametrize("with_daemon", [True, False])
+def test_client(request, socket_path, prompt_file, with_daemon, capsys):
+    if with_daemon:
+        request.getfixturevalue("daemon")
+    with pytest.raises(SystemExit) as excinfo:
+        client_main(["--socket", str(socket_path), "prompt.json"])
+    assert excinfo.value.code == 0
+    assert "may be fixable" in capsys.readouterr().out
+
+
+def test_client_does_not_import_linter():
+    code = (
+        "import sys, nc_prompt_tools.lint_client; "
+        "print('nc_prompt_tools.prompt_lint' in sys.modules)"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert completed.stdout.strip() == "False"
+
+
+def test_forwarded_run_imports_neither_linter_nor_metadata(daemon, tmp_path):
+    path = tmp_path / "prompt.json"
+    path.write_text(json.dumps({"messages": [{"text": "{(a}"}]}))
+    code = (
+        "import sys\n"
+        "from nc_prompt_tools import lint_client\n"
+        "try:\n"
+        f"    lint_client.client_main(['--socket', {str(daemon.socket_path)!r}, "
+        f"{str(path)!r}])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "modules = {'nc_prompt_tools.prompt_lint', 'importlib.metadata'}\n"
+        "print(sorted(modules.intersection(sys.modules)), file=sys.stderr)\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert "may be fixable" in completed.stdout
+    assert completed.stderr.strip() == "[]"
+
+
+def test_daemon_refuses_run_from_other_version(daemon, tmp_path):
+    response = send_request(
+        daemon.socket_path,
+        {"op": "run", "version": "0.0-other", "argv": [], "cwd": str(tmp_path)},
+    )
+    assert response["ok"] is False
+    assert response["version"] == __version__
+
+
+def test_client_lints_in_process_for_other_daemon_version(
+    daemon, socket_path, prompt_file, monkeypatch, capsys
+):
+    monkeypatch.setattr(lint_daemon, "tool_version", lambda: "0.0-other")
+    with pytest.raises(SystemExit) as excinfo:
+        client_main(["--socket", str(socket_path), "prompt.json"])
+    assert excinfo.value.code == 0
+    output = capsys.readouterr()
+    assert "Lint daemon is version 0.0-other, client " in output.err
+    assert "may be fixable" in output.out
+
+
+class TestSocketDirectory:
+    @pytest.fixture
+    def shared_socket_path(self, socket_path):
+        socket_path.parent.chmod(0o755)
+        return socket_path
+
+    def test_daemon_refuses_shared_directory(self, shared_socket_path):
+        with pytest.raises(RuntimeError, match="only you can access"):
+            LintDaemon(shared_socket_path, jobs=1)
+
+    def test_request_refuses_shared_directory(self, shared_socket_path):
+        with pytest.raises(UnsafeSocketError):
+            ping(shared_socket_path)
+
+    def test_missing_directory_means_no_daemon(self, socket_path):
+        assert ping(socket_path.parent / "missing" / "daemon.sock") is None
+
+    def test_client_lints_in_process(self, shared_socket_path, prompt_file, capsys):
+        with pytest.raises(SystemExit) as excinfo:
+            client_main(["--socket", str(shared_socket_path), "prompt.json"])
+        assert excinfo.value.code == 0
+        output = capsys.readouterr()
+        assert "linting in-process" in output.err
+        assert "may be fixable" in output.out
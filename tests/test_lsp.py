@@ -0,0 +1,323 @@
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+from nc_prompt_tools.lsp import (
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    LanguageServer,
+    PromptTextDocument,
+)
+
+
+def prompt_source(*texts, ensure_ascii=False):
+    return json.dumps(
+        {"messages": [{"role": "user", "text": text} for text in texts]},
+        indent=2,
+        ensure_ascii=ensure_ascii,
+    )
+
+
+def diagnosed_text(document):
+    """Return the source text covered by each diagnostic."""
+    return [
+        document.text[
+            document.offset_at(diagnostic["range"]["start"]) : document.offset_at(
+                diagnostic["range"]["end"]
+            )
+        ]
+        for diagnostic in document.diagnostics()
+    ]
+
+
+def insert(document, offset, text):
+    position = document.position_at(offset)
+    document.apply_change({"range": {"start": position, "end": position}, "text": text})
+
+
+class TestPromptTextDocument:
+    def test_diagnostics_point_at_problems(self):
+        document = PromptTextDocument(prompt_source("{a(b}", "ok", "{#endif}"), 1)
+        assert diagnosed_text(document) == ["(", "{"]
+        codes = [diagnostic["code"] for diagnostic in document.diagnostics()]
+        assert codes == ["MISMATCHED_PARENTHESIS", "INVALID_FLOW_CONTROL"]
+
+    @pytest.mark.parametrize("ensure_ascii", [False, True])
+    def test_positions_account_for_escapes(self, ensure_ascii):
+        text = 'café "quoted" \U0001f600\n\t{a(b}'
+        document = PromptTextDocument(prompt_source(text, ensure_ascii=ensure_ascii), 1)
+        assert diagnosed_text(document) == ["("]
+
+    def test_edit_inside_text_rechecks_one_message(self):
+        document = PromptTextDocument(prompt_source("{a}", "{b}", "{c}"), 1)
+        assert document.diagnostics() == []
+        assert document.rechecked == 3
+
+        insert(document, document.text.index("{b}") + 2, "(")
+        assert diagnosed_text(document) == ["("]
+        assert document.rechecked == 4
+
+        # Later messages are shifted, not re-scanned
+        insert(document, document.text.index("{c}") + 2, ")")
+        assert diagnosed_text(document) == ["(", ")"]
+        assert document.rechecked == 5
+
+    def test_edits_reuse_the_message_document(self):
+        document = PromptTextDocument(prompt_source("{#if a} {b} {#endif}"), 1)
+        document.diagnostics()
+        insert(document, document.text.index("{b}") + 2, "(")
+        (message,) = document._scan()
+        parsed = message.document
+        later = parsed.expressions[2]
+        insert(document, document.text.index("(") + 1, "c")
+        assert diagnosed_text(document) == ["("]
+        # The second edit re-lexed the edited expression alone
+        assert message.document is parsed
+        assert parsed.expressions[2] is later
+
+    @pytest.mark.parametrize(
+        "offset, replacement",
+        [
+            # Beside, into and between escapes, and forming new ones
+            (3, "x"),
+            (2, "x"),
+            (11, "x"),
+            (1, "\\\\"),
+            (9, "\\u00e9"),
+            (19, "\\\\"),
+            (21, "("),
+            (18, ")"),
+        ],
+    )
+    def test_edits_around_escapes(self, offset, replacement):
+        text = 'a\n"b" é {c(}\\'
+        source = prompt_source(text, ensure_ascii=True)
+        start = source.index(json.dumps(text)[1:-1])
+        document = PromptTextDocument(source, 1)
+        assert diagnosed_text(document) == ["("]
+        insert(document, start, "{d}")
+        assert diagnosed_text(document) == ["("]
+        insert(document, start + 3 + offset, replacement)
+        expected = PromptTextDocument(document.text, 1).diagnostics()
+        assert document.diagnostics() == expected
+
+    def test_edit_ending_a_string_rescans(self):
+        document = PromptTextDocument(prompt_source("{a}", "{b}"), 1)
+        document.diagnostics()
+        insert(document, document.text.index("{a}"), '",\n"x": "')
+        assert document.diagnostics() == []
+        assert document.rechecked == 4
+
+    def test_multiline_edits_update_lines(self):
+        source = prompt_source("{a}", "{b(}")
+        document = PromptTextDocument(source, 1)
+        old = '"role": "user",\n      "text": "{a}"'
+        new = '"text": "{a}",\n\n      "role": "user"'
+        start = source.index(old)
+        document.apply_change(
+            {
+                "range": {
+                    "start": document.position_at(start),
+                    "end": document.position_at(start + len(old)),
+                },
+                "text": new,
+            }
+        )
+        assert document.text == source.replace(old, new)
+        (diagnostic,) = document.diagnostics()
+        assert diagnostic["range"]["start"]["line"] == 9
+        assert diagnosed_text(document) == ["("]
+
+    def test_full_text_change(self):
+        document = PromptTextDocument(prompt_source("{a}"), 1)
+        document.apply_change({"text": prompt_source("{a(}")})
+        assert diagnosed_text(document) == ["("]
+
+    def test_utf16_positions(self):
+        document = PromptTextDocument('{"messages": [{"text": "\U0001f600{("}]}', 1)
+        offset = document.text.index("(")
+        assert document.position_at(offset) == {"line": 0, "character": 27}
+        assert document.offset_at({"line": 0, "character": 27}) == offset
+
+    def test_utf16_positions_within_a_line(self):
+        text = '{"messages": [{"text": "é\U0001f600a\U0001f600"}]}\n{}'
+        document = PromptTextDocument(text, 1)
+        start = text.index("é")
+        for offset, character in [(0, 0), (1, 1), (2, 3), (3, 4), (4, 6)]:
+            position = {"line": 0, "character": 24 + character}
+            assert document.position_at(start + offset) == position
+            assert document.offset_at(position) == start + offset
+        # Inside a surrogate pair, and past the end of the line
+        assert document.offset_at({"line": 0, "character": 26}) == start + 1
+        assert document.offset_at({"line": 0, "character": 999}) == text.index("{}")
+
+    def test_positions_after_inserting_a_wide_character(self):
+        document = PromptTextDocument('{"messages": [{"text": "é{a("}]}', 1)
+        start = document.text.index("(")
+        assert document.position_at(start) == {"line": 0, "character": start}
+        position = document.position_at(start)
+        document.apply_change(
+            {"range": {"start": position, "end": position}, "text": "\U0001f600"}
+        )
+        offset = document.text.index("(")
+        assert document.position_at(offset) == {"line": 0, "character": start + 2}
+        assert document.offset_at({"line": 0, "character": start + 2}) == offset
+
+    def test_invalid_json(self):
+        document = PromptTextDocument('{"messages": [{"text": "a"}', 1)
+        (diagnostic,) = document.diagnostics()
+        assert diagnostic["message"].startswith("Invalid JSON")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def read_messages(output):
+    data = output.getvalue()
+    messages = []
+    while data:
+        header, _, rest = data.partition(b"\r\n\r\n")
+        length = int(header.split(b":")[1])
+        messages.append(json.loads(rest[:length]))
+        data = rest[length:]
+    output.seek(0)
+    output.truncate()
+    return messages
+
+
+class TestLanguageServer:
+    @pytest.fixture
+    def server(self):
+        return LanguageServer(io.BytesIO(), debounce=0.5, clock=FakeClock())
+
+    def open(self, server, text):
+        server.handle(
+            {
+                "method": "textDocument/didOpen",
+                "params": {
+                    "textDocument": {
+                        "uri": "file:///p.json",
+                        "version": 1,
+                        "text": text,
+                    }
+                },
+            }
+        )
+
+    def change(self, server, offset, text):
+        document = server.documents["file:///p.json"]
+        position = document.position_at(offset)
+        server.handle(
+            {
+                "method": "textDocument/didChange",
+                "params": {
+                    "textDocument": {
+                        "uri": "file:///p.json",
+                        "version": document.version + 1,
+                    },
+                    "contentChanges": [
+                        {"range": {"start": position, "end": position}, "text": text}
+                    ],
+                },
+            }
+        )
+
+    def test_initialize(self, server):
+        server.handle({"id": 1, "method": "initialize", "params": {}})
+        (response,) = read_messages(server._output)
+        sync = response["result"]["capabilities"]["textDocumentSync"]
+        assert sync == {"openClose": True, "change": 2}
+
+    def test_unknown_request(self, server):
+        server.handle({"id": 1, "method": "textDocument/hover", "params": {}})
+        server.handle({"method": "$/cancelRequest", "params": {"id": 1}})
+        (response,) = read_messages(server._output)
+        assert response["error"]["code"] == METHOD_NOT_FOUND
+
+    @pytest.mark.parametrize("message", [[], [{"id": 1}], 1, "initialize", None])
+    def test_message_not_an_object(self, server, message):
+        server.handle(message)
+        server.handle({"id": 2, "method": "shutdown"})
+        invalid, response = read_messages(server._output)
+        assert invalid["id"] is None
+        assert invalid["error"]["code"] == INVALID_REQUEST
+        assert response == {"jsonrpc": "2.0", "id": 2, "result": None}
+
+    def test_publication_is_debounced(self, server):
+        self.open(server, prompt_source("{a}"))
+        server.publish_due()
+        (published,) = read_messages(server._output)
+        assert published["params"]["diagnostics"] == []
+
+        offset = server.documents["file:///p.json"].text.index("{a}") + 2
+        self.change(server, offset, "(")
+        server._clock.now = 0.3
+        self.change(server, offset + 1, "(")
+        server._clock.now = 0.6
+        server.publish_due()
+        assert read_messages(server._output) == []
+
+        server._clock.now = 0.8
+        server.publish_due()
+        (published,) = read_messages(server._output)
+        assert published["params"]["version"] == 3
+        assert len(published["params"]["diagnostics"]) == 1
+
+    def test_close_clears_diagnostics(self, server):
+        self.open(server, prompt_source("{a(}"))
+        server.handle(
+            {
+                "method": "textDocument/didClose",
+                "params": {"textDocument": {"uri": "file:///p.json"}},
+            }
+        )
+        server.publish_due()
+        (published,) = read_messages(server._output)
+        assert published["params"]["diagnostics"] == []
+
+
+def frame(message):
+    body = json.dumps({"jsonrpc": "2.0", **message}).encode()
+    return b"Content-Length: %d\r\n\r\n" % len(body) + body
+
+
+def test_stdio_session():
+    requests = b"".join(
+        frame(message)
+        for message in [
+            {"id": 1, "method": "initialize", "params": {}},
+            {"method": "initialized", "params": {}},
+            {
+                "method": "textDocument/didOpen",
+                "params": {
+                    "textDocument": {
+                        "uri": "file:///p.json",
+                        "version": 1,
+                        "text": prompt_source("{a(}"),
+                    }
+                },
+            },
+            {"id": 2, "method": "shutdown"},
+            {"method": "exit"},
+        ]
+    )
+    completed = subprocess.run(
+        [sys.executable, "-m", "nc_prompt_tools.lsp", "--debounce", "0"],
+        input=requests,
+        capture_output=True,
+        timeout=30,
+        check=False,
+    )
+    assert completed.returncode == 0
+    messages = read_messages(io.BytesIO(completed.stdout))
+    assert [message.get("id") for message in messages] == [1, 2, None]
+    (diagnostic,) = messages[2]["params"]["diagnostics"]
+    assert diagnostic["code"] == "MISMATCHED_PARENTHESIS"
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from nc_prompt_tools import paren_batch
+from nc_prompt_tools.paren_batch import (
+    check_documents_parentheses,
+    check_parentheses_balance_batch,
+)
+from nc_prompt_tools.prompt_lint import check_parentheses_balance
+
+ENGINES = [
+    False,
+    pytest.param(
+        True,
+        marks=pytest.mark.skipif(not paren_batch.HAVE_NUMPY, reason="needs NumPy"),
+    ),
+]
+
+EXPRESSIONS = ["", "(abc)", "(abc", ")(", "(()())", "", "é(ü)", "a)", "((", "x"]
+
+
+@pytest.mark.parametrize("use_numpy", ENGINES)
+class TestBatchBalance:
+    def test_matches_scalar_checker(self, use_numpy):
+        expected = [check_parentheses_balance(e) for e in EXPRESSIONS]
+        assert check_parentheses_balance_batch(EXPRESSIONS, use_numpy) == expected
+
+    def test_random_corpus(self, use_numpy):
+        rng = random.Random(11)
+        corpus = [
+            "".join(rng.choice("(()) ab") for _ in range(rng.randrange(12)))
+            for _ in range(2000)
+        ]
+        expected = [check_parentheses_balance(e) for e in corpus]
+        assert check_parentheses_balance_batch(corpus, use_numpy) == expected
+
+    def test_empty(self, use_numpy):
+        assert check_parentheses_balance_batch([], use_numpy) == []
+        assert check_parentheses_balance_batch(["", ""], use_numpy) == [True, True]
+
+    def test_documents(self, use_numpy):
+        contents = ["{(a)} text (aside {b(}", "no braces", "{)}{}"]
+        assert check_documents_parentheses(contents, use_numpy) == [
+            [True, False],
+            [],
+            [False, True],
+        ]
+
+
+def test_falls_back_without_numpy(monkeypatch):
+    monkeypatch.setattr(paren_batch, "HAVE_NUMPY", False)
+    assert check_parentheses_balance_batch(["(a", "(a)"]) == [False, True]
+    with pytest.raises(ModuleNotFoundError):
+        check_parentheses_balance_batch(["(a"], use_numpy=True)
@@ -0,0 +1,156 @@
+import base64
+import gzip
+import io
+import json
+
+import pytest
+
+from nc_prompt_tools.payload import (
+    DEFAULT_COMPRESSION_LEVEL,
+    PayloadError,
+    is_base64_payload,
+    iter_decoded_payload,
+    iter_encoded_payload,
+    open_payload,
+)
+from nc_prompt_tools.prompt_lint import (
+    LintOptions,
+    OutputFormat,
+    build_parser,
+    lint_files,
+    parse_lint_args,
+)
+
+
+def encode(data: bytes) -> bytes:
+    # Mirror `gzip | base64`, which wraps lines at 76 characters
+    return base64.encodebytes(gzip.compress(data))
+
+
+class TestPayloadDecoding:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+    def test_round_trip(self, chunk_size):
+        data = json.dumps({"messages": [{"text": "ü {x}" * 500}]}).encode()
+        chunks = list(iter_decoded_payload(io.BytesIO(encode(data)), chunk_size))
+        assert b"".join(chunks) == data
+        assert max(map(len, chunks)) <= chunk_size
+
+    def test_invalid_base64(self):
+        with pytest.raises(PayloadError, match="base64"):
+            list(iter_decoded_payload(io.BytesIO(b"H4sI!!!!")))
+
+    def test_truncated(self):
+        encoded = base64.b64encode(gzip.compress(b"{}" * 100)[:-8])
+        with pytest.raises(PayloadError, match="truncated"):
+            list(iter_decoded_payload(io.BytesIO(encoded)))
+
+    def test_not_gzip(self):
+        with pytest.raises(PayloadError, match="gzip"):
+            list(iter_decoded_payload(io.BytesIO(base64.b64encode(b"{}" * 10))))
+
+    def test_open_payload(self, tmp_path):
+        path = tmp_path / "prompt.b64"
+        path.write_bytes(encode(b'{"messages": []}'))
+        with open_payload(path, chunk_size=4) as f:
+            assert json.load(f) == {"messages": []}
+
+
+class TestPayloadDetection:
+    def test_by_suffix(self, tmp_path):
+        path = tmp_path / "prompt.b64"
+        path.write_text("anything")
+        assert is_base64_payload(path)
+
+    def test_by_content(self, tmp_path):
+        path = tmp_path / "prompt.txt"
+        path.write_bytes(b"\n" + encode(b"{}"))
+        assert is_base64_payload(path)
+        path.write_text('{"messages": []}')
+        assert not is_base64_payload(path)
+
+
+class TestPayloadEncoding:
+    @pytest.mark.parametrize("size", [0, 56, 57, 58, 100_000])
+    def test_round_trip(self, size):
+        data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+        chunks = [data[i : i + 1000] for i in range(0, len(data), 1000)]
+        encoded = b"".join(iter_encoded_payload(chunks, compression_level=1))
+        assert gzip.decompress(base64.b64decode(encoded)) == data
+        assert b"".join(iter_decoded_payload(io.BytesIO(encoded))) == data
+
+    def test_wraps_like_base64(self):
+        data = bytes(range(256)) * 64
+        encoded = b"".join(iter_encoded_payload([data], compression_level=0))
+        lines = encoded.split(b"\n")
+        assert lines[-1] == b""
+        assert {len(line) for line in lines[:-2]} == {76}
+        assert 0 < len(lines[-2]) <= 76
+
+    def test_compression_level(self):
+        data = b"{a (b)} " * 10_000
+        sizes = [
+            len(b"".join(iter_encoded_payload([data], level))) for level in (0, 9)
+        ]
+        assert sizes[1] < sizes[0]
+
+
+def test_lint_payload_file(tmp_path):
+    path = tmp_path / "prompt.b64"
+    path.write_bytes(encode(json.dumps({"messages": [{"text": "{(a}"}]}).encode()))
+    (report,) = lint_files([path], LintOptions(fix=True))
+    assert report.exit_code == 0
+    fixed = json.loads((tmp_path / "prompt_fixed.json").read_text())
+    assert fixed == {"messages": [{"text": "{(a)}"}]}
+
+
+@pytest.mark.parametrize("source_name", ["prompt.json", "prompt.b64"])
+def test_emit_payload(tmp_path, source_name):
+    document = {"messages": [{"text": "{(a}", "role": "é"}]}
+    path = tmp_path / source_name
+    source = json.dumps(document, indent=2).encode()
+    path.write_bytes(encode(source) if source_name.endswith(".b64") else source)
+    options = LintOptions(fix=True, emit=OutputFormat.B64, compression_level=9)
+    (report,) = lint_files([path], options)
+    assert report.exit_code == 0
+    encoded = (tmp_path / "prompt_fixed.b64").read_bytes()
+    assert gzip.decompress(base64.b64decode(encoded)).decode() == (
+        '{"messages":[{"text":"{(a)}","role":"é"}]}'
+    )
+
+
+def test_in_place_payload(tmp_path):
+    path = tmp_path / "prompt.b64"
+    path.write_bytes(encode(b'{"messages": [{"text": "{(a}"}]}'))
+    (report,) = lint_files([path], LintOptions(fix=True, in_place=True))
+    assert report.exit_code == 0
+    decoded = gzip.decompress(base64.b64decode(path.read_bytes()))
+    assert json.loads(decoded) == {"messages": [{"text": "{(a)}"}]}
+    assert [p.name for p in tmp_path.iterdir()] == ["prompt.b64"]
+
+
+@pytest.mark.parametrize(
+    "argv, error",
+    [
+        (["--emit", "b64"], "--emit requires --fix"),
+        (["--fix", "--compression-level", "9"], "requires --emit b64"),
+        (["--in-place", "--emit", "json"], "cannot be combined with --in-place"),
+    ],
+)
+def test_output_options_require_fixes(argv, error, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        parse_lint_args(build_parser(), ["prompt.json", *argv])
+    assert excinfo.value.code == 2
+    assert error in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "argv, emit, level",
+    [
+        ([], OutputFormat.JSON, DEFAULT_COMPRESSION_LEVEL),
+        (["--fix", "--emit", "b64", "--compression-level", "9"], OutputFormat.B64, 9),
+        (["--in-place", "--compression-level", "1"], OutputFormat.JSON, 1),
+    ],
+)
+def test_output_options(argv, emit, level):
+    args = parse_lint_args(build_parser(), ["prompt.json", *argv])
+    assert (args.emit, args.compression_level) == (emit, level)
@@ -1,19 +1,43 @@
+import json
+
 import pytest
 
+from nc_prompt_tools import prompt_lint
 from nc_prompt_tools.prompt_lint import (
     CheckFileBalanceResult,
     ControlFlowToken,
+    ControlFlowTokenizer,
     parse_braced_expressions,
+    iter_braced_spans,
     check_parentheses_balance,
     naive_fix_expression_if_needed,
+    repair_parentheses,
     parse_control_flow_tokens,
     check_if_else_endif_structure,
     check_file_balance,
+    classify_control_flow,
+    collect_balance_issues,
+    BalanceIssue,
+    lex_message,
     fix_message_content,
     ParenthesisMismatchError,
     IllegalNestingError,
     IfControlMismatchError,
     BraceMismatchError,
+    FixAttempt,
+    FlowRepair,
+    IfBlock,
+    PromptDocument,
+    LintOptions,
+    LintResult,
+    MessageDiagnostic,
+    PromptReport,
+    Report,
+    check_message,
+    lint_document,
+    render_report,
+    expand_lint_paths,
+    lint_files,
 )
 
 
@@ -27,6 +51,29 @@ class TestBracedExpressionParsing:
         assert expressions[0][2] == "abc (xyz)"
         assert expressions[1][2] == "123 (abc)"
 
+    def test_positions(self):
+        file_content = "prose " * 100 + "{a}" + "\n" * 50 + "{}"
+        expressions = parse_braced_expressions(file_content)
+        assert expressions == [(600, 602, "a"), (653, 654, "")]
+
+    def test_stray_closing_after_expressions(self):
+        with pytest.raises(BraceMismatchError):
+            _ = parse_braced_expressions("{a} and then }")
+
+    def test_spans(self):
+        file_content = "Some text {abc (xyz)} more text {123 (abc)} end"
+        spans = iter_braced_spans(file_content)
+        assert next(spans) == (10, 20)
+        assert list(spans) == [(32, 42)]
+
+    def test_spans_are_lazy(self):
+        # Errors surface only when the scanner reaches them
+        spans = iter_braced_spans("{a} {b} }")
+        assert next(spans) == (0, 2)
+        assert next(spans) == (4, 6)
+        with pytest.raises(BraceMismatchError):
+            next(spans)
+
     def test_nested_braces(self):
         # Attempting nested braces is disallowed, so we should get IllegalNestingError
         file_content = "Text {outer {nested} stuff} more text"
@@ -60,6 +107,19 @@ class TestParenthesesHandling:
     def test_balance_check(self, expression, expected):
         assert check_parentheses_balance(expression) == expected
 
+    @pytest.mark.parametrize(
+        "start,end,expected",
+        [
+            (0, None, False),
+            (5, 12, True),
+            (7, 12, False),
+            (5, 14, False),
+        ],
+    )
+    def test_balance_check_in_place(self, start, end, expected):
+        content = "text{f(a(b))}) more"
+        assert check_parentheses_balance(content, start, end) == expected
+
     @pytest.mark.parametrize(
         "expression,expected_fixed",
         [
@@ -67,7 +127,7 @@ class TestParenthesesHandling:
             ("(abc)", "(abc)"),
             # Missing one closing parenthesis
             ("(abc", "(abc)"),
-            # More complex mismatch: naive fix won't resolve double '('
+            # Missing closing parenthesis inside a nested group
             ("((abc)", "((abc))"),
             # Already balanced multiple groups
             ("(a)(b)", "(a)(b)"),
@@ -76,6 +136,43 @@ class TestParenthesesHandling:
     def test_naive_fix(self, expression, expected_fixed):
         assert naive_fix_expression_if_needed(expression, 0) == expected_fixed
 
+    @pytest.mark.parametrize(
+        "expression,expected_repaired",
+        [
+            ("(a)(b)", "(a)(b)"),
+            ("((abc", "((abc))"),
+            # Surplus closing parentheses are deleted
+            ("a) (b))", "a (b)"),
+            (")(", "()"),
+            # A parenthesis stripped before a line break is restored there
+            ("#if (a and (b\n or c)", "#if (a and (b)\n or c)"),
+            ("(a\r\n(b", "(a)\r\n(b)"),
+            # At most one per line break, earliest first
+            ("((a\nb\nc", "((a)\nb)\nc"),
+            # A break is skipped if closing there would unbalance what follows
+            ("(a\nb))(c", "(a\nb)(c)"),
+            ("(a\n)", "(a\n)"),
+        ],
+    )
+    def test_repair_parentheses(self, expression, expected_repaired):
+        assert repair_parentheses(expression) == expected_repaired
+
+    def test_repair_is_minimal(self):
+        # Every repair deletes only surplus ')' and inserts only missing ones
+        for expression in ["", "(", ")", "())(", "(()", "a)\n(b\n", "((\n)\n"]:
+            repaired = repair_parentheses(expression)
+            assert check_parentheses_balance(repaired)
+            surplus = missing = depth = 0
+            for char in expression:
+                if char == "(":
+                    depth += 1
+                elif char == ")" and depth:
+                    depth -= 1
+                elif char == ")":
+                    surplus += 1
+            missing = depth
+            assert len(repaired) == len(expression) - surplus + missing
+
 
 class TestControlFlowParsing:
     def test_basic_structure(self):
@@ -138,6 +235,21 @@ class TestControlFlowParsing:
         assert tokens[2][1] == ControlFlowToken.ENDIF
 
 
+class TestControlFlowTokenizer:
+    def test_tokens_are_lazy(self):
+        tokens = ControlFlowTokenizer().tokens("{#if (a)}x{#endif}{#if (b}")
+        assert next(tokens) == (0, ControlFlowToken.IF, "(a)")
+        assert next(tokens) == (10, ControlFlowToken.ENDIF, "")
+        with pytest.raises(ParenthesisMismatchError, match="#if expression"):
+            next(tokens)
+
+    def test_reusable(self):
+        tokenizer = ControlFlowTokenizer()
+        for content in ("{#else}", "text {#elseif (x)}"):
+            (token,) = tokenizer.tokens(content)
+            assert token[2] == ("(x)" if token[1] == ControlFlowToken.ELSEIF else "")
+
+
 class TestIfElseEndifStructure:
     def test_basic_validation(self):
         # Well-formed nested example
@@ -283,6 +395,328 @@ class TestFileBalanceChecking:
         )
 
 
+class TestMessageLexer:
+    @pytest.mark.parametrize(
+        "file_content, expected_result",
+        [
+            # Brace errors take precedence over earlier parenthesis errors
+            ("{abc (xyz} then {oops", CheckFileBalanceResult.MISMATCHED_BRACES),
+            ("{abc (xyz} then {a {b}}", CheckFileBalanceResult.ILLEGAL_NESTING),
+            # Parenthesis errors take precedence over earlier flow errors
+            ("{#endif} {abc (xyz}", CheckFileBalanceResult.MISMATCHED_PARENTHESIS),
+            # Parentheses outside braces are prose
+            ("text (with an aside {x}", CheckFileBalanceResult.OK),
+            ("{#if (a)}{#elseif (b)}{#else}{#endif}", CheckFileBalanceResult.OK),
+            (
+                "{#if (a)}{#else}{#else}{#endif}",
+                CheckFileBalanceResult.INVALID_FLOW_CONTROL,
+            ),
+            ("{a)(b}", CheckFileBalanceResult.MISMATCHED_PARENTHESIS),
+        ],
+    )
+    def test_precedence(self, file_content, expected_result):
+        assert lex_message(file_content) == expected_result
+
+    @pytest.mark.parametrize(
+        "expression, expected_token",
+        [
+            ("{#if (x)}", ControlFlowToken.IF),
+            ("{#elseif (x)}", ControlFlowToken.ELSEIF),
+            ("{#else}", ControlFlowToken.ELSE),
+            ("{#endif}", ControlFlowToken.ENDIF),
+            ("{#else }", None),
+            ("{name}", None),
+        ],
+    )
+    def test_classify_control_flow(self, expression, expected_token):
+        content = f"prefix {expression}"
+        start = content.index("{")
+        assert classify_control_flow(content, start, len(content) - 1) == expected_token
+
+
+class TestCollectBalanceIssues:
+    def test_reports_every_issue(self):
+        file_content = (
+            "{#else} {a (b} } {c {d)} {#if (x)} {e ((f)} {#endif} {#endif} {#if (y)}"
+        )
+        R = CheckFileBalanceResult
+        issues = collect_balance_issues(file_content)
+        assert [(issue.offset, issue.kind) for issue in issues] == [
+            (0, R.INVALID_FLOW_CONTROL),
+            (11, R.MISMATCHED_PARENTHESIS),
+            (15, R.MISMATCHED_BRACES),
+            (20, R.ILLEGAL_NESTING),
+            (22, R.MISMATCHED_PARENTHESIS),
+            (38, R.MISMATCHED_PARENTHESIS),
+            (53, R.INVALID_FLOW_CONTROL),
+            (62, R.INVALID_FLOW_CONTROL),
+        ]
+
+    def test_unclosed_brace(self):
+        assert collect_balance_issues("{a} {b") == [
+            BalanceIssue(
+                4,
+                CheckFileBalanceResult.MISMATCHED_BRACES,
+                "Unmatched opening brace found in file.",
+            )
+        ]
+
+    @pytest.mark.parametrize(
+        "file_content",
+        [
+            "{#if (a)}{#else}{#else}{#endif}",
+            "{abc (xyz} then {oops",
+            "{#endif} {abc (xyz}",
+            "{x} {#if (a)} {b}",
+            "{#if )b} {c} {#endif}",
+        ],
+    )
+    def test_consistent_with_check_file_balance(self, file_content):
+        issues = collect_balance_issues(file_content)
+        R = CheckFileBalanceResult
+        severity = [
+            {R.ILLEGAL_NESTING, R.MISMATCHED_BRACES},
+            {R.MISMATCHED_PARENTHESIS},
+            {R.INVALID_FLOW_CONTROL},
+        ]
+        first = next(
+            issue for kinds in severity for issue in issues if issue.kind in kinds
+        )
+        assert check_file_balance(file_content) == first.kind
+        assert PromptDocument(file_content).issues() == issues
+
+    def test_valid_content(self):
+        assert collect_balance_issues("{#if (a)} {b} {#else} (c {#endif}") == []
+
+
+class TestPromptDocument:
+    def test_parses_expressions_and_blocks(self):
+        document = PromptDocument(
+            "{#if (a)} {b} {#if c} {d} {#endif} {#elseif e} {#else} {#endif}"
+        )
+        assert [expression.start for expression in document.expressions] == [
+            0, 10, 14, 22, 26, 35, 47, 55
+        ]
+        assert document.blocks == [
+            IfBlock(0, branches=[5, 6], closing=7, children=[IfBlock(2, closing=4)])
+        ]
+        assert document.check == CheckFileBalanceResult.OK
+
+    @pytest.mark.parametrize(
+        "file_content",
+        [
+            "{abc (xyz}",
+            "{#if (a)} {b} {#else}",
+            "{#endif}",
+            "{a {b}}",
+            "{a} {b",
+            "{a} b}",
+            "{#if (a)} {b (c} {#endif} {#endif}",
+        ],
+    )
+    def test_check_matches_check_file_balance(self, file_content):
+        assert PromptDocument(file_content).check == check_file_balance(file_content)
+
+    def test_invalid_braces(self):
+        document = PromptDocument("{a (b} {c")
+        assert document.brace_error == CheckFileBalanceResult.MISMATCHED_BRACES
+        assert document.expressions == []
+        assert document.fix_parentheses() == 0
+        assert document.text == "{a (b} {c"
+
+    def test_fix_patches_only_unbalanced_expressions(self):
+        content = "{#if (a} {b} {c (((d)} {e (f}"
+        document = PromptDocument(content)
+        attempts: list[FixAttempt] = []
+        assert document.fix_parentheses(attempts) == 3
+        assert attempts == [
+            FixAttempt(0, "#if (a"),
+            FixAttempt(13, "c (((d)"),
+            FixAttempt(23, "e (f"),
+        ]
+        assert document.text == "{#if (a)} {b} {c (((d)))} {e (f)}"
+        assert document.content == content
+        assert document.body(1) == "b"
+        assert document.check == CheckFileBalanceResult.INVALID_FLOW_CONTROL
+
+    def test_recheck_after_fix(self):
+        document = PromptDocument("{#if (a} {b} {#endif}")
+        document.fix_parentheses()
+        assert document.check == CheckFileBalanceResult.OK
+        assert document.check == check_file_balance(document.text)
+
+    def test_patch_rebuilds_blocks_when_token_changes(self):
+        document = PromptDocument("{#if (a)} {#else)} {#endif}")
+        assert document.expressions[1].token is None
+        document.patch(1, "#else")
+        assert document.expressions[1].token == ControlFlowToken.ELSE
+        assert document.blocks == [IfBlock(0, branches=[1], closing=2)]
+        assert document.check == CheckFileBalanceResult.OK
+        assert document.text == "{#if (a)} {#else} {#endif}"
+
+    def test_flow_error(self):
+        document = PromptDocument("{#if (a)} {#else} {#else} {#endif}")
+        assert document.flow_error == (
+            "Encountered second {#else} for the same {#if}."
+        )
+        assert document.check == CheckFileBalanceResult.INVALID_FLOW_CONTROL
+        assert PromptDocument("{#if (a)}").flow_error == "Unclosed {#if} block."
+
+
+def assert_parsed_as(document, text):
+    """Assert that an edited document matches a fresh parse of ``text``."""
+    fresh = PromptDocument(text)
+    assert document.text == text
+    assert document.expressions == fresh.expressions
+    assert document.blocks == fresh.blocks
+    assert document.brace_error == fresh.brace_error
+    assert document.flow_error == fresh.flow_error
+    assert document.check == fresh.check == check_file_balance(text)
+    assert document.issues() == collect_balance_issues(text)
+
+
+class TestIncrementalEdit:
+    def test_edit_inside_expression_relexes_it_alone(self):
+        document = PromptDocument("{a} x {b} y {c}")
+        later = document.expressions[2]
+        assert document.edit(7, 7, "(") == range(1, 2)
+        assert_parsed_as(document, "{a} x {(b} y {c}")
+        # Expressions after the edit are reused, shifted
+        assert document.expressions[2] is later
+        assert later.start == 13
+
+    def test_edit_between_expressions(self):
+        document = PromptDocument("{a} x {b}")
+        assert document.edit(4, 5, "{c} {d (}") == range(1, 3)
+        assert_parsed_as(document, "{a} {c} {d (} {b}")
+
+    @pytest.mark.parametrize(
+        "content, start, end, replacement",
+        [
+            # Tokens added, removed and changed within and across blocks
+            ("{#if a} x {#endif}", 8, 8, "{#else} y "),
+            ("{#if a} {#if b} {#endif} {#endif}", 8, 16, ""),
+            ("{#if a} {#else} {#endif}", 9, 13, "elseif b"),
+            ("{#if a} {#if b} x {#else} y {#endif} z {#endif}", 18, 26, ""),
+            ("{#if a} {#else} {#else} {#endif} {#endif}", 16, 24, ""),
+            ("{#if a} {#endif} {#endif}", 0, 0, "{#if z} "),
+            ("{#if a} x", 9, 9, " {#endif}"),
+        ],
+    )
+    def test_block_tree_is_updated(self, content, start, end, replacement):
+        document = PromptDocument(content)
+        document.edit(start, end, replacement)
+        assert_parsed_as(document, content[:start] + replacement + content[end:])
+
+    def test_flow_unchanged_keeps_blocks(self):
+        document = PromptDocument("{#if a} {b} {#endif}")
+        block = document.blocks[0]
+        document.edit(9, 10, "c (d)")
+        assert document.blocks[0] is block
+        assert_parsed_as(document, "{#if a} {c (d)} {#endif}")
+
+    @pytest.mark.parametrize(
+        "content, start, end, replacement",
+        [
+            # Breaking the braces falls back to a full parse...
+            ("{a} {b} {c}", 5, 5, "{"),
+            ("{a} x {b}", 4, 4, "}"),
+            # ... as does any edit to a document whose braces are invalid
+            ("{a} {b", 6, 6, "}"),
+            ("{a} {b", 0, 6, "{(}"),
+        ],
+    )
+    def test_brace_errors(self, content, start, end, replacement):
+        document = PromptDocument(content)
+        document.edit(start, end, replacement)
+        assert_parsed_as(document, content[:start] + replacement + content[end:])
+
+    def test_edit_folds_in_patches(self):
+        document = PromptDocument("{#if (a} {b (} x")
+        document.fix_parentheses()
+        document.edit(17, 18, "{#endif}")
+        assert not document.patched
+        assert_parsed_as(document, "{#if (a)} {b ()} {#endif}")
+
+    def test_span_must_be_within_text(self):
+        with pytest.raises(ValueError, match="outside the text"):
+            PromptDocument("{a}").edit(2, 4, "")
+
+
+class TestControlFlowRepair:
+    @pytest.mark.parametrize(
+        "file_content, expected",
+        [
+            # Unclosed blocks are closed at the end of the message
+            ("{#if (a)} x {#if (b)} y", "{#if (a)} x {#if (b)} y{#endif}{#endif}"),
+            # ... or before the next dedent, if the body is indented
+            ("{#if (a)}\n  x\ny", "{#if (a)}\n  x\n{#endif}\ny"),
+            ("  {#if (a)}\n    x\n  y", "  {#if (a)}\n    x\n  {#endif}\n  y"),
+            # ... unless the dedented line continues the block
+            (
+                "{#if (a)}\n  x\n{#else}\n  y\nz",
+                "{#if (a)}\n  x\n{#else}\n  y\n{#endif}\nz",
+            ),
+            # Blocks with their own {#endif} are left alone
+            ("{#if (a)}\n  x\ny\n{#endif}{#endif}", "{#if (a)}\n  x\ny\n{#endif}"),
+            # Stray tokens are removed
+            ("{#else} x {#endif}", " x "),
+            (
+                "{#if (a)}x{#else}y{#else}z{#elseif (b)}{#endif}",
+                "{#if (a)}x{#else}yz{#endif}",
+            ),
+        ],
+    )
+    def test_repair(self, file_content, expected):
+        repaired = PromptDocument(file_content).fix_control_flow()
+        assert repaired.text == expected
+        assert repaired.check == CheckFileBalanceResult.OK
+        assert check_file_balance(repaired.text) == CheckFileBalanceResult.OK
+
+    def test_repairs_are_recorded(self):
+        repairs: list[FlowRepair] = []
+        PromptDocument("{#endif}{#if (a)}").fix_control_flow(repairs)
+        assert repairs == [
+            FlowRepair(0, "{#endif}", inserted=False),
+            FlowRepair(17, "{#endif}", inserted=True),
+        ]
+
+    def test_valid_or_unrepairable_documents_are_unchanged(self):
+        for file_content in ["{#if (a)}{#endif}", "{#if (a)} {b"]:
+            document = PromptDocument(file_content)
+            assert document.fix_control_flow() is document
+
+    def test_check_message_fix_flow(self):
+        diagnostic = check_message("{#if (a} x", fix=True, fix_flow=True)
+        assert diagnostic.check == CheckFileBalanceResult.MISMATCHED_PARENTHESIS
+        assert diagnostic.fixed_content == "{#if (a)} x{#endif}"
+        assert diagnostic.fix_succeeded
+        # Offsets are into the text after the parenthesis repairs
+        assert diagnostic.flow_repairs == (FlowRepair(11, "{#endif}", inserted=True),)
+        document = {"messages": [{"text": "{#if (a)}"}]}
+        report = lint_document(document, fix=True, fix_flow=True)
+        assert render_report(report) == (
+            "Validation failed: incorrect control flow structure detected.\n"
+            "Inserting {#endif} at byte 9\n"
+            "Message index 0 passed all checks following fixes\n"
+        )
+
+    def test_lint_files_fix_flow(self, tmp_path):
+        path = tmp_path / "prompt.json"
+        path.write_text(json.dumps({"messages": [{"text": "{#if (x)}"}]}))
+        options = LintOptions(fix=True, fix_flow=True, cache_dir=tmp_path / "cache")
+        for _ in range(2):
+            (report,) = lint_files([path], options)
+            assert report.exit_code == 0
+            assert report.result == LintResult(success=True, had_changes=True)
+        fixed = json.loads((tmp_path / "prompt_fixed.json").read_text())
+        assert fixed == {"messages": [{"text": "{#if (x)}{#endif}"}]}
+        # Without --fix-flow, the cached flow repair is not reused
+        options = LintOptions(fix=True, cache_dir=options.cache_dir)
+        (report,) = lint_files([path], options)
+        assert not report.result.success
+
+
 class TestFileContentFixes:
     def test_naive_fixes(self):
         # One braced expression with missing parenthesis
@@ -314,3 +748,178 @@ class TestFileContentFixes:
         fixed = fix_message_content(file_content)
         result = check_file_balance(fixed)
         assert result == expected_result
+
+
+class TestLintDocument:
+    def test_no_side_effects(self, capsys):
+        document = [{"messages": [{"text": "{a}"}, {"text": "{(b}"}]}, {"messages": []}]
+        report = lint_document(document, fix=True)
+        assert report == Report(
+            (
+                PromptReport(
+                    0,
+                    (
+                        MessageDiagnostic(CheckFileBalanceResult.OK),
+                        MessageDiagnostic(
+                            CheckFileBalanceResult.MISMATCHED_PARENTHESIS,
+                            "{(b)}",
+                            True,
+                            (FixAttempt(0, "(b"),),
+                        ),
+                    ),
+                ),
+                PromptReport(1),
+            ),
+            fix=True,
+        )
+        assert report.result == LintResult(success=True, had_changes=True)
+        assert capsys.readouterr().out == ""
+        # Fixes are only written into the document on request
+        assert document[0]["messages"][1]["text"] == "{(b}"
+        report.apply_fixes(document)
+        assert document[0]["messages"][1]["text"] == "{(b)}"
+
+    @pytest.mark.parametrize(
+        "document, expected",
+        [
+            (
+                [{"messages": []}, {"text": "x"}, {"messages": []}],
+                "Error: JSON must be",
+            ),
+            ("prompt", "Unsupported JSON data type"),
+        ],
+    )
+    def test_bad_documents_do_not_exit(self, document, expected):
+        report = lint_document(document)
+        assert not report.valid
+        assert not report.result.success
+        assert expected in render_report(report)
+        assert len(report.prompts) <= 2
+
+    def test_render_report(self):
+        report = lint_document({"messages": [{"text": "{(a}"}, {"text": "{#if}"}]})
+        assert render_report(report) == (
+            "Validation failed: unbalanced parentheses detected.\n"
+            "Message index 0 has errors, but may be fixable (use --fix to try)\n"
+            "Validation failed: incorrect control flow structure detected.\n"
+            "Message index 1 has errors, but may be fixable (use --fix to try)\n"
+        )
+
+    def test_all_diagnostics(self):
+        report = lint_document({"messages": [{"text": "{(a} {b)}"}]}, collect_all=True)
+        assert render_report(report) == (
+            "Validation failed: unbalanced parentheses detected.\n"
+            "  at byte 1: Unclosed '(' in braced expression.\n"
+            "  at byte 7: Unmatched ')' in braced expression.\n"
+            "Message index 0 has errors, but may be fixable (use --fix to try)\n"
+        )
+
+    def test_check_message_unfixable(self):
+        diagnostic = check_message("{#if (a)}", fix=True)
+        assert diagnostic == MessageDiagnostic(
+            CheckFileBalanceResult.INVALID_FLOW_CONTROL
+        )
+        assert not diagnostic.result.success
+
+
+    def test_check_message_fix_parses_once(self, monkeypatch):
+        def check_file_balance(content):
+            pytest.fail("the check result should come from the fix's parse")
+
+        monkeypatch.setattr(prompt_lint, "check_file_balance", check_file_balance)
+        diagnostic = check_message("{a (b}", fix=True)
+        assert diagnostic.check == CheckFileBalanceResult.MISMATCHED_PARENTHESIS
+        assert diagnostic.fixed_content == "{a (b)}"
+
+
+class TestMultiFileLinting:
+    @pytest.fixture
+    def prompt_dir(self, tmp_path):
+        (tmp_path / "nested").mkdir()
+        files = {
+            "b.json": {"messages": [{"text": "{a (b}"}]},
+            "a.json": {"messages": [{"text": "fine {x}"}]},
+            "nested/c.json": [{"messages": [{"text": "{#if (x)}"}]}],
+        }
+        for name, data in files.items():
+            (tmp_path / name).write_text(json.dumps(data), encoding="utf-8")
+        (tmp_path / "notes.txt").write_text("not a prompt", encoding="utf-8")
+        return tmp_path
+
+    def test_expand_paths(self, prompt_dir):
+        paths = expand_lint_paths(
+            [str(prompt_dir / "b.json"), str(prompt_dir), str(prompt_dir / "*.json")]
+        )
+        assert [p.relative_to(prompt_dir).as_posix() for p in paths] == [
+            "b.json",
+            "a.json",
+            "nested/c.json",
+        ]
+
+    def test_directories_match_suffixes_in_any_case(self, prompt_dir):
+        (prompt_dir / "d.JSON").write_text("{}", encoding="utf-8")
+        (prompt_dir / "e.B64").write_text("H4sI", encoding="utf-8")
+        paths = expand_lint_paths([str(prompt_dir)])
+        assert {"d.JSON", "e.B64"} <= {p.name for p in paths}
+
+    def test_directories_skip_fixed_copies(self, prompt_dir):
+        for name in ("a_fixed.json", "b_fixed.b64"):
+            (prompt_dir / name).write_text("{}", encoding="utf-8")
+        paths = expand_lint_paths([str(prompt_dir)])
+        assert [p.relative_to(prompt_dir).as_posix() for p in paths] == [
+            "a.json",
+            "b.json",
+            "nested/c.json",
+        ]
+
+    def test_missing_paths_are_kept(self, tmp_path):
+        assert expand_lint_paths([str(tmp_path / "missing.json")]) == [
+            tmp_path / "missing.json"
+        ]
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_lint_files_ordered(self, prompt_dir, jobs):
+        paths = expand_lint_paths([str(prompt_dir)])
+        reports = lint_files(paths, LintOptions(), jobs=jobs)
+        assert [report.path for report in reports] == paths
+        assert [report.result for report in reports] == [
+            LintResult(success=True, had_changes=False),
+            LintResult(success=False, had_changes=False),
+            LintResult(success=False, had_changes=False),
+        ]
+        assert "may be fixable" in reports[1].output
+        assert reports[2].output.startswith("Checking prompt")
+
+
+class TestFixWriter:
+    SOURCE = (
+        '{\r\n  "name": "caf\\u00e9",\r\n  "messages": [\r\n'
+        '    {"role": "user", "text": "{a (b}"},\r\n'
+        '    {"text": "{#if (x)}"}\r\n  ]\r\n}\r\n'
+    )
+
+    def test_fixed_copy_preserves_formatting(self, tmp_path):
+        path = tmp_path / "prompt.json"
+        path.write_bytes(self.SOURCE.encode())
+        (report,) = lint_files([path], LintOptions(fix=True))
+        assert report.exit_code == 1
+        assert (tmp_path / "prompt_fixed.json").read_bytes() == (
+            self.SOURCE.replace("{a (b}", "{a (b)}").encode()
+        )
+        assert path.read_bytes() == self.SOURCE.encode()
+
+    def test_in_place(self, tmp_path):
+        path = tmp_path / "prompt.json"
+        path.write_bytes(self.SOURCE.encode())
+        path.chmod(0o640)
+        options = LintOptions(fix=True, fix_flow=True, in_place=True)
+        (report,) = lint_files([path], options)
+        assert report.exit_code == 0
+        assert f"Fixes applied and written to {path}" in report.output
+        assert path.read_bytes() == (
+            self.SOURCE.replace("{a (b}", "{a (b)}")
+            .replace("{#if (x)}", "{#if (x)}{#endif}")
+            .encode()
+        )
+        assert path.stat().st_mode & 0o777 == 0o640
+        assert [p.name for p in tmp_path.iterdir()] == ["prompt.json"]
@@ -0,0 +1,107 @@
+"""
+Asymptotic scaling tests for the lint phases.
+
+Each phase is timed on inputs from 1 KiB up to the size given by the
+``PROMPT_LINT_SCALING_MAX`` environment variable (256K by default; CI can
+raise it to 64M) and must grow near-linearly with the size of its input.
+"""
+
+import os
+
+import pytest
+
+from nc_prompt_tools.bench import cli
+from nc_prompt_tools.bench.scaling import (
+    DEFAULT_MAX_SLOPE,
+    MAX_SIZE_VARIABLE,
+    PHASES,
+    SHAPES,
+    fit_slope,
+    geometric_sizes,
+    measure_scaling,
+    parse_size,
+    time_call,
+)
+from nc_prompt_tools.prompt_lint import CheckFileBalanceResult, check_file_balance
+
+MAX_SIZE = parse_size(os.environ.get(MAX_SIZE_VARIABLE, "256K"))
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+@pytest.mark.parametrize("phase", PHASES)
+def test_phase_scales_linearly(phase, shape):
+    result = measure_scaling(phase, shape, geometric_sizes(1024, MAX_SIZE))
+    assert result.slope <= DEFAULT_MAX_SLOPE, (
+        f"{phase} grows as size^{result.slope:.2f} on {shape} input: "
+        f"{dict(zip(result.sizes, result.times))}"
+    )
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_inputs_are_lintable(shape):
+    text = SHAPES[shape](64 * 1024)
+    assert 64 * 1024 <= len(text) < 70 * 1024
+    assert check_file_balance(text) in (
+        CheckFileBalanceResult.OK,
+        CheckFileBalanceResult.MISMATCHED_PARENTHESIS,
+    )
+
+
+def test_detects_quadratic_growth():
+    def concatenate(text):
+        result = ""
+        for character in text:
+            # Prepending copies the whole string every time
+            result = character + result
+        return result
+
+    sizes = geometric_sizes(4096, 64 * 1024)
+    times = [time_call(concatenate, "x" * size) for size in sizes]
+    assert fit_slope(sizes, times) > 1.5
+
+
+def test_fit_slope():
+    sizes = [1, 2, 4, 8]
+    assert fit_slope(sizes, [3 * size for size in sizes]) == pytest.approx(1)
+    assert fit_slope(sizes, [size**2 for size in sizes]) == pytest.approx(2)
+
+
+def test_geometric_sizes():
+    assert geometric_sizes(1024, 16 * 1024, 4) == [1024, 4096, 16 * 1024]
+
+
+@pytest.mark.parametrize("smallest, factor", [(1024, 1), (0, 2)])
+def test_geometric_sizes_rejects_sizes_that_never_grow(smallest, factor):
+    with pytest.raises(ValueError):
+        geometric_sizes(smallest, 4096, factor)
+
+
+@pytest.mark.parametrize(
+    "text, size",
+    [("512", 512), ("4K", 4096), ("64MB", 64 * 1024**2), ("1g", 1024**3)],
+)
+def test_parse_size(text, size):
+    assert parse_size(text) == size
+
+
+def test_parse_size_rejects_other_text():
+    with pytest.raises(ValueError, match="Not a size"):
+        parse_size("64 bytes")
+
+
+@pytest.mark.parametrize("max_slope, exit_code", [(DEFAULT_MAX_SLOPE, 0), (0.1, 1)])
+def test_scaling_command(max_slope, exit_code, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(
+            ["scaling", "--max-size", "64K", "--phase", "fix_message_content"]
+            + ["--shape", "tiled", "--max-slope", str(max_slope)]
+        )
+    assert excinfo.value.code == exit_code
+    assert "fix_message_content" in capsys.readouterr().out
+
+
+def test_scaling_command_rejects_factor_below_2(capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        cli.main(["scaling", "--factor", "1"])
+    assert excinfo.value.code == 2
+    assert "--factor: must be at least 2" in capsys.readouterr().err
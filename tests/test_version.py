@@ -0,0 +1,12 @@
+import tomllib
+from pathlib import Path
+
+import nc_prompt_tools
+from nc_prompt_tools._version import tool_version
+
+
+def test_version_matches_pyproject():
+    pyproject = Path(__file__).parents[1] / "pyproject.toml"
+    with pyproject.open("rb") as f:
+        version = tomllib.load(f)["project"]["version"]
+    assert tool_version() == nc_prompt_tools.__version__ == version
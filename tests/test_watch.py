@@ -0,0 +1,165 @@
+import json
+
+import pytest
+
+from nc_prompt_tools import prompt_lint, watch
+
+
+def write_prompt(path, *texts):
+    path.write_text(json.dumps({"messages": [{"text": text} for text in texts]}))
+
+
+class TestWatchSession:
+    def test_relints_only_changed_messages(self, tmp_path):
+        prompt = tmp_path / "prompt.json"
+        write_prompt(prompt, "{a(b}", "{c}", "{d}")
+        session = watch.WatchSession(prompt_lint.LintOptions())
+
+        (report,), removed = session.update([prompt])
+        assert report.exit_code == 0
+        assert not report.result.success
+        assert "Message index 0 has errors" in report.output
+        assert (session.checked, session.reused) == (3, 0)
+        assert removed == []
+
+        write_prompt(prompt, "{a(b)}", "{c}", "{d}")
+        (report,), _ = session.update([prompt])
+        assert report.result.success
+        assert (session.checked, session.reused) == (1, 2)
+
+    def test_skips_unchanged_files(self, tmp_path):
+        prompt = tmp_path / "prompt.json"
+        write_prompt(prompt, "{a}")
+        session = watch.WatchSession(prompt_lint.LintOptions())
+        session.update([prompt])
+        # Rewriting the same contents is not a change
+        write_prompt(prompt, "{a}")
+        assert session.update([prompt]) == ([], [])
+
+    def test_forgets_removed_files(self, tmp_path):
+        directory = tmp_path / "prompts"
+        directory.mkdir()
+        first, second = directory / "first.json", directory / "second.json"
+        write_prompt(first, "{a}")
+        write_prompt(second, "{b}")
+        session = watch.WatchSession(prompt_lint.LintOptions())
+        session.update([first, second])
+
+        first.unlink()
+        second.unlink()
+        directory.rmdir()
+        # Removing a directory removes the files watched inside it
+        assert session.update([directory]) == ([], [first, second])
+        assert session.update([first]) == ([], [])
+
+
+class FakeWatcher:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.timeouts = []
+
+    def wait(self, timeout):
+        self.timeouts.append(timeout)
+        if not self.results:
+            raise KeyboardInterrupt
+        return self.results.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_change_batches_are_debounced(tmp_path):
+    a, b, c = (tmp_path / name for name in "abc")
+    watcher = FakeWatcher(set(), {a}, {b}, set(), {c}, set())
+    batches = watch.iter_change_batches(watcher, debounce=0.5)
+    assert next(batches) == {a, b}
+    assert next(batches) == {c}
+    assert watcher.timeouts == [None, None, 0.5, 0.5, None, 0.5]
+
+
+def test_polling_watcher(tmp_path):
+    prompt = tmp_path / "prompt.json"
+    write_prompt(prompt, "{a}")
+    watcher = watch.PollingWatcher([tmp_path], interval=0)
+    assert watcher.wait(0) == set()
+    write_prompt(prompt, "{a}", "{b}")
+    (tmp_path / "notes.txt").write_text("ignored")
+    write_prompt(tmp_path / "prompt_fixed.json", "{a}")
+    assert watcher.wait(0) == {prompt}
+    prompt.unlink()
+    assert watcher.wait(0) == {prompt}
+
+
+@pytest.fixture
+def inotify_watcher(tmp_path):
+    try:
+        watcher = watch.InotifyWatcher([tmp_path])
+    except OSError:
+        pytest.skip("inotify is not available")
+    yield watcher
+    watcher.close()
+
+
+def wait_for(watcher, expected):
+    changed = set()
+    while not expected <= changed and (more := watcher.wait(5)):
+        changed |= more
+    return changed
+
+
+class TestInotifyWatcher:
+    def test_reports_written_prompts(self, tmp_path, inotify_watcher):
+        (tmp_path / "notes.txt").write_text("ignored")
+        write_prompt(tmp_path / "prompt_fixed.json", "{a}")
+        prompt = tmp_path / "prompt.json"
+        write_prompt(prompt, "{a}")
+        assert wait_for(inotify_watcher, {prompt}) == {prompt}
+
+    def test_watches_new_directories(self, tmp_path, inotify_watcher):
+        directory = tmp_path / "new"
+        directory.mkdir()
+        # Files created before the directory's watch was added are reported
+        # from a scan of the directory
+        first = directory / "first.json"
+        write_prompt(first, "{a}")
+        assert first in wait_for(inotify_watcher, {first})
+
+        second = directory / "second.b64"
+        second.write_text("H4sI")
+        assert second in wait_for(inotify_watcher, {second})
+
+    def test_wait_times_out(self, inotify_watcher):
+        assert inotify_watcher.wait(0) == set()
+
+
+def test_watch_requires_directory(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        prompt_lint.main(["--watch", str(tmp_path / "missing")])
+    assert "--watch needs a directory" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--watch", ".", "prompt.json"],
+        ["--watch", ".", "--fix"],
+        ["--poll", "prompt.json"],
+        [],
+    ],
+)
+def test_watch_argument_errors(argv):
+    with pytest.raises(SystemExit) as excinfo:
+        prompt_lint.main(argv)
+    assert excinfo.value.code == 2
+
+
+def test_watch_lints_then_stops_on_interrupt(tmp_path, monkeypatch, capsys):
+    prompt = tmp_path / "prompt.json"
+    write_prompt(prompt, "{a(b}")
+    monkeypatch.setattr(watch, "open_watcher", lambda *_: FakeWatcher())
+    with pytest.raises(SystemExit) as excinfo:
+        watch.watch([tmp_path], prompt_lint.LintOptions())
+    assert excinfo.value.code == 0
+    output = capsys.readouterr().out
+    assert f"Checking file {prompt}" in output
+    assert "Checked 1 messages, reused 0 unchanged" in output